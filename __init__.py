@@ -1,9 +1,27 @@
-from .biz import BizService
-from .card import CardService
-# import biz
-# import card
+import importlib
+
+# BizService и CardService импортируются при первом обращении, чтобы "import pyiikoapi"
+# не загружал requests и модули api (быстрый холодный старт serverless обработчиков)
+_LAZY = {
+    "BizService": ".biz",
+    "CardService": ".card",
+}
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY))
+
+
 NAME = "pyiikoapi"
 __author__ = 'kebrick'
 __version__ = '0.0.11'
 __email__ = 'ruban.kebr@gmail.com'
-
@@ -8,9 +8,10 @@ from .exception import PostException
 from .exception import SetSession
 from .exception import CheckTimeToken
 from .exception import ParamSetException
+from ..core import RequestCore
 
 
-class Auth:
+class Auth(RequestCore):
     """
     Если не был присвоен кастомный session то по стандарту header будет равняться:
     {
@@ -25,10 +26,16 @@ class Auth:
     BASE_URL = "https://iiko.biz"
     PORT = ":9900"
 
-    def __init__(self, login: str, password: str, org: str, session: requests.Session = None):
-        self.__session = requests.Session()
-        if session is not None:
-            self.__session = session
+    def __init__(self, login: str, password: str, org: str, session: requests.Session = None,
+                 lazy_token: bool = False, token_cache=None):
+        """
+        :param lazy_token: не запрашивать маркер доступа при инициализации, он будет получен при первом вызове метода
+        :param token_cache: кэш маркеров доступа (pyiikoapi.tokencache.FileTokenCache), из которого маркер
+            восстанавливается без запроса к серверу
+        """
+        if session is None:
+            session = requests.Session()
+        self.__session = session
 
         self.__login = login
         self.__password = password
@@ -36,20 +43,38 @@ class Auth:
         self.__token = None
         self.__time_token = None
         self.__base_url = f"{self.BASE_URL}{self.PORT}"
-        self.access_token()
+        self.__lazy_token = lazy_token
+        self.__token_cache = token_cache
+        if not lazy_token and not self.restore_token():
+            self.access_token()
 
     def check_token_time(self) -> bool:
         """
         Проверка на время жизни маркера доступа
         :return: Если прошло 15 мин будет запрошен токен и метод вернёт True, иначе вернётся False
         """
+        if self.__time_token is None and self.__lazy_token:
+            if not self.restore_token():
+                self.access_token()
+            return True
         fifteen_minutes_ago = dt.now() - td(minutes=15)
         time_token = self.__time_token
         # if self.__token and self.__time_token:
         try:
 
             if time_token <= fifteen_minutes_ago:
-                print(f"Update token: {self.access_token()}")
+                degraded = self.degraded
+                if degraded is not None and self.token is not None and degraded.down(self.base_url):
+                    # iiko недоступен (идет период hold) - не ждем таймаута обновления маркера
+                    return False
+                try:
+                    print(f"Update token: {self.access_token()}")
+                except TokenException as err:
+                    # iiko недоступен: в деградированном режиме методы чтения работают со старым маркером
+                    if degraded is None or self.token is None:
+                        raise
+                    degraded.report(self.base_url, err.__context__)
+                    return False
                 return True
             else:
                 return False
@@ -103,19 +128,60 @@ class Auth:
     def base_url(self, value: str):
         self.__base_url = value
 
+    def _token_cache_key(self) -> str:
+        return f"{self.__base_url}|{self.__login}"
+
+    def restore_token(self) -> bool:
+        """
+        Восстановить маркер доступа из token_cache
+        :return: True если в кэше найден маркер, время жизни которого не прошло
+        """
+        if self.__token_cache is None:
+            return False
+        cached = self.__token_cache.get(self._token_cache_key())
+        if not cached:
+            return False
+        token, issued_at = cached
+        time_token = dt.fromtimestamp(issued_at)
+        if time_token <= dt.now() - td(minutes=15):
+            return False
+        self.__token = token
+        self.__time_token = time_token
+        return True
+
     def access_token(self):
         """Получить маркер доступа"""
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.__base_url}/api/0/auth/access_token?user_id={self.__login}&user_secret={self.__password}')
             self.__token = result.text[1:-1]
             self.__time_token = dt.now()
+            if self.__token_cache is not None:
+                self.__token_cache.set(self._token_cache_key(), self.__token, self.__time_token.timestamp())
 
         except requests.exceptions.RequestException as err:
             raise TokenException(self.__class__.__qualname__,
                                  self.access_token.__name__,
                                  f"[ERROR] Не удалось получить маркер доступа: \n{err}")
 
+    def echo(self, msg: str = "YUP TOKEN:)") -> bool:
+        """
+        Проверка маркера доступа апи логина
+        :param msg: Секретное слово для проверки токена
+        :return: bool True в случае соответствия и наоборот
+        """
+        # /api/0/auth/echo?msg={msg}&access_token={accessToken}
+        self.check_token_time()
+        try:
+            result = self._request("GET",
+                f'{self.base_url}/api/0/auth/echo', params={"msg": msg, "access_token": self.token})
+            return result.ok and result.text.strip('"') == msg
+
+        except requests.exceptions.RequestException as err:
+            raise TokenException(self.__class__.__qualname__,
+                                 self.echo.__name__,
+                                 f"[ERROR] Не удалось проверить маркер доступа апи логина: \n{err}")
+
 
 class Orders(Auth):
     """
@@ -137,10 +203,10 @@ class Orders(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"order_request\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/orders/add?access_token={self.token}&request_timeout={request_timeout}',
                 json=order_request)
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise PostException(self.__class__.__qualname__,
@@ -165,9 +231,9 @@ class Orders(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"order_id\"")
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/orders/info?access_token={self.token}&organization={self.org}&order={order_id}&request_timeout={request_timeout}',)
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise GetException(self.__class__.__qualname__,
@@ -190,10 +256,10 @@ class Orders(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"order_request\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/orders/checkCreate?access_token={self.token}&request_timeout={request_timeout}',
                 json=order_request)
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise PostException(self.__class__.__qualname__,
@@ -216,10 +282,10 @@ class Orders(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"address\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/orders/checkAddress?access_token={self.token}&request_timeout={request_timeout}&organizationId={self.org}',
                 json=address)
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise PostException(self.__class__.__qualname__,
@@ -235,7 +301,7 @@ class Orders(Auth):
         :param delivery_status: Статус доставки (регистронезависимый). Должно принимать одно из следующих значений:(● NEW ● WAITING ● ON_WAY ● CLOSED ● CANCELLED ● DELIVERED ● UNCONFIRMED)
         :param delivery_terminal_id: Идентификатор терминала доставки
         :param request_timeout: Таймаут для выполнения запроса. default="00%3A02%3A00"
-        :return: addressCheckResult: Результат проверки возможности осуществления доставки по указанному адресу
+        :return: DeliveryOrdersResponse: {"deliveryOrders": orderInfo[]} Доставки в заданном интервале
         """
         # /api/0/orders/deliveryOrders?access_token={accessToken}&organization={organizationId}&dateFrom={dateFrom}&dateTo={dateTo}&deliveryStatus={deliveryStatus}&deliveryTerminalId={deliveryTerminalId}&request_timeout={requestTimeout}
         params = {"dateFrom": date_from, "dateTo": date_to,}
@@ -246,10 +312,10 @@ class Orders(Auth):
 
         self.check_token_time()
         try:
-            result = self.session_s.get(
-                f'{self.base_url}/api/0/orders/checkAddress?access_token={self.token}&request_timeout={request_timeout}&organizationId={self.org}',
+            result = self._request("GET",
+                f'{self.base_url}/api/0/orders/deliveryOrders?access_token={self.token}&request_timeout={request_timeout}&organization={self.org}',
                 params=params)
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise GetException(self.__class__.__qualname__,
@@ -273,11 +339,11 @@ class Orders(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"params\"")
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/orders/get_courier_orders?access_token={self.token}'
                 f'&organization={self.org}',
                 params=params)
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise GetException(self.__class__.__qualname__,
@@ -300,7 +366,7 @@ class Orders(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"set_order_delivered_request\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/orders/set_order_delivered?access_token={self.token}&organization='
                 f'{self.org}',
                 params=params,
@@ -340,9 +406,9 @@ class Nomenclature(Auth):
         # /api/0/nomenclature/{organizationId}?access_token={accessToken}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/nomenclature/{self.org}?access_token={self.token}')
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise GetException(
@@ -369,9 +435,9 @@ class Cities(Auth):
         # /api/0/cities/cities?access_token={accessToken}&organization={organizationId}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/cities/cities?access_token={self.token}&organization={self.org}')
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise GetException(
@@ -391,9 +457,9 @@ class Cities(Auth):
         # /api/0/cities/citiesList?access_token={accessToken}&organization={organizationId}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/cities/citiesList?access_token={self.token}&organization={self.org}')
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise GetException(
@@ -418,10 +484,10 @@ class Cities(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"params\"")
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/streets/streets?access_token={self.token}&organization={self.org}',
                 params=params)
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise GetException(
@@ -441,9 +507,9 @@ class Cities(Auth):
         # /api/0/regions/regions?access_token={accessToken}&organization={organizationId}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/regions/regions?access_token={self.token}&organization={self.org}')
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise GetException(
@@ -476,11 +542,11 @@ class Notices(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"notices_request\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/regions/regions?access_token={self.token}&organization={self.org}',
                 params=params,
                 json=notices_request)
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise PostException(
@@ -505,10 +571,10 @@ class RMSSettings(Auth):
         # /api/0/rmsSettings/supportedProtocols?access_token={accessToken}&organization={organizationId}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/rmsSettings/supportedProtocols?access_token={self.token}'
                 f'&organization={self.org}')
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise GetException(
@@ -524,10 +590,10 @@ class RMSSettings(Auth):
         # /api/0/rmsSettings/getRoles?access_token={accessToken}&organization={organizationId}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/rmsSettings/supportedProtocols?access_token={self.token}'
                 f'&organization={self.org}')
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise GetException(
@@ -545,9 +611,9 @@ class RMSSettings(Auth):
         # /api/0/rmsSettings/getEmployees?access_token={accessToken}&organization={organizationId}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/rmsSettings/getEmployees?access_token={self.token}&organization={self.org}')
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise GetException(
@@ -565,10 +631,10 @@ class RMSSettings(Auth):
         # /api/0/rmsSettings/getRestaurantSections?access_token={accessToken}&organization={organizationId}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/rmsSettings/getRestaurantSections?access_token={self.token}'
                 f'&organization={self.org}')
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise GetException(
@@ -586,9 +652,9 @@ class RMSSettings(Auth):
         # /api/0/rmsSettings/getOrderTypes?access_token={accessToken}&organization={organizationId}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/rmsSettings/getOrderTypes?access_token={self.token}&organization={self.org}')
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise GetException(
@@ -606,9 +672,9 @@ class RMSSettings(Auth):
         # /api/0/rmsSettings/getPaymentTypes?access_token={accessToken}&organization={organizationId}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/rmsSettings/getPaymentTypes?access_token={self.token}&organization={self.org}')
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise GetException(
@@ -626,10 +692,10 @@ class RMSSettings(Auth):
         # /api/0/rmsSettings/getMarketingSources?access_token={accessToken}&organization={organizationId}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/rmsSettings/getMarketingSources?access_token={self.token}'
                 f'&organization={self.org}')
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise GetException(
@@ -649,9 +715,9 @@ class RMSSettings(Auth):
 
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/rmsSettings/getCouriers?access_token={self.token}&organization={self.org}')
-            return result.json()  # ['users']
+            return self._json(result)  # ['users']
 
         except requests.exceptions.RequestException as err:
             raise GetException(
@@ -680,10 +746,10 @@ class StopLists(Auth):
         # /api/0/stopLists/getDeliveryStopList?access_token={accessToken}&organization={organizationId}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/stopLists/getDeliveryStopList?access_token={self.token}'
                 f'&organization={self.org}')
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise GetException(
@@ -714,16 +780,16 @@ class Mobile(Auth):
         if params is None:
             params = {"organization": self.org}
         else:
-            params += {"organization": self.org}
+            params = {**params, "organization": self.org}
 
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/mobile/signin?access_token={self.token}',
                 params=params,
                 json=mobile_login_request_dto
             )
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise PostException(
@@ -750,17 +816,16 @@ class Mobile(Auth):
         if params is None:
             params = {"organization": self.org}
         else:
-            params += {"organization": self.org}
+            params = {**params, "organization": self.org}
 
         self.check_token_time()
-        params += {"organization": self.org}
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/mobile/sync?access_token={self.token}',
                 params=params,
                 json=send_update_dto
             )
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise PostException(
@@ -785,10 +850,10 @@ class DeliverySettings(Auth):
         # /api/0/deliverySettings/deliveryDiscounts?access_token={accessToken}&organization={organizationId}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/deliverySettings/deliveryDiscounts?access_token={self.token}'
                 f'&organization={self.org}', )
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise GetException(
@@ -808,10 +873,10 @@ class DeliverySettings(Auth):
         # /api/0/deliverySettings/getDeliveryTerminals?access_token={accessToken}&organization={organizationId}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/deliverySettings/getDeliveryTerminals?access_token={self.token}'
                 f'&organization={self.org}', )
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise GetException(
@@ -830,10 +895,10 @@ class DeliverySettings(Auth):
         # /api/0/deliverySettings/getDeliveryRestrictions?access_token={accessToken}&organization={organizationId}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/deliverySettings/getDeliveryRestrictions?access_token={self.token}'
                 f'&organization={self.org}', )
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise GetException(
@@ -857,11 +922,11 @@ class DeliverySettings(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"params\"")
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/deliverySettings/getSurveyItems?access_token={self.token}'
                 f'&organization={self.org}',
                 params=params, )
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise GetException(
@@ -881,10 +946,10 @@ class DeliverySettings(Auth):
         # /api/0/deliverySettings/getDeliveryCourierMobileSettings?access_token={accessToken}&organization={organizationId}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/deliverySettings/getDeliveryCourierMobileSettings?access_token={self.token}'
                 f'&organization={self.org}', )
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise GetException(
@@ -915,12 +980,12 @@ class Olaps(Auth):
             raise ParamSetException(self.__class__.__qualname__,
                                     self.olap_columns.__name__,
                                     f"[ERROR] Не присвоен обязательный параметр: \"params\"")
-        params += {"organization": self.org}
+        params = {**(params or {}), "organization": self.org}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/olaps/olapColumns?access_token={self.token}', params=params,)
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise GetException(
@@ -944,14 +1009,14 @@ class Olaps(Auth):
             raise ParamSetException(self.__class__.__qualname__,
                                     self.olap.__name__,
                                     f"[ERROR] Не присвоен обязательный параметр: \"olap_report_request\"")
-        params += {"organization": self.org}
+        params = {**(params or {}), "organization": self.org}
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/olaps/olap?access_token={self.token}',
                 params=params,
                 json=olap_report_request, )
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise PostException(
@@ -967,17 +1032,14 @@ class Olaps(Auth):
         :return: OlapReportPresetsResponse Информация по видам преднастроенных олап-отчетов для заданной организации.
         """
         # /api/0/olaps/olapPresets?access_token={accessToken}&request_timeout={requestTimeout}&organizationId={organizationId}
-        if params is None:
-            params = {"organization": self.org}
-        else:
-            params += {"organization": self.org}
+        params = {**(params or {}), "organization": self.org}
 
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/olaps/olapPresets?access_token={self.token}',
                 params=params, )
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise PostException(
@@ -1003,10 +1065,10 @@ class Olaps(Auth):
 
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/olaps/olapByPreset?access_token={self.token}&organizationId={self.org}',
                 params=params, json=preset_olap_report_request)
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise PostException(
@@ -1037,10 +1099,10 @@ class Events(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"events_request\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/events/events?access_token={self.token}',
                 params=params, json=events_request)
-            return result.json()
+            return self._json(result)
 
         except requests.exceptions.RequestException as err:
             raise PostException(
@@ -1064,10 +1126,10 @@ class Events(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"events_request\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/events/eventsMetadata?access_token={self.token}',
                 params=params, json=events_request, )
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise PostException(
                 self.__class__.__qualname__,
@@ -1091,10 +1153,10 @@ class Events(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"events_request\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/events/sessions?access_token={self.token}',
                 params=params, json=events_request, )
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise PostException(
                 self.__class__.__qualname__,
@@ -0,0 +1,264 @@
+import json
+import math
+import threading
+import time
+
+from ..core import response_status
+from ..metrics import count_event
+from .exception import BizException
+from .exception import PostException
+
+EARTH_RADIUS_M = 6371000.0
+
+
+def distance_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние между двумя точками в метрах (формула гаверсинусов)"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class _CourierBuffer:
+    __slots__ = ("base_dto", "updates", "locations", "last_kept", "first_at", "failures", "retry_at")
+
+    def __init__(self, base_dto: dict):
+        self.base_dto = base_dto
+        self.updates = {}
+        self.locations = []
+        self.last_kept = None
+        self.first_at = None
+        self.failures = 0
+        self.retry_at = None
+
+    def backoff(self, now: float) -> bool:
+        """Идет пауза после неудачной синхронизации"""
+        return self.retry_at is not None and now < self.retry_at
+
+
+class CourierSyncBuffer:
+    """
+    Буфер синхронизации мобильного приложения курьера (Mobile.sysc).
+
+    Вместо вызова sysc на каждую gps отметку буфер копит изменения по каждому курьеру:
+        - изменения доставок схлопываются по заказу (уходит последнее изменение каждого заказа);
+        - gps отметки прореживаются: точка сохраняется, только если курьер сдвинулся больше чем
+          на min_distance_m метров или с последней сохраненной точки прошло больше max_gap_s секунд;
+        - sysc вызывается одним запросом на курьера, когда накопилось max_points точек или
+          с первого изменения прошло max_delay_s секунд (изменение статуса доставки
+          отправляется не позднее status_delay_s секунд).
+    Если отправка не удалась (исключение или ответ iiko с кодом 4xx/5xx), изменения возвращаются в буфер
+    и уйдут со следующей синхронизацией; повтор для курьера откладывается на retry_s секунд, пауза
+    удваивается после каждой неудачи (не больше max_retry_s). Пока синхронизация не проходит, в буфере
+    курьера остаются только последние max_locations gps отметок.
+
+    Пример:
+        buffer = CourierSyncBuffer(api, on_result=lambda courier, sync_result: ...)
+        buffer.register(courier_id, {"...": "поля SendUpdateDto, общие для всех синхронизаций курьера"})
+        buffer.add_location(courier_id, 55.75, 37.61)
+        buffer.add_update(courier_id, {"orderId": order_id, "status": "ON_WAY"})
+        buffer.start()
+    """
+
+    def __init__(self, api, on_result=None, min_distance_m: float = 25.0, max_gap_s: float = 60.0,
+                 max_points: int = 50, max_delay_s: float = 30.0, status_delay_s: float = 2.0,
+                 updates_key: str = "updates", locations_key: str = "locations", order_key: str = "orderId",
+                 params: dict = None, retry_s: float = 1.0, max_retry_s: float = 60.0, max_locations: int = 1000):
+        """
+        :param api: BizService (или Mobile)
+        :param on_result: on_result(courier_id, sync_result) - ответ sysc (SyncResultDto)
+        :param min_distance_m: точки ближе этого расстояния к предыдущей сохраненной отбрасываются
+        :param max_gap_s: точка сохраняется в любом случае, если с предыдущей прошло больше max_gap_s
+        :param max_points: синхронизировать, когда накопилось столько точек
+        :param max_delay_s: синхронизировать не позже, чем через max_delay_s после первого изменения
+        :param status_delay_s: синхронизировать не позже, чем через status_delay_s после изменения доставки
+        :param updates_key: ключ списка изменений доставок в SendUpdateDto
+        :param locations_key: ключ списка gps координат в SendUpdateDto
+        :param order_key: ключ идентификатора заказа в изменении доставки
+        :param params: params для Mobile.sysc ({"request_timeout": "00%3A02%3A00"})
+        :param retry_s: пауза перед повторной синхронизацией курьера после ошибки, секунды (удваивается)
+        :param max_retry_s: максимальная пауза перед повтором, секунды
+        :param max_locations: сколько gps отметок курьера хранить, пока синхронизация не проходит
+            (старые отбрасываются)
+        """
+        self.api = api
+        self.on_result = on_result
+        self.min_distance_m = min_distance_m
+        self.max_gap_s = max_gap_s
+        self.max_points = max_points
+        self.max_delay_s = max_delay_s
+        self.status_delay_s = status_delay_s
+        self.updates_key = updates_key
+        self.locations_key = locations_key
+        self.order_key = order_key
+        self.params = params
+        self.retry_s = retry_s
+        self.max_retry_s = max_retry_s
+        self.max_locations = max_locations
+
+        self.__lock = threading.Lock()
+        self.__couriers = {}
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def register(self, courier_id: str, base_dto: dict = None):
+        """Задать общие поля SendUpdateDto курьера"""
+        with self.__lock:
+            buffer = self.__couriers.get(courier_id)
+            if buffer is None:
+                self.__couriers[courier_id] = _CourierBuffer(base_dto or {})
+            else:
+                buffer.base_dto = base_dto or {}
+
+    def _buffer(self, courier_id: str) -> _CourierBuffer:
+        buffer = self.__couriers.get(courier_id)
+        if buffer is None:
+            buffer = self.__couriers[courier_id] = _CourierBuffer({})
+        return buffer
+
+    def add_location(self, courier_id: str, latitude: float, longitude: float, timestamp: float = None,
+                     **extra) -> bool:
+        """
+        Добавить gps отметку курьера
+
+        :param timestamp: unix time отметки, по умолчанию текущее время
+        :param extra: дополнительные поля точки (например date в формате сервера)
+        :return: True если точка сохранена, False если отброшена как избыточная
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.__lock:
+            buffer = self._buffer(courier_id)
+            last = buffer.last_kept
+            if last is not None and timestamp - last[2] < self.max_gap_s and \
+                    distance_m(last[0], last[1], latitude, longitude) < self.min_distance_m:
+                return False
+            buffer.last_kept = (latitude, longitude, timestamp)
+            point = {"latitude": latitude, "longitude": longitude}
+            point.update(extra)
+            buffer.locations.append(point)
+            if len(buffer.locations) > self.max_locations:
+                del buffer.locations[:-self.max_locations]
+            if buffer.first_at is None:
+                buffer.first_at = time.monotonic()
+            flush = len(buffer.locations) >= self.max_points and not buffer.backoff(time.monotonic())
+        if flush:
+            self.flush(courier_id)
+        return True
+
+    def add_update(self, courier_id: str, delivery_update: dict):
+        """Добавить изменение доставки (статус, проблема); более раннее изменение того же заказа заменяется"""
+        with self.__lock:
+            buffer = self._buffer(courier_id)
+            key = delivery_update.get(self.order_key)
+            if key is None:
+                # изменение без заказа схлопывается только с таким же изменением
+                key = json.dumps(delivery_update, sort_keys=True, ensure_ascii=False, default=str)
+            previous = buffer.updates.pop(key, None)
+            buffer.updates[key] = {**previous, **delivery_update} if previous else delivery_update
+            now = time.monotonic()
+            # изменение статуса не должно ждать max_delay_s
+            deadline = now - self.max_delay_s + self.status_delay_s
+            buffer.first_at = deadline if buffer.first_at is None else min(buffer.first_at, deadline)
+
+    def _take(self, courier_id: str):
+        buffer = self.__couriers.get(courier_id)
+        if buffer is None or (not buffer.updates and not buffer.locations):
+            return None
+        updates, locations = buffer.updates, buffer.locations
+        buffer.updates, buffer.locations, buffer.first_at = {}, [], None
+        return buffer.base_dto, updates, locations
+
+    def _restore(self, courier_id: str, updates: dict, locations: list):
+        buffer = self._buffer(courier_id)
+        for key, update in buffer.updates.items():
+            updates.pop(key, None)
+            updates[key] = update
+        buffer.updates = updates
+        buffer.locations = (locations + buffer.locations)[-self.max_locations:]
+        now = time.monotonic()
+        if buffer.first_at is None:
+            buffer.first_at = now - self.max_delay_s
+        buffer.failures += 1
+        buffer.retry_at = now + min(self.max_retry_s, self.retry_s * 2 ** (buffer.failures - 1))
+        count_event(self.api, "mobile/sync", "retry")
+
+    def flush(self, courier_id: str):
+        """
+        Синхронизировать накопленные изменения курьера одним вызовом Mobile.sysc
+
+        :return: SyncResultDto или None, если отправлять нечего
+        :raise PostException: iiko ответил ошибкой (4xx/5xx), изменения возвращены в буфер
+        """
+        with self.__lock:
+            taken = self._take(courier_id)
+        if taken is None:
+            return None
+        base_dto, updates, locations = taken
+        send_update_dto = dict(base_dto)
+        send_update_dto[self.updates_key] = list(updates.values())
+        send_update_dto[self.locations_key] = locations
+        try:
+            result = self.api.sysc(send_update_dto, params=self.params)
+        except BizException:
+            with self.__lock:
+                self._restore(courier_id, updates, locations)
+            raise
+        status = response_status()
+        if status is not None and status >= 400:
+            with self.__lock:
+                self._restore(courier_id, updates, locations)
+            raise PostException(self.__class__.__qualname__,
+                                self.flush.__name__,
+                                f"[ERROR] Синхронизация курьера {courier_id} не выполнена: HTTP {status}: "
+                                f"{str(result)[:300]}")
+        with self.__lock:
+            buffer = self.__couriers.get(courier_id)
+            if buffer is not None:
+                buffer.failures, buffer.retry_at = 0, None
+        if self.on_result is not None:
+            self.on_result(courier_id, result)
+        return result
+
+    def flush_due(self) -> int:
+        """Синхронизировать курьеров, у которых подошло время; возвращает число вызовов sysc"""
+        now = time.monotonic()
+        with self.__lock:
+            due = [courier_id for courier_id, buffer in self.__couriers.items()
+                   if buffer.first_at is not None and now - buffer.first_at >= self.max_delay_s
+                   and not buffer.backoff(now)]
+        flushed = 0
+        for courier_id in due:
+            try:
+                if self.flush(courier_id) is not None:
+                    flushed += 1
+            except BizException:
+                continue
+        return flushed
+
+    def flush_all(self):
+        with self.__lock:
+            couriers = list(self.__couriers)
+        for courier_id in couriers:
+            self.flush(courier_id)
+
+    def run(self, tick: float = 0.5):
+        while not self.__stop.is_set():
+            self.flush_due()
+            self.__stop.wait(tick)
+
+    def start(self, tick: float = 0.5):
+        """Запустить фоновую синхронизацию по времени"""
+        if self.__thread is not None:
+            return
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.run, args=(tick,), name="pyiikoapi-courier-sync", daemon=True)
+        self.__thread.start()
+
+    def stop(self, flush: bool = True):
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        if flush:
+            self.flush_all()
@@ -0,0 +1,280 @@
+import hashlib
+import json
+import math
+import threading
+import time
+
+from ..core import is_data
+from ..metrics import count_event
+from .exception import BizException
+from .exception import GetException
+
+
+def _point(value) -> tuple:
+    """{"latitude", "longitude"} или [latitude, longitude] -> (latitude, longitude)"""
+    if isinstance(value, dict):
+        return float(value["latitude"]), float(value["longitude"])
+    return float(value[0]), float(value[1])
+
+
+def point_in_polygon(latitude: float, longitude: float, polygon: list) -> bool:
+    """Попадает ли точка в многоугольник [(latitude, longitude), ...] (метод луча)"""
+    inside = False
+    lat_j, lon_j = polygon[-1]
+    for lat_i, lon_i in polygon:
+        if (lat_i > latitude) != (lat_j > latitude) and \
+                longitude < (lon_j - lon_i) * (latitude - lat_i) / (lat_j - lat_i) + lon_i:
+            inside = not inside
+        lat_j, lon_j = lat_i, lon_i
+    return inside
+
+
+class DeliveryZoneIndex:
+    """
+    Пространственный индекс зон доставки (DeliverySettings.get_delivery_restrictions).
+
+    Плоскость делится на ячейки сетки. Для каждой ячейки заранее известно, какие зоны
+    покрывают ее целиком и через какие проходит граница зоны; точка в многоугольнике
+    проверяется только для граничных зон ячейки, поэтому поиск почти всегда сводится
+    к одному обращению к словарю.
+    """
+
+    def __init__(self, delivery_restrictions: dict, cell_deg: float = 0.01, max_cells: int = 200000):
+        """
+        :param delivery_restrictions: DeliveryRestrictions (deliveryZones, restrictions)
+        :param cell_deg: размер ячейки сетки в градусах
+        :param max_cells: если зоны займут больше ячеек, размер ячейки увеличивается
+        """
+        delivery_restrictions = delivery_restrictions or {}
+        rules = {}
+        for rule in delivery_restrictions.get("restrictions") or ():
+            rules.setdefault(rule.get("zone"), []).append(rule)
+        for zone_rules in rules.values():
+            zone_rules.sort(key=lambda rule: rule.get("priority") or 0)
+
+        self.zones = []
+        self.polygons = []
+        self.rules = []
+        for zone in delivery_restrictions.get("deliveryZones") or ():
+            polygon = [_point(point) for point in zone.get("coordinates") or ()]
+            if len(polygon) < 3:
+                continue
+            self.zones.append(zone.get("name"))
+            self.polygons.append(polygon)
+            self.rules.append(tuple(rules.get(zone.get("name"), ())))
+
+        area = sum((max(lat for lat, _ in polygon) - min(lat for lat, _ in polygon)) *
+                   (max(lon for _, lon in polygon) - min(lon for _, lon in polygon)) for polygon in self.polygons)
+        self.cell = max(cell_deg, math.sqrt(area / max_cells)) if area else cell_deg
+        self.cells = {}
+        self._build()
+
+    def _cell(self, latitude: float, longitude: float) -> tuple:
+        return math.floor(latitude / self.cell), math.floor(longitude / self.cell)
+
+    def _build(self):
+        for number, polygon in enumerate(self.polygons):
+            border = set()
+            lat_j, lon_j = polygon[-1]
+            for lat_i, lon_i in polygon:
+                i_min, j_min = self._cell(min(lat_i, lat_j), min(lon_i, lon_j))
+                i_max, j_max = self._cell(max(lat_i, lat_j), max(lon_i, lon_j))
+                for i in range(i_min, i_max + 1):
+                    for j in range(j_min, j_max + 1):
+                        border.add((i, j))
+                lat_j, lon_j = lat_i, lon_i
+
+            i_min, j_min = self._cell(min(lat for lat, _ in polygon), min(lon for _, lon in polygon))
+            i_max, j_max = self._cell(max(lat for lat, _ in polygon), max(lon for _, lon in polygon))
+            for i in range(i_min, i_max + 1):
+                for j in range(j_min, j_max + 1):
+                    if (i, j) in border:
+                        self.cells.setdefault((i, j), ([], []))[1].append(number)
+                    elif point_in_polygon((i + 0.5) * self.cell, (j + 0.5) * self.cell, polygon):
+                        # ячейку не пересекает граница - она вся внутри зоны
+                        self.cells.setdefault((i, j), ([], []))[0].append(number)
+        self.cells = {key: (tuple(inside), tuple(border)) for key, (inside, border) in self.cells.items()}
+
+    def zones_at(self, latitude: float, longitude: float) -> list:
+        """Номера зон (индексы self.zones), в которые попадает точка"""
+        entry = self.cells.get(self._cell(latitude, longitude))
+        if entry is None:
+            return []
+        inside, border = entry
+        if not border:
+            return list(inside)
+        return sorted(inside + tuple(number for number in border
+                                     if point_in_polygon(latitude, longitude, self.polygons[number])))
+
+    def lookup(self, latitude: float, longitude: float) -> list:
+        """
+        Ограничения доставки для точки
+
+        :return: restrictions зон, в которые попадает точка, по возрастанию priority
+            ({"zone", "deliveryTerminalId", "minSum", "deliveryDurationInMinutes", ...}); [] - вне зон доставки
+        """
+        numbers = self.zones_at(latitude, longitude)
+        if len(numbers) == 1:
+            return list(self.rules[numbers[0]])
+        result = [rule for number in numbers for rule in self.rules[number]]
+        result.sort(key=lambda rule: rule.get("priority") or 0)
+        return result
+
+    def terminal(self, latitude: float, longitude: float) -> dict:
+        """Ограничение с наивысшим приоритетом (обслуживающий терминал и условия) или None"""
+        result = self.lookup(latitude, longitude)
+        return result[0] if result else None
+
+    def lookup_many(self, points) -> list:
+        """
+        lookup для массива координат
+
+        :param points: [(latitude, longitude), ...] или [{"latitude", "longitude"}, ...]
+        :return: список результатов lookup в том же порядке
+        """
+        cache = {}
+        result = []
+        for point in points:
+            latitude, longitude = _point(point)
+            key = self._cell(latitude, longitude)
+            entry = self.cells.get(key)
+            if entry is not None and not entry[1]:
+                # одинаковый ответ для всей внутренней ячейки
+                if key not in cache:
+                    cache[key] = self.lookup(latitude, longitude)
+                result.append(list(cache[key]))
+            else:
+                result.append(self.lookup(latitude, longitude))
+        return result
+
+
+def restrictions_hash(delivery_restrictions: dict) -> str:
+    """Хэш зон и ограничений доставки: индекс перестраивается, только если он изменился"""
+    payload = {key: (delivery_restrictions or {}).get(key) for key in ("deliveryZones", "restrictions")}
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class DeliveryZones:
+    """
+    Индекс зон доставки организации, обновляемый из DeliverySettings.get_delivery_restrictions.
+
+    Ограничения перечитываются не чаще раза в ttl секунд, индекс перестраивается только
+    если зоны или ограничения изменились. Заменяет Orders.check_address для адресов с координатами.
+    Перечитывает один поток, остальные в это время работают по текущему индексу. Если iiko недоступен,
+    остается прежний индекс, повторная попытка - через retry_s секунд (пауза удваивается до ttl).
+
+    Пример:
+        zones = DeliveryZones(api)
+        zones.terminal(55.75, 37.61)        # {"deliveryTerminalId": ..., "minSum": ..., ...}
+        zones.lookup_many(coordinates)
+        OrderValidator(api, zone_resolver=zones.resolve_order)
+    """
+
+    def __init__(self, api, ttl: float = 300.0, cell_deg: float = 0.01, coordinates=None, retry_s: float = 10.0):
+        """
+        :param api: BizService (или DeliverySettings)
+        :param ttl: как часто перечитывать ограничения доставки, секунды
+        :param cell_deg: размер ячейки сетки в градусах
+        :param coordinates: coordinates(order_request) -> (latitude, longitude) или None;
+            по умолчанию поля latitude и longitude адреса заказа
+        :param retry_s: пауза перед повторным запросом после ошибки, секунды
+        """
+        self.api = api
+        self.ttl = ttl
+        self.cell_deg = cell_deg
+        self.coordinates = coordinates or self._address_coordinates
+        self.retry_s = retry_s
+
+        self.__lock = threading.Lock()
+        self.__refresh_lock = threading.Lock()
+        self.__index = None
+        self.__hash = None
+        self.__loaded = None
+        self.__failures = 0
+        self.__error = None
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Перечитать ограничения доставки (если истек ttl или пауза после ошибки, или force)
+
+        :return: True если индекс перестроен
+        """
+        if not force and self._fresh():
+            count_event(self.api, "deliverySettings/getDeliveryRestrictions", "cache_hit")
+            return False
+        count_event(self.api, "deliverySettings/getDeliveryRestrictions", "cache_miss")
+        if not self.__refresh_lock.acquire(blocking=self.__index is None):
+            # перечитывает другой поток - пока используем текущий индекс
+            return False
+        try:
+            if not force and self._fresh():
+                return False
+            return self._reload()
+        finally:
+            self.__refresh_lock.release()
+
+    def _fresh(self) -> bool:
+        """Не пора перечитывать; при паузе после ошибки без индекса - ошибка первой загрузки"""
+        with self.__lock:
+            if self.__loaded is None or time.monotonic() - self.__loaded >= self.ttl:
+                return False
+            if self.__index is None:
+                raise self.__error
+            return True
+
+    def _reload(self) -> bool:
+        try:
+            delivery_restrictions = self.api.get_delivery_restrictions()
+            if not is_data(delivery_restrictions, "deliveryZones"):
+                raise GetException(self.__class__.__qualname__, self.refresh.__name__,
+                                   f"[ERROR] Неожиданный ответ get_delivery_restrictions: "
+                                   f"{delivery_restrictions!r:.200}")
+        except BizException as err:
+            with self.__lock:
+                self.__failures += 1
+                retry = min(self.ttl, self.retry_s * 2 ** (self.__failures - 1))
+                self.__loaded = time.monotonic() - self.ttl + retry
+                self.__error = err
+                if self.__index is None:
+                    raise
+            return False
+        digest = restrictions_hash(delivery_restrictions)
+        index = DeliveryZoneIndex(delivery_restrictions, self.cell_deg) if digest != self.__hash else None
+        with self.__lock:
+            if index is not None:
+                self.__index, self.__hash = index, digest
+            self.__loaded = time.monotonic()
+            self.__failures, self.__error = 0, None
+        return index is not None
+
+    @property
+    def index(self) -> DeliveryZoneIndex:
+        self.refresh()
+        return self.__index
+
+    def lookup(self, latitude: float, longitude: float) -> list:
+        return self.index.lookup(latitude, longitude)
+
+    def terminal(self, latitude: float, longitude: float) -> dict:
+        return self.index.terminal(latitude, longitude)
+
+    def lookup_many(self, points) -> list:
+        return self.index.lookup_many(points)
+
+    @staticmethod
+    def _address_coordinates(order_request: dict):
+        address = ((order_request or {}).get("order") or {}).get("address") or {}
+        if address.get("latitude") is None or address.get("longitude") is None:
+            return None
+        return float(address["latitude"]), float(address["longitude"])
+
+    def resolve_order(self, order_request: dict):
+        """
+        zone_resolver для pyiikoapi.biz.validation.OrderValidator
+
+        :return: ограничения зон адреса заказа; None если у адреса нет координат
+        """
+        point = self.coordinates(order_request)
+        if point is None:
+            return None
+        return self.lookup(*point)
@@ -0,0 +1,319 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+from ..core import is_data
+
+MAGIC = b"PIMS"
+VERSION = 1
+# magic, version, products, groups, products_offset, groups_offset, strings_offset, meta (offset, length)
+HEADER = struct.Struct("<4sIIIQQQII")
+# id, code, name, groupId, parentGroup, type, doc - (offset, length) в области строк; price; isIncludedInMenu
+PRODUCT = struct.Struct("<14Id?B6x")
+# id, code, name, parentGroup, doc - (offset, length); isIncludedInMenu
+GROUP = struct.Struct("<10I?B6x")
+
+
+class _Strings:
+    """Область строк снимка; одинаковые строки хранятся один раз"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.index = {}
+
+    def add(self, value) -> tuple:
+        if value is None:
+            return 0, 0xFFFFFFFF
+        if not isinstance(value, (bytes, str)):
+            value = str(value)
+        encoded = value if isinstance(value, bytes) else value.encode("utf-8")
+        found = self.index.get(encoded)
+        if found is None:
+            found = self.index[encoded] = (len(self.data), len(encoded))
+            self.data += encoded
+        return found
+
+
+def _flags(value) -> tuple:
+    """isIncludedInMenu: (значение, задано ли)"""
+    return bool(value), value is not None
+
+
+def build_snapshot(nomenclature: dict) -> bytes:
+    """Сериализовать дерево номенклатуры (Nomenclature.nomenclature) в формат снимка"""
+    nomenclature = nomenclature or {}
+    strings = _Strings()
+    products = sorted(nomenclature.get("products") or (), key=lambda item: str(item.get("id")))
+    groups = sorted(nomenclature.get("groups") or (), key=lambda item: str(item.get("id")))
+
+    product_records = bytearray()
+    for product in products:
+        fields = []
+        for key in ("id", "code", "name", "groupId", "parentGroup", "type"):
+            fields.extend(strings.add(product.get(key)))
+        fields.extend(strings.add(json.dumps(product, ensure_ascii=False, separators=(",", ":"))))
+        price = product.get("price")
+        included, has_included = _flags(product.get("isIncludedInMenu"))
+        product_records += PRODUCT.pack(*fields, float("nan") if price is None else float(price),
+                                        included, has_included)
+
+    group_records = bytearray()
+    for group in groups:
+        fields = []
+        for key in ("id", "code", "name", "parentGroup"):
+            fields.extend(strings.add(group.get(key)))
+        fields.extend(strings.add(json.dumps(group, ensure_ascii=False, separators=(",", ":"))))
+        included, has_included = _flags(group.get("isIncludedInMenu"))
+        group_records += GROUP.pack(*fields, included, has_included)
+
+    meta = {key: value for key, value in nomenclature.items() if key not in ("products", "groups")}
+    meta = strings.add(json.dumps(meta, ensure_ascii=False, separators=(",", ":")))
+    products_offset = HEADER.size
+    groups_offset = products_offset + len(product_records)
+    strings_offset = groups_offset + len(group_records)
+    header = HEADER.pack(MAGIC, VERSION, len(products), len(groups), products_offset, groups_offset,
+                         strings_offset, *meta)
+    return bytes(header + product_records + group_records + strings.data)
+
+
+def write_snapshot(path: str, nomenclature: dict):
+    """Записать снимок атомарно: читатели видят либо старый, либо новый файл целиком"""
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, tmp = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(build_snapshot(nomenclature))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def update_snapshot(api, path: str) -> bool:
+    """
+    Запросить номенклатуру и перезаписать снимок, если изменилась revision
+
+    :param api: BizService (или Nomenclature)
+    :return: True если снимок обновлен; False и для ответа, который не является номенклатурой
+        (pyiikoapi.core.is_data) - такой ответ не заменяет последний снимок
+    """
+    nomenclature = api.nomenclature()
+    if not is_data(nomenclature, "products", required=("revision",)):
+        return False
+    if os.path.exists(path):
+        current = MenuSnapshot(path)
+        try:
+            if current.revision is not None and current.revision == nomenclature.get("revision"):
+                return False
+        finally:
+            current.close()
+    write_snapshot(path, nomenclature)
+    return True
+
+
+class _View:
+    __slots__ = ("_mapping", "_offset")
+    _struct = None
+    _fields = ()
+
+    def __init__(self, mapping, offset: int):
+        self._mapping = mapping
+        self._offset = offset
+
+    def _unpack(self) -> tuple:
+        return self._struct.unpack_from(self._mapping.buffer, self._offset)
+
+    def _string(self, number: int):
+        values = self._unpack()
+        return self._mapping.string(values[number * 2], values[number * 2 + 1])
+
+    @property
+    def raw(self) -> memoryview:
+        """JSON объекта без копирования (срез mmap)"""
+        values = self._unpack()
+        number = len(self._fields)
+        return self._mapping.view(values[number * 2], values[number * 2 + 1])
+
+    @property
+    def doc(self) -> dict:
+        """Объект целиком, как его вернул iiko (разбирается при каждом обращении)"""
+        return json.loads(bytes(self.raw))
+
+    @property
+    def is_included_in_menu(self):
+        values = self._unpack()
+        return values[-2] if values[-1] else None
+
+    def __getitem__(self, key: str):
+        """Поле объекта по ключу iiko; поля вне индекса берутся из doc"""
+        if key in self._fields:
+            return self._string(self._fields.index(key))
+        return self.doc.get(key)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(id={self.id!r}, name={self.name!r})"
+
+
+class ProductView(_View):
+    """Продукт снимка; поля читаются из общей памяти по обращению"""
+    __slots__ = ()
+    _struct = PRODUCT
+    _fields = ("id", "code", "name", "groupId", "parentGroup", "type")
+
+    id = property(lambda self: self._string(0))
+    code = property(lambda self: self._string(1))
+    name = property(lambda self: self._string(2))
+    group_id = property(lambda self: self._string(3))
+    parent_group = property(lambda self: self._string(4))
+    type = property(lambda self: self._string(5))
+
+    @property
+    def price(self):
+        price = self._unpack()[14]
+        return None if price != price else price
+
+    def __getitem__(self, key: str):
+        if key == "price":
+            return self.price
+        if key == "isIncludedInMenu":
+            return self.is_included_in_menu
+        return super().__getitem__(key)
+
+
+class GroupView(_View):
+    __slots__ = ()
+    _struct = GROUP
+    _fields = ("id", "code", "name", "parentGroup")
+
+    id = property(lambda self: self._string(0))
+    code = property(lambda self: self._string(1))
+    name = property(lambda self: self._string(2))
+    parent_group = property(lambda self: self._string(3))
+
+
+class _Mapping:
+    """Один отображенный в память файл снимка; view ссылаются на него, а не на MenuSnapshot"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, products, groups, products_offset, groups_offset, strings_offset, meta_offset, \
+            meta_length = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            buffer.close()
+            raise ValueError(f"Неизвестный формат снимка меню: {path}")
+        self.buffer = buffer
+        self.stat = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        self.products = (products, products_offset)
+        self.groups = (groups, groups_offset)
+        self.strings = strings_offset
+        self.meta = json.loads(self.string(meta_offset, meta_length))
+
+    def view(self, offset: int, length: int) -> memoryview:
+        if length == 0xFFFFFFFF:
+            return None
+        start = self.strings + offset
+        return memoryview(self.buffer)[start:start + length]
+
+    def string(self, offset: int, length: int) -> str:
+        if length == 0xFFFFFFFF:
+            return None
+        start = self.strings + offset
+        return self.buffer[start:start + length].decode("utf-8")
+
+
+class MenuSnapshot:
+    """
+    Снимок номенклатуры в файле, отображенном в память только для чтения (mmap).
+
+    Снимок пишется один раз (write_snapshot/update_snapshot, например в master процессе или cron),
+    воркеры открывают его через MenuSnapshot и получают ProductView/GroupView - поля читаются
+    прямо из общей страницы памяти ОС, поэтому память воркера не растет с размером меню и
+    числом воркеров. Продукты и группы отсортированы по id, поиск - двоичный.
+    Новая ревизия записывается в новый файл и атомарно подменяет старый; reload() переключает
+    воркер на новый файл, ранее полученные view продолжают читать старый.
+
+    Пример:
+        update_snapshot(api, "/run/menu/org.snap")      # при смене revision
+        menu = MenuSnapshot("/run/menu/org.snap")       # в воркере
+        product = menu.product(product_id)
+        product.name, product.price, product.doc
+        menu.reload()
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mapping = _Mapping(path)
+
+    @property
+    def meta(self) -> dict:
+        """Поля номенклатуры кроме products и groups (revision, uploadDate, productCategories)"""
+        return self._mapping.meta
+
+    @property
+    def revision(self):
+        return self._mapping.meta.get("revision")
+
+    def reload(self) -> bool:
+        """Открыть файл заново, если он был заменен; True если переключились на новый снимок"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        if (stat.st_ino, stat.st_mtime_ns, stat.st_size) == self._mapping.stat:
+            return False
+        # старый mmap не закрывается явно: им пользуются ранее выданные view, он освободится вместе с ними
+        self._mapping = _Mapping(self.path)
+        return True
+
+    def close(self):
+        """
+        Закрыть mmap снимка. Если живы memoryview, полученные через view.raw, mmap закрыть нельзя -
+        он останется открытым и освободится вместе с последним из них
+        """
+        try:
+            self._mapping.buffer.close()
+        except BufferError:
+            pass
+
+    def _find(self, table: tuple, record: struct.Struct, item_id: str, view):
+        mapping = self._mapping
+        count, base = getattr(mapping, table)
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            found = view(mapping, base + middle * record.size)
+            current = found.id
+            if current < item_id:
+                low = middle + 1
+            elif current > item_id:
+                high = middle
+            else:
+                return found
+        return None
+
+    def product(self, product_id: str) -> ProductView:
+        return self._find("products", PRODUCT, product_id, ProductView)
+
+    def group(self, group_id: str) -> GroupView:
+        return self._find("groups", GROUP, group_id, GroupView)
+
+    def products(self):
+        mapping = self._mapping
+        count, base = mapping.products
+        for number in range(count):
+            yield ProductView(mapping, base + number * PRODUCT.size)
+
+    def groups(self):
+        mapping = self._mapping
+        count, base = mapping.groups
+        for number in range(count):
+            yield GroupView(mapping, base + number * GROUP.size)
+
+    def __len__(self):
+        return self._mapping.products[0]
@@ -0,0 +1,251 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from ..core import is_data
+from ..metrics import count_event
+from .exception import BizException
+
+
+def _items(response, key: str = None) -> list:
+    """
+    Список из ответа: сам ответ или response[key].
+    :raise ValueError: ответ другого вида (pyiikoapi.core.is_data)
+    """
+    if is_data(response):
+        return response
+    if key is not None and is_data(response, key):
+        return response[key]
+    raise ValueError(f"Неожиданный ответ iiko: {str(response)[:300]}")
+
+
+def _row(item: dict, columns: tuple) -> tuple:
+    return tuple(item.get(key) for _, key in columns) + (json.dumps(item, ensure_ascii=False),)
+
+
+# таблица -> колонки (имя колонки, ключ в ответе); у каждой таблицы есть doc - исходный объект в json
+TABLES = {
+    "products": (("id", "id"), ("code", "code"), ("name", "name"), ("group_id", "groupId"),
+                 ("parent_group", "parentGroup"), ("category_id", "productCategoryId"), ("type", "type"),
+                 ("price", "price"), ("is_included_in_menu", "isIncludedInMenu")),
+    "groups": (("id", "id"), ("code", "code"), ("name", "name"), ("parent_group", "parentGroup"),
+               ("is_included_in_menu", "isIncludedInMenu")),
+    "product_categories": (("id", "id"), ("name", "name")),
+    "cities": (("id", "id"), ("name", "name")),
+    "streets": (("id", "id"), ("city_id", "cityId"), ("name", "name")),
+    "regions": (("id", "id"), ("name", "name")),
+    "terminals": (("id", "deliveryTerminalId"), ("name", "deliveryRestaurantName")),
+    "employees": (("id", "id"), ("name", "displayName"), ("phone", "phone")),
+    "couriers": (("id", "id"), ("name", "displayName"), ("phone", "phone")),
+    "payment_types": (("id", "id"), ("code", "code"), ("name", "name")),
+    "order_types": (("id", "id"), ("name", "name"), ("order_service_type", "orderServiceType")),
+}
+INDEXES = (("products", "code"), ("products", "group_id"), ("products", "name"), ("groups", "parent_group"),
+           ("streets", "city_id"), ("streets", "name"), ("payment_types", "code"))
+
+# набор данных -> (таблицы, интервал обновления по умолчанию в секундах)
+DATASETS = {
+    "nomenclature": (("products", "groups", "product_categories"), 300.0),
+    "cities": (("cities", "streets"), 86400.0),
+    "regions": (("regions",), 86400.0),
+    "terminals": (("terminals",), 600.0),
+    "employees": (("employees",), 3600.0),
+    "couriers": (("couriers",), 300.0),
+    "payment_types": (("payment_types",), 3600.0),
+    "order_types": (("order_types",), 3600.0),
+}
+
+
+class ReferenceMirror:
+    """
+    Локальная копия справочников организации в SQLite.
+
+    Номенклатура, города и улицы, регионы, доставочные терминалы, сотрудники, курьеры,
+    типы оплат и типы заказов хранятся в индексированных таблицах (файл на организацию).
+    Каждый набор обновляется по своему расписанию; номенклатура с той же revision
+    не перезаписывается. После перезапуска справочники читаются из файла без обращения к iiko.
+
+    Пример:
+        mirror = ReferenceMirror(api, "/var/lib/iiko-mirror")
+        mirror.sync()                         # наборы, время которых подошло
+        mirror.start()                        # или обновлять в фоне
+        mirror.product_by_code("00123")
+        mirror.query("SELECT id, name FROM streets WHERE city_id = ? AND name LIKE ?", (city_id, "Лен%"))
+    """
+
+    def __init__(self, api, directory: str, intervals: dict = None):
+        """
+        :param api: BizService
+        :param directory: каталог баз; база организации - {directory}/{organizationId}.sqlite
+        :param intervals: интервалы обновления наборов в секундах, дополняют DATASETS
+        """
+        self.api = api
+        self.intervals = {name: interval for name, (_, interval) in DATASETS.items()}
+        if intervals is not None:
+            self.intervals.update(intervals)
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{api.org}.sqlite")
+
+        self.__lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__thread = None
+        self.__conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        for table, columns in TABLES.items():
+            names = ", ".join(column for column, _ in columns[1:])
+            self.__conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (id TEXT PRIMARY KEY, {names}, doc TEXT)")
+        for table, column in INDEXES:
+            self.__conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column})")
+        self.__conn.execute("CREATE TABLE IF NOT EXISTS sync (dataset TEXT PRIMARY KEY, revision TEXT, "
+                            "synced REAL NOT NULL, error TEXT)")
+
+    def _fetch(self, dataset: str) -> tuple:
+        """Загрузить набор из iiko: (revision, {таблица: [объекты]})"""
+        api = self.api
+        if dataset == "nomenclature":
+            response = api.nomenclature()
+            if not is_data(response, "products", required=("revision",)):
+                raise ValueError(f"Неожиданный ответ iiko: {str(response)[:300]}")
+            return response.get("revision"), {"products": response["products"],
+                                              "groups": _items(response.get("groups") or []),
+                                              "product_categories": _items(response.get("productCategories") or [])}
+        if dataset == "cities":
+            cities, streets = [], []
+            for city_with_streets in _items(api.cities()):
+                city = city_with_streets.get("city") or {}
+                cities.append(city)
+                for street in city_with_streets.get("streets") or ():
+                    streets.append(dict(street, cityId=street.get("cityId") or city.get("id")))
+            return None, {"cities": cities, "streets": streets}
+        if dataset == "regions":
+            return None, {"regions": _items(api.regions(), "regions")}
+        if dataset == "terminals":
+            return None, {"terminals": _items(api.get_delivery_terminals(), "deliveryTerminals")}
+        if dataset == "employees":
+            return None, {"employees": _items(api.get_employees(), "users")}
+        if dataset == "couriers":
+            return None, {"couriers": _items(api.get_couriers(), "users")}
+        if dataset == "payment_types":
+            return None, {"payment_types": _items(api.get_payment_types(), "paymentTypes")}
+        if dataset == "order_types":
+            return None, {"order_types": _items(api.get_orders_types(), "items")}
+        raise KeyError(dataset)
+
+    def _state(self) -> dict:
+        with self.__lock:
+            return {row[0]: row[1:] for row in self.__conn.execute("SELECT dataset, revision, synced FROM sync")}
+
+    def due(self) -> list:
+        """Наборы, которые пора обновить"""
+        state = self._state()
+        now = time.time()
+        return [dataset for dataset, interval in self.intervals.items()
+                if dataset not in state or now - state[dataset][1] >= interval]
+
+    def sync(self, datasets: list = None, force: bool = False) -> dict:
+        """
+        Обновить наборы данных
+
+        :param datasets: имена наборов (DATASETS), по умолчанию все, время которых подошло
+        :param force: обновить, даже если время не подошло
+        :return: {dataset: "updated" | "unchanged" | текст ошибки}
+        """
+        if datasets is None:
+            datasets = list(self.intervals) if force else self.due()
+        state = self._state()
+        result = {}
+        for dataset in datasets:
+            try:
+                revision, tables = self._fetch(dataset)
+            except (BizException, ValueError) as err:
+                # ошибка iiko не затирает таблицы: остаются данные прошлой синхронизации
+                with self.__lock:
+                    self.__conn.execute("INSERT INTO sync (dataset, revision, synced, error) VALUES (?, NULL, 0, ?) "
+                                        "ON CONFLICT (dataset) DO UPDATE SET error = excluded.error",
+                                        (dataset, str(err)))
+                result[dataset] = str(err)
+                continue
+            revision = None if revision is None else str(revision)
+            unchanged = revision is not None and dataset in state and state[dataset][0] == revision
+            with self.__lock:
+                self.__conn.execute("BEGIN IMMEDIATE")
+                try:
+                    if not unchanged:
+                        for table, items in tables.items():
+                            columns = TABLES[table]
+                            self.__conn.execute(f"DELETE FROM {table}")
+                            self.__conn.executemany(
+                                f"INSERT OR REPLACE INTO {table} VALUES ({', '.join('?' * (len(columns) + 1))})",
+                                [_row(item, columns) for item in items])
+                    self.__conn.execute("INSERT OR REPLACE INTO sync (dataset, revision, synced, error) "
+                                        "VALUES (?, ?, ?, NULL)", (dataset, revision, time.time()))
+                    self.__conn.execute("COMMIT")
+                except BaseException:
+                    self.__conn.execute("ROLLBACK")
+                    raise
+            result[dataset] = "unchanged" if unchanged else "updated"
+            # revision не изменилась - таблицы зеркала актуальны
+            count_event(self.api, f"mirror/{dataset}", "cache_hit" if unchanged else "cache_miss")
+        return result
+
+    def run(self, tick: float = 5.0):
+        while not self.__stop.is_set():
+            self.sync()
+            self.__stop.wait(tick)
+
+    def start(self, tick: float = 5.0):
+        """Обновлять наборы по расписанию в фоновом потоке"""
+        if self.__thread is not None:
+            return
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.run, args=(tick,), name="pyiikoapi-mirror", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def close(self):
+        self.stop()
+        self.__conn.close()
+
+    def query(self, sql: str, params=()) -> list:
+        """Произвольный SQL запрос к зеркалу"""
+        with self.__lock:
+            return self.__conn.execute(sql, params).fetchall()
+
+    def _docs(self, sql: str, params=()) -> list:
+        return [json.loads(row[0]) for row in self.query(sql, params)]
+
+    def get(self, table: str, item_id: str) -> dict:
+        """Объект справочника по id (в том виде, в котором его вернул iiko)"""
+        if table not in TABLES:
+            raise KeyError(table)
+        docs = self._docs(f"SELECT doc FROM {table} WHERE id = ?", (item_id,))
+        return docs[0] if docs else None
+
+    def all(self, table: str) -> list:
+        if table not in TABLES:
+            raise KeyError(table)
+        return self._docs(f"SELECT doc FROM {table}")
+
+    def product_by_code(self, code: str) -> dict:
+        docs = self._docs("SELECT doc FROM products WHERE code = ?", (code,))
+        return docs[0] if docs else None
+
+    def products_in_group(self, group_id: str) -> list:
+        return self._docs("SELECT doc FROM products WHERE group_id = ? OR parent_group = ?", (group_id, group_id))
+
+    def find_streets(self, city_id: str, prefix: str = "") -> list:
+        """Улицы города, название которых начинается с prefix"""
+        return self._docs("SELECT doc FROM streets WHERE city_id = ? AND name LIKE ? ESCAPE '\\' ORDER BY name",
+                          (city_id, prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"))
+
+    def revision(self) -> str:
+        """Ревизия номенклатуры в зеркале"""
+        rows = self.query("SELECT revision FROM sync WHERE dataset = 'nomenclature'")
+        return rows[0][0] if rows else None
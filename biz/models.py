@@ -0,0 +1,202 @@
+"""
+Типизированные модели ответов iiko Biz API.
+Методы сервиса по-прежнему возвращают чистый json, модели создаются явно:
+
+    from pyiikoapi.biz.models import OrderInfo, Nomenclature, olap_rows
+
+    order = OrderInfo.from_dict(api.info(order_id))
+    menu = Nomenclature.from_dict(api.nomenclature())
+    rows = olap_rows(api.olap(olap_report_request))
+"""
+from ..model import Field
+from ..model import Model
+from ..model import Nested
+from ..model import records
+
+
+class Address(Model):
+    city = Field("city")
+    street = Field("street")
+    street_id = Field("streetId")
+    home = Field("home")
+    housing = Field("housing")
+    apartment = Field("apartment")
+    entrance = Field("entrance")
+    floor = Field("floor")
+    doorphone = Field("doorphone")
+    comment = Field("comment")
+    region_id = Field("regionId")
+
+
+class OrderCustomer(Model):
+    id = Field("id")
+    name = Field("name")
+    phone = Field("phone")
+    email = Field("email")
+
+
+class OrderModifier(Model):
+    id = Field("id")
+    code = Field("code")
+    name = Field("name")
+    amount = Field("amount")
+    sum = Field("sum")
+    group_id = Field("groupId")
+
+
+class OrderItem(Model):
+    id = Field("id")
+    code = Field("code")
+    name = Field("name")
+    category = Field("category")
+    amount = Field("amount")
+    size = Field("size")
+    sum = Field("sum")
+    comment = Field("comment")
+    guest_id = Field("guestId")
+    modifiers = Nested("modifiers", OrderModifier, many=True)
+
+
+class PaymentType(Model):
+    id = Field("id")
+    code = Field("code")
+    name = Field("name")
+
+
+class OrderPayment(Model):
+    sum = Field("sum")
+    is_processed_externally = Field("isProcessedExternally")
+    is_preliminary = Field("isPreliminary")
+    is_external = Field("isExternal")
+    payment_type = Nested("paymentType", PaymentType)
+
+
+class CourierInfo(Model):
+    courier_id = Field("courierId")
+    location = Field("location")
+
+
+class OrderInfo(Model):
+    """orderInfo Информация о заказе (Orders.add, Orders.info)"""
+    order_id = Field("orderId")
+    number = Field("number")
+    status = Field("status")
+    status_code = Field("statusCode")
+    sum = Field("sum")
+    discount = Field("discount")
+    organization = Field("organization")
+    delivery_terminal = Field("deliveryTerminal")
+    customer_id = Field("customerId")
+    customer_name = Field("customerName")
+    customer_phone = Field("customerPhone")
+    delivery_date = Field("deliveryDate")
+    created_time = Field("createdTime")
+    confirm_time = Field("confirmTime")
+    send_time = Field("sendTime")
+    actual_time = Field("actualTime")
+    close_time = Field("closeTime")
+    cancel_time = Field("cancelTime")
+    duration_in_minutes = Field("durationInMinutes")
+    persons_count = Field("personsCount")
+    comment = Field("comment")
+    problem = Field("problem")
+    order_type = Field("orderType")
+    customer = Nested("customer", OrderCustomer)
+    address = Nested("address", Address)
+    courier_info = Nested("courierInfo", CourierInfo)
+    items = Nested("items", OrderItem, many=True)
+    payments = Nested("payments", OrderPayment, many=True)
+
+
+class ProductModifier(Model):
+    modifier_id = Field("modifierId")
+    min_amount = Field("minAmount")
+    max_amount = Field("maxAmount")
+    default_amount = Field("defaultAmount")
+    required = Field("required")
+
+
+class ProductGroupModifier(Model):
+    modifier_id = Field("modifierId")
+    min_amount = Field("minAmount")
+    max_amount = Field("maxAmount")
+    required = Field("required")
+    child_modifiers = Nested("childModifiers", ProductModifier, many=True)
+
+
+class ProductImage(Model):
+    image_id = Field("imageId")
+    image_url = Field("imageUrl")
+    upload_date = Field("uploadDate")
+
+
+class Product(Model):
+    """Продукт номенклатуры"""
+    id = Field("id")
+    code = Field("code")
+    name = Field("name")
+    description = Field("description")
+    price = Field("price")
+    parent_group = Field("parentGroup")
+    group_id = Field("groupId")
+    product_category_id = Field("productCategoryId")
+    type = Field("type")
+    order_item_type = Field("orderItemType")
+    measure_unit = Field("measureUnit")
+    weight = Field("weight")
+    order = Field("order")
+    is_included_in_menu = Field("isIncludedInMenu")
+    tags = Field("tags")
+    modifiers = Nested("modifiers", ProductModifier, many=True)
+    group_modifiers = Nested("groupModifiers", ProductGroupModifier, many=True)
+    images = Nested("images", ProductImage, many=True)
+
+
+class Group(Model):
+    """Группа номенклатуры"""
+    id = Field("id")
+    code = Field("code")
+    name = Field("name")
+    description = Field("description")
+    parent_group = Field("parentGroup")
+    order = Field("order")
+    is_included_in_menu = Field("isIncludedInMenu")
+    is_group_modifier = Field("isGroupModifier")
+    images = Nested("images", ProductImage, many=True)
+
+
+class ProductCategory(Model):
+    id = Field("id")
+    name = Field("name")
+
+
+class Nomenclature(Model):
+    """Дерево номенклатуры (Nomenclature.nomenclature)"""
+    revision = Field("revision")
+    upload_date = Field("uploadDate")
+    groups = Nested("groups", Group, many=True)
+    products = Nested("products", Product, many=True)
+    product_categories = Nested("productCategories", ProductCategory, many=True)
+
+
+def olap_rows(olap_report_response) -> tuple:
+    """
+    Строки олап-отчета (Olaps.olap, Olaps.olap_by_preset) в виде кортежа pyiikoapi.model.Record
+
+    :param olap_report_response: OlapReportResponse ({"data": [...]}) или сразу список строк
+    """
+    if isinstance(olap_report_response, dict):
+        olap_report_response = olap_report_response.get("data")
+    return records(olap_report_response)
+
+
+def events_records(events_response) -> tuple:
+    """
+    События журнала (Events.events) в виде кортежа pyiikoapi.model.Record.
+    Набор атрибутов зависит от типа события, записи одного типа делят кортеж ключей.
+
+    :param events_response: eventsResponse ({"events": [...]}) или сразу список событий
+    """
+    if isinstance(events_response, dict):
+        events_response = events_response.get("events")
+    return records(events_response)
@@ -0,0 +1,259 @@
+import json
+import os
+import tempfile
+import threading
+
+from ..core import is_data
+
+ADDED = "added"
+REMOVED = "removed"
+MOVED = "moved"
+PRICE = "price"
+CHANGED = "changed"
+
+PRODUCT = "product"
+MODIFIER = "modifier"
+GROUP = "group"
+CATEGORY = "category"
+
+# поля, изменение которых означает перемещение объекта в дереве
+PARENT_FIELDS = {PRODUCT: ("parentGroup", "groupId"), MODIFIER: ("parentGroup", "groupId"),
+                 GROUP: ("parentGroup",), CATEGORY: ()}
+PRICE_FIELDS = ("price",)
+
+
+class Change:
+    """
+    Изменение одного объекта номенклатуры
+
+    kind - PRODUCT, MODIFIER, GROUP или CATEGORY
+    action - ADDED, REMOVED, MOVED, PRICE или CHANGED (остальные поля)
+    fields - {поле: (старое значение, новое значение)} для MOVED, PRICE и CHANGED
+    old, new - объект в старой и новой ревизии (None для ADDED и REMOVED соответственно)
+    """
+    __slots__ = ("kind", "action", "id", "fields", "old", "new")
+
+    def __init__(self, kind: str, action: str, item_id: str, fields: dict = None, old: dict = None,
+                 new: dict = None):
+        self.kind = kind
+        self.action = action
+        self.id = item_id
+        self.fields = fields or {}
+        self.old = old
+        self.new = new
+
+    def to_dict(self) -> dict:
+        return {"kind": self.kind, "action": self.action, "id": self.id,
+                "fields": {key: list(values) for key, values in self.fields.items()}}
+
+    def __repr__(self):
+        return f"Change({self.kind!r}, {self.action!r}, {self.id!r}, fields={sorted(self.fields)!r})"
+
+
+class NomenclatureDiff:
+    """
+    Разница двух ревизий номенклатуры
+
+    old_revision, new_revision - ревизии сравниваемых деревьев
+    changes - [Change, ...]: сначала категории и группы, затем продукты и модификаторы
+    """
+    __slots__ = ("old_revision", "new_revision", "changes")
+
+    def __init__(self, old_revision, new_revision, changes: list):
+        self.old_revision = old_revision
+        self.new_revision = new_revision
+        self.changes = changes
+
+    def __bool__(self):
+        return bool(self.changes)
+
+    def __len__(self):
+        return len(self.changes)
+
+    def __iter__(self):
+        return iter(self.changes)
+
+    def filter(self, kind: str = None, action: str = None) -> list:
+        return [change for change in self.changes
+                if (kind is None or change.kind == kind) and (action is None or change.action == action)]
+
+    def ids(self, kind: str = None, action: str = None) -> set:
+        """id объектов, затронутых изменениями"""
+        return {change.id for change in self.filter(kind, action)}
+
+    def removed(self, kind: str = None) -> set:
+        return self.ids(kind, REMOVED)
+
+    def reindex(self, new: dict = None) -> set:
+        """
+        id продуктов и модификаторов, документы которых нужно перестроить
+
+        :param new: новое дерево; если задано, добавляются продукты групп, которые были
+            переименованы или перемещены (путь группы входит в документ продукта)
+        :return: id без удаленных объектов
+        """
+        result = {change.id for change in self.changes
+                  if change.kind in (PRODUCT, MODIFIER) and change.action != REMOVED}
+        groups = {change.id for change in self.changes if change.kind == GROUP and change.action != ADDED}
+        if new is not None and groups:
+            children = {}
+            for group in new.get("groups") or ():
+                children.setdefault(group.get("parentGroup"), []).append(group.get("id"))
+            stack = list(groups)
+            while stack:
+                group_id = stack.pop()
+                for child in children.get(group_id, ()):
+                    if child not in groups:
+                        groups.add(child)
+                        stack.append(child)
+            for product in new.get("products") or ():
+                if product.get("parentGroup") in groups or product.get("groupId") in groups:
+                    result.add(product.get("id"))
+        return result
+
+    def to_dict(self) -> dict:
+        return {"oldRevision": self.old_revision, "newRevision": self.new_revision,
+                "changes": [change.to_dict() for change in self.changes]}
+
+    def __repr__(self):
+        return f"NomenclatureDiff({self.old_revision!r} -> {self.new_revision!r}, changes={len(self.changes)})"
+
+
+def _kind(product: dict) -> str:
+    return MODIFIER if str(product.get("type") or "").lower() == "modifier" else PRODUCT
+
+
+def _index(items) -> dict:
+    return {item.get("id"): item for item in items or () if item.get("id") is not None}
+
+
+def _compare(kind: str, item_id: str, old: dict, new: dict) -> list:
+    """Изменения одного объекта, присутствующего в обеих ревизиях"""
+    if old == new:
+        return []
+    moved, price, changed = {}, {}, {}
+    for key in old.keys() | new.keys():
+        before, after = old.get(key), new.get(key)
+        if before == after:
+            continue
+        if key in PARENT_FIELDS[kind]:
+            moved[key] = (before, after)
+        elif key in PRICE_FIELDS:
+            price[key] = (before, after)
+        else:
+            changed[key] = (before, after)
+    return [Change(kind, action, item_id, fields, old, new)
+            for action, fields in ((MOVED, moved), (PRICE, price), (CHANGED, changed)) if fields]
+
+
+def _diff_items(old: dict, new: dict, kind_of) -> list:
+    changes = []
+    for item_id, item in new.items():
+        previous = old.get(item_id)
+        if previous is None:
+            changes.append(Change(kind_of(item), ADDED, item_id, new=item))
+        else:
+            changes.extend(_compare(kind_of(item), item_id, previous, item))
+    for item_id, item in old.items():
+        if item_id not in new:
+            changes.append(Change(kind_of(item), REMOVED, item_id, old=item))
+    return changes
+
+
+def diff_nomenclature(old: dict, new: dict) -> NomenclatureDiff:
+    """
+    Сравнить два дерева номенклатуры (Nomenclature.nomenclature)
+
+    Объекты сопоставляются по id через словари, поэтому время сравнения линейно от размера меню.
+    Продукты с type == "modifier" отмечаются как MODIFIER. У одного объекта может быть
+    несколько изменений (например MOVED и PRICE).
+    """
+    old, new = old or {}, new or {}
+    changes = _diff_items(_index(old.get("productCategories")), _index(new.get("productCategories")),
+                          lambda item: CATEGORY)
+    changes += _diff_items(_index(old.get("groups")), _index(new.get("groups")), lambda item: GROUP)
+    changes += _diff_items(_index(old.get("products")), _index(new.get("products")), _kind)
+    return NomenclatureDiff(old.get("revision"), new.get("revision"), changes)
+
+
+class NomenclatureFeed:
+    """
+    Лента изменений номенклатуры.
+
+    poll() запрашивает номенклатуру и, если revision изменилась, сравнивает ее с предыдущей
+    и передает NomenclatureDiff подписчикам. Последнее дерево можно хранить в файле, тогда
+    после перезапуска первая разница считается от него, а не от пустого меню.
+
+    Пример:
+        feed = NomenclatureFeed(api, "/var/lib/iiko/nomenclature.json")
+        feed.subscribe(lambda diff, tree: search.reindex(diff.reindex(tree), diff.removed()))
+        feed.poll()
+    """
+
+    def __init__(self, api, path: str = None):
+        """
+        :param api: BizService (или Nomenclature)
+        :param path: файл последнего дерева; None - хранить только в памяти
+        """
+        self.api = api
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__subscribers = []
+        self.__tree = None
+        if path is not None and os.path.exists(path):
+            with open(path, "rb") as file:
+                tree = json.loads(file.read())
+            self.__tree = tree if is_data(tree, "products", required=("revision",)) else None
+
+    @property
+    def tree(self) -> dict:
+        """Последнее полученное дерево номенклатуры"""
+        return self.__tree
+
+    @property
+    def revision(self):
+        return None if self.__tree is None else self.__tree.get("revision")
+
+    def subscribe(self, callback):
+        """callback(diff: NomenclatureDiff, tree: dict) вызывается при каждой новой ревизии"""
+        self.__subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        self.__subscribers.remove(callback)
+
+    def _save(self, tree: dict):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        descriptor, tmp = tempfile.mkstemp(dir=directory, prefix=os.path.basename(self.path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(json.dumps(tree, ensure_ascii=False).encode("utf-8"))
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def update(self, tree: dict) -> NomenclatureDiff:
+        """
+        Принять новое дерево, полученное другим способом (например из ReferenceMirror)
+
+        :return: NomenclatureDiff или None, если revision не изменилась или tree не номенклатура
+            (pyiikoapi.core.is_data)
+        """
+        if not is_data(tree, "products", required=("revision",)):
+            return None
+        with self.__lock:
+            previous = self.__tree
+            if previous is not None and previous.get("revision") == tree.get("revision"):
+                return None
+            diff = diff_nomenclature(previous, tree)
+            if self.path is not None:
+                self._save(tree)
+            self.__tree = tree
+        for callback in list(self.__subscribers):
+            callback(diff, tree)
+        return diff
+
+    def poll(self) -> NomenclatureDiff:
+        """Запросить номенклатуру; NomenclatureDiff или None, если revision не изменилась или ответ - ошибка"""
+        return self.update(self.api.nomenclature())
@@ -0,0 +1,195 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+import zlib
+from datetime import datetime as dt
+from datetime import timedelta as td
+
+from ..core import is_data
+from ..metrics import count_event
+
+DATE_FORMATS = ("%Y-%m-%d", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S", "%d.%m.%Y")
+
+
+def _parse(value):
+    for date_format in DATE_FORMATS:
+        try:
+            return dt.strptime(str(value)[:19], date_format), date_format
+        except ValueError:
+            continue
+    return None, None
+
+
+def report_window(report_request: dict) -> tuple:
+    """
+    Окно отчета (dateFrom, dateTo) как datetime; дата без времени в dateTo означает конец этого дня.
+    (None, None), если окно не удалось определить
+    """
+    report_request = report_request or {}
+    start, _ = _parse(report_request.get("dateFrom") or report_request.get("from"))
+    end, end_format = _parse(report_request.get("dateTo") or report_request.get("to"))
+    if end is not None and end_format in ("%Y-%m-%d", "%d.%m.%Y"):
+        end += td(days=1)
+    return start, end
+
+
+def shard_requests(report_request: dict, days: int = 1):
+    """
+    Разбить запрос отчета на запросы по days дней (формат дат сохраняется).
+    Если окно не удалось определить, возвращается исходный запрос
+    """
+    start, end = report_window(report_request)
+    if start is None or end is None:
+        yield report_request
+        return
+    key_from = "dateFrom" if "dateFrom" in report_request else "from"
+    key_to = "dateTo" if "dateTo" in report_request else "to"
+    _, date_format = _parse(report_request[key_from])
+    date_only = date_format in ("%Y-%m-%d", "%d.%m.%Y")
+    shard = start
+    while shard < end:
+        shard_end = min(shard + td(days=days), end)
+        request = dict(report_request)
+        request[key_from] = shard.strftime(date_format)
+        request[key_to] = (shard_end - td(days=1) if date_only else shard_end).strftime(date_format)
+        yield request
+        shard = shard_end
+
+
+def report_key(method: str, organization: str, report_request: dict) -> str:
+    """Канонический хэш запроса отчета: порядок ключей не важен"""
+    canonical = json.dumps({"method": method, "organization": organization, "request": report_request},
+                           sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class OlapCache:
+    """
+    Дисковый кэш олап-отчетов (Olaps.olap, Olaps.olap_by_preset).
+
+    Ключ - канонический хэш запроса и организации. Данные закрытого периода не меняются:
+    отчет, окно которого закончилось раньше now - closed_lag, хранится бессрочно, отчет
+    за открытый период - open_ttl секунд. Ответы хранятся сжатыми (gzip).
+
+    olap_sharded() делит длинное окно на дни: за квартал из iiko запрашиваются
+    только дни, которых нет в кэше, и текущий день.
+
+    Пример:
+        cache = OlapCache(api, "/var/cache/iiko-olap")
+        report = cache.olap(olap_report_request)
+        rows = cache.olap_sharded({**olap_report_request, "dateFrom": "2026-07-01", "dateTo": "2026-09-30"})
+    """
+
+    def __init__(self, api, path: str, closed_lag: td = td(hours=6), open_ttl: float = 300.0,
+                 compresslevel: int = 6):
+        """
+        :param api: BizService (или Olaps)
+        :param path: каталог кэша
+        :param closed_lag: через сколько после окончания окна его данные считаются окончательными
+        :param open_ttl: время жизни отчета за открытый период в секундах
+        :param compresslevel: уровень сжатия gzip
+        """
+        self.api = api
+        self.path = path
+        self.closed_lag = closed_lag
+        self.open_ttl = open_ttl
+        self.compresslevel = compresslevel
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key + ".json.gz")
+
+    def _codec(self):
+        return getattr(self.api, "codec", None)
+
+    def _read(self, key: str):
+        try:
+            with open(self._file(key), "rb") as file:
+                data = gzip.decompress(file.read())
+            codec = self._codec()
+            entry = codec.decode(data) if codec is not None else json.loads(data)
+        except (OSError, EOFError, ValueError, zlib.error):
+            # нет файла, файл оборван или поврежден - отчет будет запрошен заново
+            return None
+        if not isinstance(entry, dict) or not is_data(entry.get("response"), "data"):
+            return None
+        if entry.get("expires") is not None and entry["expires"] < time.time():
+            return None
+        return entry
+
+    def _write(self, key: str, response, expires):
+        entry = {"expires": expires, "created": time.time(), "response": response}
+        codec = self._codec()
+        data = codec.encode(entry) if codec is not None else json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        directory = os.path.dirname(self._file(key))
+        os.makedirs(directory, exist_ok=True)
+        descriptor, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(gzip.compress(data, self.compresslevel))
+            os.replace(tmp, self._file(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def closed(self, report_request: dict, now: dt = None) -> bool:
+        """Закрыт ли период отчета (данные больше не изменятся)"""
+        _, end = report_window(report_request)
+        return end is not None and end <= (now or dt.now()) - self.closed_lag
+
+    def _cached(self, method: str, report_request: dict, fetch):
+        key = report_key(method, self.api.org, report_request)
+        endpoint = "olaps/olapByPreset" if method == "olap_by_preset" else "olaps/olap"
+        entry = self._read(key)
+        if entry is not None:
+            count_event(self.api, endpoint, "cache_hit")
+            return entry["response"]
+        count_event(self.api, endpoint, "cache_miss")
+        response = fetch()
+        # olap возвращает тело ошибки iiko (401, 500 ...) вместо исключения - такой ответ не кэшируется
+        if is_data(response, "data"):
+            self._write(key, response, None if self.closed(report_request) else time.time() + self.open_ttl)
+        return response
+
+    def olap(self, olap_report_request: dict, params: dict = None):
+        """Olaps.olap через кэш"""
+        return self._cached("olap", olap_report_request,
+                            lambda: self.api.olap(olap_report_request, params=params))
+
+    def olap_by_preset(self, preset_olap_report_request: dict, params: dict = None):
+        """Olaps.olap_by_preset через кэш"""
+        return self._cached("olap_by_preset", preset_olap_report_request,
+                            lambda: self.api.olap_by_preset(preset_olap_report_request, params=params))
+
+    def olap_sharded(self, report_request: dict, days: int = 1, preset: bool = False, params: dict = None) -> list:
+        """
+        Отчет за длинное окно по частям по days дней; каждая часть кэшируется отдельно
+
+        Строки частей объединяются без повторной агрегации, поэтому в groupByColumns
+        должна быть колонка даты (например OpenDate.Typed).
+        :param preset: True - olap_by_preset, иначе olap
+        :return: строки отчета (data всех частей)
+        """
+        rows = []
+        for request in shard_requests(report_request, days):
+            response = self.olap_by_preset(request, params) if preset else self.olap(request, params)
+            rows.extend((response or {}).get("data") or ())
+        return rows
+
+    def purge(self) -> int:
+        """Удалить просроченные отчеты открытых периодов"""
+        removed = 0
+        for directory, _, files in os.walk(self.path):
+            for name in files:
+                if not name.endswith(".json.gz"):
+                    continue
+                if self._read(name[:-len(".json.gz")]) is None:
+                    try:
+                        os.unlink(os.path.join(directory, name))
+                        removed += 1
+                    except OSError:
+                        continue
+        return removed
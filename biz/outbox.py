@@ -0,0 +1,297 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from ..core import response_status
+from ..metrics import count_event
+from .exception import BizException
+from .exception import ParamSetException
+
+PENDING = "pending"
+INFLIGHT = "inflight"
+DONE = "done"
+FAILED = "failed"
+
+
+class OrderOutbox:
+    """
+    Надежная очередь создания заказов (outbox) поверх Orders.add.
+
+    submit() сохраняет запрос в SQLite и сразу возвращает ключ идемпотентности, не дожидаясь iiko.
+    Фоновые потоки отправляют заказы параллельно (workers), повторяют отправку при сетевых
+    ошибках и ответах 429 и 5xx и вызывают on_ack строго в порядке поступления заказов.
+    Ответ 4xx - окончательный отказ, кроме случая, когда заказ с этим id уже создан
+    (ответ на прошлую отправку потерялся): тогда заказ считается отправленным.
+
+    Ключ идемпотентности - это идентификатор заказа order_request["order"]["id"]: iiko не создает
+    второй заказ с тем же id, поэтому повторная отправка после сбоя или падения процесса
+    не дублирует заказ. Если id не задан, он генерируется.
+
+    После перезапуска заказы в статусе inflight снова отправляются, а результаты,
+    о которых не успели сообщить, передаются в on_ack повторно.
+
+    Пример:
+        outbox = OrderOutbox(api, "/var/lib/shop/orders.sqlite", workers=8, on_ack=callback)
+        outbox.start()
+        key = outbox.submit(order_request)
+        ...
+        outbox.stop()
+    """
+
+    def __init__(self, api, path: str, workers: int = 4, max_attempts: int = 5, backoff: float = 1.0,
+                 on_ack=None, request_timeout: str = "00%3A02%3A00"):
+        """
+        :param api: BizService (или Orders)
+        :param path: путь к файлу SQLite
+        :param workers: число одновременных запросов Orders.add
+        :param max_attempts: число попыток отправки при сетевых ошибках и ответах 429 и 5xx
+        :param backoff: пауза перед повторной попыткой в секундах (удваивается с каждой попыткой)
+        :param on_ack: on_ack(key, result, error) - вызывается по порядку поступления заказов;
+            result - orderInfo при успехе, error - текст ошибки иначе; если on_ack выбросил исключение,
+            оно учитывается в errors и last_error, а заказ будет передан в on_ack повторно
+        :param request_timeout: request_timeout для Orders.add
+        """
+        self.api = api
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.on_ack = on_ack
+        self.request_timeout = request_timeout
+        self.errors = 0
+        self.last_error = None
+
+        self.__lock = threading.Lock()
+        self.__ack_lock = threading.Lock()
+        self.__wakeup = threading.Condition(self.__lock)
+        self.__finished = threading.Condition(self.__lock)
+        self.__stopped = True
+        self.__dispatcher = None
+        self.__executor = None
+        self.__in_flight = 0
+
+        self.__conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=FULL")
+        self.__conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL UNIQUE, request TEXT NOT NULL, "
+            "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, not_before REAL NOT NULL DEFAULT 0, "
+            "result TEXT, error TEXT, acked INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL, updated REAL NOT NULL)")
+        self.__conn.execute("CREATE INDEX IF NOT EXISTS outbox_status ON outbox (status, seq)")
+        # восстановление после падения: неподтвержденные отправки повторяются
+        self.__conn.execute("UPDATE outbox SET status = ? WHERE status = ?", (PENDING, INFLIGHT))
+
+    def _prepare(self, order_request: dict, idempotency_key: str = None) -> tuple:
+        order = order_request.get("order") if order_request is not None else None
+        if order is None:
+            raise ParamSetException(self.__class__.__qualname__,
+                                    self.submit.__name__,
+                                    "[ERROR] Не присвоен обязательный параметр: \"order_request\" с объектом \"order\"")
+        key = idempotency_key or order.get("id") or str(uuid.uuid4())
+        # order_request вызывающего не меняется: ключ записывается в копию
+        return key, json.dumps({**order_request, "order": {**order, "id": key}}, ensure_ascii=False)
+
+    def submit(self, order_request: dict, idempotency_key: str = None) -> str:
+        """
+        Принять заказ в очередь
+
+        :param order_request: Запрос на создание заказа
+        :param idempotency_key: идентификатор заказа, по умолчанию order_request["order"]["id"] или новый uuid
+        :return: ключ идемпотентности (идентификатор заказа); повторный submit с тем же ключом
+            не создает новую запись
+        """
+        return self.submit_many([order_request], [idempotency_key])[0]
+
+    def submit_many(self, order_requests: list, idempotency_keys: list = None) -> list:
+        """Принять пачку заказов одной транзакцией (для пиковой нагрузки)"""
+        if idempotency_keys is None:
+            idempotency_keys = [None] * len(order_requests)
+        if len(idempotency_keys) != len(order_requests):
+            raise ValueError(f"Число ключей ({len(idempotency_keys)}) не совпадает с числом заказов "
+                             f"({len(order_requests)})")
+        rows = [self._prepare(request, key) for request, key in zip(order_requests, idempotency_keys)]
+        now = time.time()
+        with self.__lock:
+            self.__conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.__conn.executemany(
+                    "INSERT OR IGNORE INTO outbox (key, request, status, created, updated) VALUES (?, ?, ?, ?, ?)",
+                    [(key, request, PENDING, now, now) for key, request in rows])
+                self.__conn.execute("COMMIT")
+            except BaseException:
+                self.__conn.execute("ROLLBACK")
+                raise
+            self.__wakeup.notify_all()
+        return [key for key, _ in rows]
+
+    def status(self, key: str) -> dict:
+        """
+        Состояние заказа в очереди
+        :return: {"status", "attempts", "result", "error"} или None, если ключ неизвестен
+        """
+        with self.__lock:
+            row = self.__conn.execute("SELECT status, attempts, result, error FROM outbox WHERE key = ?",
+                                      (key,)).fetchone()
+        if row is None:
+            return None
+        return {"status": row[0], "attempts": row[1],
+                "result": json.loads(row[2]) if row[2] is not None else None, "error": row[3]}
+
+    def counts(self) -> dict:
+        """Количество заказов по статусам"""
+        with self.__lock:
+            return dict(self.__conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+
+    def wait(self, key: str, timeout: float = None) -> dict:
+        """Дождаться завершения отправки заказа (done или failed)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.__lock:
+            while True:
+                row = self.__conn.execute("SELECT status FROM outbox WHERE key = ?", (key,)).fetchone()
+                if row is None or row[0] in (DONE, FAILED):
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.__finished.wait(remaining)
+        return self.status(key)
+
+    def start(self):
+        """Запустить отправку заказов в фоновых потоках"""
+        with self.__lock:
+            if not self.__stopped:
+                return
+            self.__stopped = False
+        self._ack()
+        self.__executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pyiikoapi-outbox")
+        self.__dispatcher = threading.Thread(target=self._dispatch, name="pyiikoapi-outbox", daemon=True)
+        self.__dispatcher.start()
+
+    def stop(self, wait: bool = True):
+        """Остановить отправку; незавершенные заказы будут отправлены после следующего start()"""
+        with self.__lock:
+            self.__stopped = True
+            self.__wakeup.notify_all()
+        if self.__dispatcher is not None:
+            self.__dispatcher.join()
+            self.__dispatcher = None
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=wait)
+            self.__executor = None
+
+    def close(self):
+        self.stop()
+        self.__conn.close()
+
+    def _dispatch(self):
+        while True:
+            with self.__lock:
+                while True:
+                    if self.__stopped:
+                        return
+                    free = self.workers - self.__in_flight
+                    rows = []
+                    if free > 0:
+                        rows = self.__conn.execute(
+                            "SELECT seq, key, request, attempts FROM outbox "
+                            "WHERE status = ? AND not_before <= ? ORDER BY seq LIMIT ?",
+                            (PENDING, time.time(), free)).fetchall()
+                    if rows:
+                        break
+                    self.__wakeup.wait(self._next_retry_delay() if free > 0 else None)
+                now = time.time()
+                self.__conn.executemany("UPDATE outbox SET status = ?, attempts = attempts + 1, updated = ? "
+                                        "WHERE seq = ?", [(INFLIGHT, now, row[0]) for row in rows])
+                self.__in_flight += len(rows)
+            for seq, key, request, attempts in rows:
+                self.__executor.submit(self._send, seq, key, request, attempts + 1)
+
+    def _next_retry_delay(self):
+        row = self.__conn.execute("SELECT MIN(not_before) FROM outbox WHERE status = ?", (PENDING,)).fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def _existing(self, key: str):
+        """orderInfo заказа key, если он уже создан в iiko, иначе None"""
+        try:
+            info = self.api.info(key, request_timeout=self.request_timeout)
+        except BizException:
+            return None
+        if isinstance(info, dict) and str(info.get("orderId", "")).lower() == key.lower():
+            return info
+        return None
+
+    def _send(self, seq: int, key: str, request: str, attempt: int):
+        status, result, error, not_before = DONE, None, None, 0.0
+        retry = False
+        try:
+            result = self.api.add(json.loads(request), request_timeout=self.request_timeout)
+            http_status = response_status()
+            if not isinstance(result, dict) or "orderId" not in result:
+                error = f"HTTP {http_status}: {json.dumps(result, ensure_ascii=False)}"
+                if http_status is not None and (http_status == 429 or http_status >= 500):
+                    retry = True
+                else:
+                    existing = self._existing(key)
+                    if existing is not None:
+                        result, error = existing, None
+                    else:
+                        status = FAILED
+        except BizException as err:
+            error = str(err)
+            retry = True
+        except Exception as err:
+            status, error = FAILED, repr(err)
+        if retry:
+            if attempt < self.max_attempts:
+                status, not_before = PENDING, time.time() + self.backoff * 2 ** (attempt - 1)
+                count_event(self.api, "orders/add", "retry")
+            else:
+                status = FAILED
+
+        with self.__lock:
+            self.__conn.execute(
+                "UPDATE outbox SET status = ?, result = ?, error = ?, not_before = ?, updated = ? WHERE seq = ?",
+                (status, json.dumps(result, ensure_ascii=False) if status == DONE else None, error, not_before,
+                 time.time(), seq))
+            self.__in_flight -= 1
+            self.__wakeup.notify_all()
+            if status != PENDING:
+                self.__finished.notify_all()
+        if status != PENDING:
+            self._ack()
+
+    def _ack(self):
+        """Передать в on_ack завершенные заказы, перед которыми нет незавершенных"""
+        with self.__ack_lock:
+            with self.__lock:
+                first_open = self.__conn.execute(
+                    "SELECT MIN(seq) FROM outbox WHERE status IN (?, ?)", (PENDING, INFLIGHT)).fetchone()[0]
+                query = "SELECT seq, key, status, result, error FROM outbox WHERE acked = 0"
+                params = ()
+                if first_open is not None:
+                    query += " AND seq < ?"
+                    params = (first_open,)
+                rows = self.__conn.execute(query + " ORDER BY seq", params).fetchall()
+            for seq, key, status, result, error in rows:
+                if self.on_ack is not None:
+                    try:
+                        self.on_ack(key, json.loads(result) if result is not None else None, error)
+                    except Exception as err:
+                        # порядок подтверждений сохраняется: заказ и следующие за ним уйдут в on_ack повторно
+                        self.errors += 1
+                        self.last_error = err
+                        break
+                with self.__lock:
+                    self.__conn.execute("UPDATE outbox SET acked = 1 WHERE seq = ?", (seq,))
+
+    def purge(self, older_than: float = 86400.0) -> int:
+        """Удалить подтвержденные записи старше older_than секунд"""
+        with self.__lock:
+            cursor = self.__conn.execute("DELETE FROM outbox WHERE acked = 1 AND updated < ?",
+                                         (time.time() - older_than,))
+            return cursor.rowcount
@@ -0,0 +1,220 @@
+import threading
+import time
+from datetime import datetime as dt
+from datetime import timedelta as td
+
+from .exception import BizException
+
+# Интервал опроса (секунды) по статусу доставки (statusCode в orderInfo)
+DEFAULT_INTERVALS = {
+    "UNCONFIRMED": 5.0,
+    "NEW": 5.0,
+    "WAITING": 10.0,
+    "ON_WAY": 15.0,
+    "DELIVERED": 60.0,
+    None: 5.0,
+}
+# Статусы, после которых заказ больше не отслеживается
+FINAL_STATUSES = ("CLOSED", "CANCELLED")
+
+
+class _Watched:
+    __slots__ = ("order_id", "terminal_id", "status", "info", "interval", "next_poll")
+
+    def __init__(self, order_id: str, terminal_id: str, status: str):
+        self.order_id = order_id
+        self.terminal_id = terminal_id
+        self.status = status
+        self.info = None
+        self.interval = None
+        self.next_poll = 0.0
+
+
+def order_status(order_info: dict) -> str:
+    """Код статуса доставки из orderInfo (statusCode, иначе status)"""
+    if not order_info:
+        return None
+    return order_info.get("statusCode") or order_info.get("status")
+
+
+def order_terminal(order_info: dict) -> str:
+    terminal = (order_info or {}).get("deliveryTerminal")
+    if isinstance(terminal, dict):
+        return terminal.get("deliveryTerminalId")
+    return terminal
+
+
+class OrderTracker:
+    """
+    Отслеживание статусов набора заказов.
+
+    Вместо Orders.info по каждому заказу при каждом опросе трекер:
+        - опрашивает заказ с частотой, зависящей от статуса (NEW часто, DELIVERED редко),
+          а если статус не меняется, постепенно увеличивает интервал до max_backoff раз;
+        - когда на терминале доставки к опросу готово batch_threshold и больше заказов,
+          делает один запрос Orders.delivery_orders за окно дат вместо N запросов Orders.info;
+        - перестает отслеживать заказы в статусах CLOSED и CANCELLED.
+    Стоимость отслеживания растет с числом изменений статусов, а не с числом открытых заказов.
+
+    Пример:
+        tracker = OrderTracker(api, on_change=lambda order_id, old, new, info: ...)
+        tracker.watch(order_id, terminal_id)
+        tracker.start()
+    """
+
+    def __init__(self, api, on_change=None, intervals: dict = None, max_backoff: float = 4.0,
+                 batch_threshold: int = 3, window_days: int = 1, date_format: str = "%Y-%m-%d"):
+        """
+        :param api: BizService (или Orders)
+        :param on_change: on_change(order_id, old_status, new_status, order_info); исключение из on_change
+            не останавливает опрос, оно учитывается в errors и сохраняется в last_error
+        :param intervals: интервалы опроса по статусам, дополняют DEFAULT_INTERVALS
+        :param max_backoff: во сколько раз может вырасти интервал опроса при неизменном статусе
+        :param batch_threshold: с какого числа заказов терминала использовать delivery_orders
+        :param window_days: окно delivery_orders: от сегодня - window_days до завтра
+        :param date_format: формат dateFrom/dateTo
+        """
+        self.api = api
+        self.on_change = on_change
+        self.intervals = dict(DEFAULT_INTERVALS)
+        if intervals is not None:
+            self.intervals.update(intervals)
+        self.max_backoff = max_backoff
+        self.batch_threshold = batch_threshold
+        self.window_days = window_days
+        self.date_format = date_format
+        self.errors = 0
+        self.last_error = None
+
+        self.__lock = threading.Lock()
+        self.__orders = {}
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def watch(self, order_id: str, terminal_id: str = None, status: str = None):
+        """Начать отслеживать заказ (terminal_id позволяет опрашивать его пачкой с заказами терминала)"""
+        with self.__lock:
+            if order_id not in self.__orders:
+                self.__orders[order_id] = _Watched(order_id, terminal_id, status)
+
+    def unwatch(self, order_id: str):
+        with self.__lock:
+            self.__orders.pop(order_id, None)
+
+    def watched(self) -> dict:
+        """Отслеживаемые заказы и их последние статусы {order_id: status}"""
+        with self.__lock:
+            return {order_id: item.status for order_id, item in self.__orders.items()}
+
+    def _interval(self, status: str) -> float:
+        return self.intervals.get(status, self.intervals[None])
+
+    def _due(self, now: float) -> dict:
+        groups = {}
+        with self.__lock:
+            for item in self.__orders.values():
+                if item.next_poll <= now:
+                    groups.setdefault(item.terminal_id, []).append(item)
+        return groups
+
+    def _fetch_window(self, terminal_id: str) -> dict:
+        today = dt.now()
+        response = self.api.delivery_orders(
+            (today - td(days=self.window_days)).strftime(self.date_format),
+            (today + td(days=1)).strftime(self.date_format),
+            delivery_terminal_id=terminal_id)
+        orders = response.get("deliveryOrders") if isinstance(response, dict) else response
+        return {order.get("orderId"): order for order in orders or ()}
+
+    def poll(self) -> list:
+        """
+        Один цикл опроса заказов, время опроса которых наступило
+
+        :return: [(order_id, old_status, new_status, order_info), ...] изменения статусов
+        """
+        now = time.monotonic()
+        fetched = {}
+        failed = []
+        for terminal_id, items in self._due(now).items():
+            window = {}
+            if len(items) >= self.batch_threshold:
+                try:
+                    window = self._fetch_window(terminal_id)
+                except BizException:
+                    window = {}
+            for item in items:
+                info = window.get(item.order_id)
+                if info is None:
+                    try:
+                        info = self.api.info(item.order_id)
+                    except BizException:
+                        failed.append(item.order_id)
+                        continue
+                # тело ошибки iiko вместо orderInfo не должно менять статус заказа
+                if not isinstance(info, dict) or not info.get("orderId") or order_status(info) is None:
+                    failed.append(item.order_id)
+                    continue
+                fetched[item.order_id] = info
+
+        changes = []
+        with self.__lock:
+            for order_id in failed:
+                item = self.__orders.get(order_id)
+                if item is not None:
+                    item.next_poll = now + (item.interval or self._interval(item.status))
+            for order_id, info in fetched.items():
+                item = self.__orders.get(order_id)
+                if item is None:
+                    continue
+                status = order_status(info)
+                old = item.status
+                item.info = info
+                if item.terminal_id is None:
+                    item.terminal_id = order_terminal(info)
+                if status != old or item.interval is None:
+                    item.interval = self._interval(status)
+                else:
+                    item.interval = min(item.interval * 1.5, self._interval(status) * self.max_backoff)
+                item.status = status
+                item.next_poll = now + item.interval
+                if status != old:
+                    changes.append((order_id, old, status, info))
+                if status in FINAL_STATUSES:
+                    del self.__orders[order_id]
+
+        if self.on_change is not None:
+            for change in changes:
+                try:
+                    self.on_change(*change)
+                except Exception as err:
+                    self.errors += 1
+                    self.last_error = err
+        return changes
+
+    def next_poll_in(self) -> float:
+        """Через сколько секунд наступит время опроса ближайшего заказа"""
+        with self.__lock:
+            if not self.__orders:
+                return None
+            return max(0.0, min(item.next_poll for item in self.__orders.values()) - time.monotonic())
+
+    def run(self, idle: float = 1.0):
+        """Опрашивать заказы в текущем потоке до вызова stop()"""
+        while not self.__stop.is_set():
+            self.poll()
+            delay = self.next_poll_in()
+            self.__stop.wait(idle if delay is None else max(0.05, min(delay, idle * 10)))
+
+    def start(self):
+        """Запустить опрос в фоновом потоке"""
+        if self.__thread is not None:
+            return
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.run, name="pyiikoapi-tracker", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
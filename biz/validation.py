@@ -0,0 +1,376 @@
+import threading
+import time
+
+from ..core import is_data
+from ..metrics import count_event
+from .exception import BizException
+
+ACCEPT = "accept"
+REJECT = "reject"
+UNKNOWN = "unknown"
+
+# методы API справочников (pyiikoapi.core.endpoint_name) для счетчиков cache_hit/cache_miss
+ENDPOINTS = {
+    "nomenclature": "nomenclature/{id}",
+    "stop_list": "stopLists/getDeliveryStopList",
+    "terminals": "deliverySettings/getDeliveryTerminals",
+    "restrictions": "deliverySettings/getDeliveryRestrictions",
+}
+
+
+class ValidationResult:
+    """
+    Результат проверки заказа
+
+    decision - ACCEPT, REJECT или UNKNOWN (локально решить нельзя)
+    problems - [{"code", "message", "id"}, ...] причины отказа
+    unknown - [{"code", "message", "id"}, ...] то, что не удалось проверить локально
+    remote - ответ Orders.check_create, если проверка дошла до сервера
+    """
+    __slots__ = ("decision", "problems", "unknown", "remote")
+
+    def __init__(self, decision: str, problems: list = None, unknown: list = None, remote: dict = None):
+        self.decision = decision
+        self.problems = problems or []
+        self.unknown = unknown or []
+        self.remote = remote
+
+    @property
+    def ok(self) -> bool:
+        return self.decision == ACCEPT
+
+    def __repr__(self):
+        return f"ValidationResult({self.decision!r}, problems={self.problems!r}, unknown={self.unknown!r})"
+
+
+def _problem(code: str, message: str, item_id: str = None) -> dict:
+    return {"code": code, "message": message, "id": item_id}
+
+
+def _number(value, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class _Menu:
+    """Номенклатура, разобранная для проверки заказов"""
+    __slots__ = ("products", "codes")
+
+    def __init__(self, nomenclature: dict):
+        if not is_data(nomenclature, "products", required=("revision",)) or not nomenclature["products"]:
+            raise ValueError(f"Неожиданный ответ nomenclature: {nomenclature!r:.200}")
+        self.products = {}
+        self.codes = {}
+        for product in nomenclature["products"]:
+            self.products[product.get("id")] = product
+            if product.get("code"):
+                self.codes[product["code"]] = product
+
+    def product(self, item: dict) -> dict:
+        product = self.products.get(item.get("id"))
+        if product is None and item.get("code"):
+            product = self.codes.get(item["code"])
+        return product
+
+
+def _stop_list(response) -> dict:
+    """{deliveryTerminalId: {productId: balance}}"""
+    if isinstance(response, dict):
+        response = response.get("stopList")
+    if not isinstance(response, list):
+        raise ValueError(f"Неожиданный ответ get_delivery_stop_list: {response!r:.200}")
+    result = {}
+    for terminal in response:
+        balances = result.setdefault(terminal.get("deliveryTerminalId"), {})
+        for item in terminal.get("items") or ():
+            balances[item.get("productId")] = _number(item.get("balance"))
+    return result
+
+
+def _terminals(response) -> set:
+    if isinstance(response, dict):
+        response = response.get("deliveryTerminals")
+    if not isinstance(response, list):
+        raise ValueError(f"Неожиданный ответ get_delivery_terminals: {response!r:.200}")
+    return {terminal.get("deliveryTerminalId") for terminal in response}
+
+
+def _delivery_restrictions(response) -> dict:
+    if not isinstance(response, dict) or not isinstance(response.get("restrictions"), list):
+        raise ValueError(f"Неожиданный ответ get_delivery_restrictions: {response!r:.200}")
+    return response
+
+
+class OrderValidator:
+    """
+    Локальная проверка заказа перед Orders.add.
+
+    Вместо Orders.check_create перед каждым заказом validate() проверяет order_request
+    по закэшированным номенклатуре, стоп-листу, доставочным терминалам и ограничениям доставки:
+        - продукт и модификаторы есть в номенклатуре и включены в меню;
+        - обязательные групповые модификаторы выбраны в допустимом количестве;
+        - продукт не в стоп-листе терминала (или хотя бы одного из возможных терминалов);
+        - терминал доставки существует;
+        - сумма заказа не меньше минимальной суммы доставки;
+        - адрес попадает в зону доставки (если задан zone_resolver).
+    Очевидные ошибки отклоняются без запроса к серверу. check_create() обращается к
+    Orders.check_create только если локально решить нельзя (UNKNOWN).
+
+    Пример:
+        validator = OrderValidator(api)
+        result = validator.check_create(order_request)
+        if result.ok:
+            api.add(order_request)
+    """
+
+    def __init__(self, api, ttl: float = 300.0, stop_list_ttl: float = 30.0, zone_resolver=None,
+                 check_address: bool = True):
+        """
+        :param api: BizService
+        :param ttl: время жизни кэша номенклатуры, терминалов и ограничений доставки в секундах
+        :param stop_list_ttl: время жизни кэша стоп-листа в секундах
+        :param zone_resolver: zone_resolver(order_request) - ограничения доставки (restrictions),
+            в зоны которых попадает адрес заказа: [] - адрес вне зон доставки, None - определить нельзя
+        :param check_address: False - не проверять адрес (например, он уже проверен при оформлении)
+        """
+        self.api = api
+        self.ttl = ttl
+        self.stop_list_ttl = stop_list_ttl
+        self.zone_resolver = zone_resolver
+        self.check_address = check_address
+
+        self.__lock = threading.Lock()
+        self.__cache = {}
+        self.__stats = {ACCEPT: 0, REJECT: 0, UNKNOWN: 0, "remote": 0}
+
+    def _load(self, name: str, loader, parse, ttl: float, force: bool = False):
+        with self.__lock:
+            entry = self.__cache.get(name)
+        now = time.monotonic()
+        if entry is not None and not force and now - entry[1] < ttl:
+            count_event(self.api, ENDPOINTS[name], "cache_hit")
+            return entry[0]
+        count_event(self.api, ENDPOINTS[name], "cache_miss")
+        try:
+            value = parse(loader())
+        except (BizException, ValueError):
+            # сервер недоступен или вернул ошибку - работаем по устаревшим данным, если они есть
+            return entry[0] if entry is not None else None
+        with self.__lock:
+            self.__cache[name] = (value, now)
+        return value
+
+    def _menu(self, force: bool = False) -> _Menu:
+        return self._load("nomenclature", self.api.nomenclature, _Menu, self.ttl, force)
+
+    def _stopped(self, force: bool = False) -> dict:
+        return self._load("stop_list", self.api.get_delivery_stop_list, _stop_list, self.stop_list_ttl, force)
+
+    def _terminal_ids(self, force: bool = False) -> set:
+        return self._load("terminals", self.api.get_delivery_terminals, _terminals, self.ttl, force)
+
+    def _restrictions(self, force: bool = False) -> dict:
+        return self._load("restrictions", self.api.get_delivery_restrictions, _delivery_restrictions, self.ttl, force)
+
+    def refresh(self):
+        """Принудительно перечитать все справочники"""
+        self._menu(True)
+        self._stopped(True)
+        self._terminal_ids(True)
+        self._restrictions(True)
+
+    def invalidate(self, name: str = None):
+        """Сбросить кэш справочника ("nomenclature", "stop_list", "terminals", "restrictions") или все"""
+        with self.__lock:
+            if name is None:
+                self.__cache.clear()
+            else:
+                self.__cache.pop(name, None)
+
+    def stats(self) -> dict:
+        """Сколько заказов принято, отклонено и не решено локально, сколько раз вызван check_create"""
+        with self.__lock:
+            return dict(self.__stats)
+
+    def validate(self, order_request: dict) -> ValidationResult:
+        """
+        Проверить заказ локально, без Orders.check_create
+
+        :param order_request: Запрос на создание заказа (как для Orders.add)
+        :return: ValidationResult
+        """
+        problems, unknown = [], []
+        order = (order_request or {}).get("order")
+        if not order:
+            problems.append(_problem("order", "Нет объекта \"order\""))
+            return self._result(REJECT, problems, unknown)
+        items = order.get("items") or []
+        if not items:
+            problems.append(_problem("items", "Заказ без позиций"))
+
+        self_service = order.get("isSelfService") in (True, "true")
+        terminal_id = order_request.get("deliveryTerminalId") or order.get("deliveryTerminalId")
+        restrictions = self._restrictions()
+
+        zones = None
+        if not self_service and self.check_address:
+            zones = self._zones(order_request)
+            if zones is None:
+                unknown.append(_problem("address", "Зона доставки адреса не определена локально"))
+            elif not zones:
+                problems.append(_problem("address", "Адрес вне зон доставки"))
+            elif terminal_id is not None:
+                zones = [zone for zone in zones if zone.get("deliveryTerminalId") == terminal_id] or zones
+
+        terminals = self._terminal_ids()
+        if terminal_id is not None and terminals is not None and terminal_id not in terminals:
+            problems.append(_problem("terminal", "Неизвестный терминал доставки", terminal_id))
+
+        menu = self._menu()
+        amounts = {}
+        order_sum = 0.0
+        if menu is None:
+            unknown.append(_problem("nomenclature", "Номенклатура недоступна"))
+        else:
+            for item in items:
+                order_sum += self._check_item(menu, item, amounts, problems, unknown)
+
+        if terminal_id is not None:
+            candidates = {terminal_id}
+        elif zones:
+            candidates = {zone.get("deliveryTerminalId") for zone in zones}
+        else:
+            candidates = terminals
+        self._check_stop_list(amounts, candidates, problems, unknown)
+
+        if not self_service and menu is not None:
+            self._check_min_sum(order_sum, restrictions, zones, terminal_id, problems, unknown)
+
+        if problems:
+            return self._result(REJECT, problems, unknown)
+        return self._result(UNKNOWN if unknown else ACCEPT, problems, unknown)
+
+    def _zones(self, order_request: dict):
+        """Зоны доставки адреса заказа по zone_resolver; None, если определить нельзя"""
+        if self.zone_resolver is None:
+            return None
+        try:
+            return self.zone_resolver(order_request)
+        except BizException:
+            return None
+
+    def _result(self, decision: str, problems: list, unknown: list) -> ValidationResult:
+        with self.__lock:
+            self.__stats[decision] += 1
+        return ValidationResult(decision, problems, unknown)
+
+    def _check_item(self, menu: _Menu, item: dict, amounts: dict, problems: list, unknown: list) -> float:
+        """Проверить позицию заказа, вернуть ее сумму по ценам номенклатуры"""
+        product = menu.product(item)
+        item_id = item.get("id") or item.get("code")
+        if product is None:
+            problems.append(_problem("product", f"Продукт \"{item.get('name') or item_id}\" отсутствует в номенклатуре",
+                                     item_id))
+            return 0.0
+        item_id = product.get("id")
+        if product.get("isIncludedInMenu") is False:
+            problems.append(_problem("menu", f"Продукт \"{product.get('name')}\" не включен в меню", item_id))
+        amount = _number(item.get("amount"), 1.0)
+        if amount <= 0:
+            problems.append(_problem("amount", f"Неверное количество продукта \"{product.get('name')}\"", item_id))
+        amounts[item_id] = amounts.get(item_id, 0.0) + amount
+        item_sum = _number(product.get("price"), _number(item.get("sum"))) * amount
+
+        singles = {modifier.get("modifierId"): modifier for modifier in product.get("modifiers") or ()}
+        groups = {group.get("modifierId"): group for group in product.get("groupModifiers") or ()}
+        children = {child.get("modifierId"): group_id for group_id, group in groups.items()
+                    for child in group.get("childModifiers") or ()}
+        totals = {}
+        for modifier in item.get("modifiers") or ():
+            modifier_id = modifier.get("id")
+            modifier_amount = _number(modifier.get("amount"), 1.0)
+            group_id = modifier.get("groupId") or children.get(modifier_id)
+            if group_id is not None:
+                if group_id not in groups or modifier_id not in children:
+                    unknown.append(_problem("modifier", "Модификатор не найден в группах продукта", modifier_id))
+                totals[group_id] = totals.get(group_id, 0.0) + modifier_amount
+            elif modifier_id in singles:
+                totals[modifier_id] = totals.get(modifier_id, 0.0) + modifier_amount
+            else:
+                unknown.append(_problem("modifier", "Модификатор не найден у продукта", modifier_id))
+            modifier_product = menu.products.get(modifier_id)
+            if modifier_product is not None:
+                amounts[modifier_id] = amounts.get(modifier_id, 0.0) + modifier_amount * amount
+                item_sum += _number(modifier_product.get("price")) * modifier_amount * amount
+
+        for modifier_id, modifier in list(singles.items()) + list(groups.items()):
+            total = totals.get(modifier_id, 0.0)
+            minimum = max(_number(modifier.get("minAmount")), 1.0 if modifier.get("required") else 0.0)
+            maximum = _number(modifier.get("maxAmount"))
+            if total < minimum:
+                problems.append(_problem("modifier", f"Не выбран обязательный модификатор продукта "
+                                                     f"\"{product.get('name')}\"", modifier_id))
+            elif maximum > 0 and total > maximum:
+                problems.append(_problem("modifier", f"Превышено количество модификатора продукта "
+                                                     f"\"{product.get('name')}\"", modifier_id))
+        return item_sum
+
+    def _check_stop_list(self, amounts: dict, candidates, problems: list, unknown: list):
+        stopped = self._stopped()
+        if stopped is None:
+            unknown.append(_problem("stop_list", "Стоп-лист недоступен"))
+            return
+        if not candidates:
+            candidates = set(stopped)
+        if not candidates:
+            return
+        for product_id, amount in amounts.items():
+            short = [terminal for terminal in candidates
+                     if product_id in stopped.get(terminal, ()) and stopped[terminal][product_id] < amount]
+            if len(short) == len(candidates):
+                problems.append(_problem("stop_list", "Продукт в стоп-листе", product_id))
+            elif short:
+                unknown.append(_problem("stop_list", "Продукт в стоп-листе части терминалов", product_id))
+
+    def _check_min_sum(self, order_sum: float, restrictions: dict, zones, terminal_id: str,
+                       problems: list, unknown: list):
+        if not restrictions:
+            unknown.append(_problem("restrictions", "Ограничения доставки недоступны"))
+            return
+        if restrictions.get("useSameMinSum"):
+            min_sums = [_number(restrictions.get("defaultMinSum"))]
+        else:
+            if zones:
+                rules = zones
+            else:
+                rules = [rule for rule in restrictions.get("restrictions") or ()
+                         if terminal_id is None or rule.get("deliveryTerminalId") == terminal_id]
+            min_sums = [_number(rule.get("minSum")) for rule in rules]
+        if not min_sums:
+            return
+        if order_sum < min(min_sums):
+            problems.append(_problem("min_sum", f"Сумма заказа {order_sum:g} меньше минимальной {min(min_sums):g}"))
+        elif order_sum < max(min_sums):
+            unknown.append(_problem("min_sum", "Минимальная сумма зависит от зоны доставки"))
+
+    def check_create(self, order_request: dict, request_timeout: str = "00%3A02%3A00") -> ValidationResult:
+        """
+        Проверить заказ локально и, если решить нельзя, через Orders.check_create
+
+        :param order_request: Запрос на создание заказа
+        :param request_timeout: request_timeout для Orders.check_create
+        :return: ValidationResult; при обращении к серверу ответ в ValidationResult.remote
+        """
+        result = self.validate(order_request)
+        if result.decision != UNKNOWN:
+            return result
+        with self.__lock:
+            self.__stats["remote"] += 1
+        remote = self.api.check_create(order_request, request_timeout=request_timeout)
+        if isinstance(remote, dict) and remote.get("resultState") == 0:
+            return ValidationResult(ACCEPT, unknown=result.unknown, remote=remote)
+        problem = remote.get("problem") if isinstance(remote, dict) else None
+        return ValidationResult(REJECT, [_problem("remote", problem or "Заказ отклонен Orders.check_create")],
+                                result.unknown, remote)
@@ -10,9 +10,10 @@ from .exception import PostException
 from .exception import SetSession
 from .exception import TokenException
 from .exception import ParamSetException
+from ..core import RequestCore
 
 
-class Auth:
+class Auth(RequestCore):
     """
     Если не был присвоен кастомный session то по стандарту header будет равняться:
         {
@@ -25,15 +26,21 @@ class Auth:
     BASE_URL = "https://iiko.biz"
     PORT = ":9900"
 
-    def __init__(self, login: str, password: str, org: str, session: requests.Session = None):
-        self.__session = requests.Session()
-        self.__session.headers = {
-            'ContentType': 'application/json',
-            'Accept': 'application/json',
-            'Content-Encoding': 'utf-8'
-        }
-        if session is not None:
-            self.__session = session
+    def __init__(self, login: str, password: str, org: str, session: requests.Session = None,
+                 lazy_token: bool = False, token_cache=None):
+        """
+        :param lazy_token: не запрашивать маркер доступа при инициализации, он будет получен при первом вызове метода
+        :param token_cache: кэш маркеров доступа (pyiikoapi.tokencache.FileTokenCache), из которого маркер
+            восстанавливается без запроса к серверу
+        """
+        if session is None:
+            session = requests.Session()
+            session.headers = {
+                'ContentType': 'application/json',
+                'Accept': 'application/json',
+                'Content-Encoding': 'utf-8'
+            }
+        self.__session = session
 
         self.__login = login
         self.__password = password
@@ -42,19 +49,37 @@ class Auth:
         self.__token_user = None
         self.__time_token = None
         self.__base_url = f"{self.BASE_URL}{self.PORT}"
-        self.access_token()
+        self.__lazy_token = lazy_token
+        self.__token_cache = token_cache
+        if not lazy_token and not self.restore_token():
+            self.access_token()
 
     def check_token_time(self) -> bool:
         """
         Проверка на время жизни маркера доступа
         :return: Если прошло 15 мин будет запрошен токен и метод вернёт True, иначе вернётся False
         """
+        if self.__time_token is None and self.__lazy_token:
+            if not self.restore_token():
+                self.access_token()
+            return True
         fifteen_minutes_ago = dt.now() - td(minutes=15)
         time_token = self.__time_token
         # if self.__token and self.__time_token:
         try:
             if time_token <= fifteen_minutes_ago:
-                print(f"Update token: {self.access_token()}")
+                degraded = self.degraded
+                if degraded is not None and self.token is not None and degraded.down(self.base_url):
+                    # iiko недоступен (идет период hold) - не ждем таймаута обновления маркера
+                    return False
+                try:
+                    print(f"Update token: {self.access_token()}")
+                except TokenException as err:
+                    # iiko недоступен: в деградированном режиме методы чтения работают со старым маркером
+                    if degraded is None or self.token is None:
+                        raise
+                    degraded.report(self.base_url, err.__context__)
+                    return False
                 return True
             else:
                 return False
@@ -112,6 +137,27 @@ class Auth:
     def base_url(self, value: str):
         self.__base_url = value
 
+    def _token_cache_key(self) -> str:
+        return f"{self.__base_url}|{self.__login}"
+
+    def restore_token(self) -> bool:
+        """
+        Восстановить маркер доступа из token_cache
+        :return: True если в кэше найден маркер, время жизни которого не прошло
+        """
+        if self.__token_cache is None:
+            return False
+        cached = self.__token_cache.get(self._token_cache_key())
+        if not cached:
+            return False
+        token, issued_at = cached
+        time_token = dt.fromtimestamp(issued_at)
+        if time_token <= dt.now() - td(minutes=15):
+            return False
+        self.__token = token
+        self.__time_token = time_token
+        return True
+
     def access_token(self):
         """
         Получить маркер доступа апи логина
@@ -119,10 +165,12 @@ class Auth:
 
         """
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/auth/access_token?user_id={self.login}&user_secret={self.password}')
             self.__token = result.text[1:-1]
             self.__time_token = dt.now()
+            if self.__token_cache is not None:
+                self.__token_cache.set(self._token_cache_key(), self.__token, self.__time_token.timestamp())
 
         except requests.exceptions.RequestException as err:
             raise TokenException(self.__class__.__qualname__,
@@ -137,10 +185,10 @@ class Auth:
         """
         # /api/0/auth/echo?msg={msg}&access_token={accessToken}
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/auth/echo?msg={msg}&access_token={self.token}')
 
-            if result.text != msg:
+            if result.text.strip('"') != msg:
                 return False
             return True
 
@@ -155,7 +203,7 @@ class Auth:
         """
         # /api/0/auth/biz_access_token?user_ext_id={bizUserExtAppKey}
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/auth/biz_access_token?user_ext_id={biz_user_ext_app_key}')
             self.__token_user = result.text[1:-1]
             return result.text[1:-1]
@@ -175,10 +223,10 @@ class Auth:
         """
         # applicationMarket/userInfo?api_access_token={apiAccessToken}&biz_access_token={bizAccessToken}
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/applicationMarket/userInfo?api_access_token={self.token}'
                 f'&biz_access_token={self.token_user}')
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise GetException(self.__class__.__qualname__,
                                self.api_access_token.__name__,
@@ -205,9 +253,9 @@ class Organization(Auth):
         # /api/0/organization/list?access_token={accessToken}&request_timeout={requestTimeout}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/organization/list?access_token={self.token}', params=params)
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise GetException(self.__class__.__qualname__,
                                self.list.__name__,
@@ -224,9 +272,9 @@ class Organization(Auth):
         # /api/0/organization/organizationId?access_token={accessToken}&request_timeout={requestTimeout}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/organization/organizationId?access_token={self.token}', params=params)
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise GetException(self.__class__.__qualname__,
                                self.organization_id.__name__,
@@ -242,9 +290,9 @@ class Organization(Auth):
         # applicationMarket/usersOrganizations?api_access_token={apiAccessToken}
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}applicationMarket/usersOrganizations?api_access_token={self.token}', json=user_id)
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise PostException(self.__class__.__qualname__,
                                 self.user_organizations.__name__,
@@ -260,9 +308,9 @@ class Organization(Auth):
         # /api/0/organization/{organizationId}/corporate_nutritions?access_token={accessToken}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/organization/{self.org}/corporate_nutritions?access_token={self.token}')
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise GetException(self.__class__.__qualname__,
                                self.corporate_nutritions.__name__,
@@ -280,12 +328,12 @@ class Organization(Auth):
         # /api/0/orders/calculate_checkin_result?access_token={accessToken}
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/orders/calculate_checkin_result?access_token={self.token}',
-                data=order_request, )
-            return result.json()
+                json=order_request, )
+            return self._json(result)
         except requests.exceptions.RequestException as err:
-            raise GetException(self.__class__.__qualname__,
+            raise PostException(self.__class__.__qualname__,
                                self.calculate_checkin_result.__name__,
                                f"[ERROR] Не удалось рассчитать программу лояльности для заказа: \n{err}")
 
@@ -298,9 +346,9 @@ class Organization(Auth):
         # /api/0/orders/get_combos_info?access_token={accessToken}&organization={organizationId}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/orders/get_combos_info?access_token={self.token}&organization={self.org}')
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise GetException(self.__class__.__qualname__,
                                self.get_combos_info.__name__,
@@ -316,10 +364,10 @@ class Organization(Auth):
         # /api/0/orders/get_manual_condition_infos?access_token={accessToken}&organization={organizationId}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/orders/get_manual_condition_infos?access_token={self.token}'
                 f'&organization={self.org}')
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise GetException(self.__class__.__qualname__,
                                self.get_manual_condition_infos.__name__,
@@ -339,11 +387,11 @@ class Organization(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"get_combo_price_request\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/orders/check_and_get_combo_price?access_token={self.token}'
                 f'&organization={self.org}',
                 json=get_combo_price_request, )
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise PostException(self.__class__.__qualname__,
                                 self.check_and_get_combo_price.__name__,
@@ -364,7 +412,7 @@ class Organization(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"send_sms_request\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/organization/{self.org}/send_sms?access_token={self.token}',
                 json=send_sms_request)
             return result
@@ -390,7 +438,7 @@ class Organization(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"send_email_request\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/organization/{self.org}/send_email?access_token={self.token}',
                 json=send_email_request)
             return result
@@ -412,11 +460,11 @@ class Organization(Auth):
                                     self.corporate_nutrition_report.__name__,
                                     f"[ERROR] Не присвоен обязательный параметр: \"params\"")
         self.check_token_time()
-        params += {"access_token": self.token}
+        params = {**params, "access_token": self.token}
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/organization/{self.org}/corporate_nutrition_report', params=params)
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise GetException(self.__class__.__qualname__,
                                self.corporate_nutrition_report.__name__,
@@ -432,9 +480,9 @@ class Organization(Auth):
         # /api/0/organization/{organizationId}/guest_categories?access_token={accessToken}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/organization/{self.org}/guest_categories?access_token={self.token}')
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise GetException(self.__class__.__qualname__,
                                self.guest_categories.__name__,
@@ -458,10 +506,10 @@ class Customers(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"params\"")
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/customers/get_customer_by_phone?access_token={self.token}'
                 f'&organization={self.org}', params=params, timeout=timeout)
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise GetException(self.__class__.__qualname__,
                                self.get_customer_by_phone.__name__,
@@ -483,10 +531,10 @@ class Customers(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"params\"")
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/customers/get_customer_by_id?access_token={self.token}&organization={self.org}',
                 params=params, timeout=timeout)
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise GetException(self.__class__.__qualname__,
                                self.get_customer_by_id.__name__,
@@ -508,10 +556,10 @@ class Customers(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"params\"")
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/customers/get_customer_by_card?access_token={self.token}'
                 f'&organization={self.org}', params=params, timeout=timeout)
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise GetException(self.__class__.__qualname__,
                                self.get_customer_by_card.__name__,
@@ -536,10 +584,10 @@ class Customers(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"customer_for_import\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/customers/create_or_update?access_token={self.token}&organization={self.org}',
                 json=customer_for_import,timeout=timeout )
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise PostException(self.__class__.__qualname__,
                                 self.create_or_update.__name__,
@@ -562,7 +610,7 @@ class Customers(Auth):
                                     f"\"customer_id\" или \"category_id\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/customers/{customer_id}/add_category?access_token={self.token}'
                 f'&organization={self.org}&categoryId={category_id}')
             return result
@@ -588,7 +636,7 @@ class Customers(Auth):
                                     f"\"customer_id\" или \"category_id\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/customers/{customer_id}/add_category?access_token={self.token}'
                 f'&organization={self.org}&categoryId={category_id}')
             return result
@@ -618,7 +666,7 @@ class Customers(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"add_magnet_card_request\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/customers/{customer_id}/add_card?access_token={self.token}'
                 f'&organization={self.org}', json=add_magnet_card_request, )
             return result
@@ -648,7 +696,7 @@ class Customers(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"params\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/customers/{customer_id}/delete_card?access_token={self.token}'
                 f'&organization={self.org}', params=params, )
             return result
@@ -672,7 +720,7 @@ class Customers(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"api_change_balance_request\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/customers/refill_balance?access_token={self.token}',
                 json=api_change_balance_request, )
             return result
@@ -697,7 +745,7 @@ class Customers(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"api_change_balance_request\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/customers/withdraw_balance?access_token={self.token}',
                 json=api_change_balance_request, )
             return result
@@ -726,7 +774,7 @@ class Customers(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"params\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/customers/{customer_id}/add_to_nutrition_organization?access_token={self.token}'
                 f'&organization={self.org}', params=params)
             return result
@@ -755,7 +803,7 @@ class Customers(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"params\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/customers/{customer_id}/remove_from_nutrition_organization?'
                 f'access_token={self.token}&organization={self.org}', params=params)
             return result
@@ -782,10 +830,10 @@ class Customers(Auth):
         self.check_token_time()
 
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/customers/get_customers_by_organization_and_by_period?access_token={self.token}'
                 f'&organization={self.org}', params=params)
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise GetException(self.__class__.__qualname__,
                                self.get_customers_by_organization_and_by_period.__name__,
@@ -809,10 +857,10 @@ class Customers(Auth):
         self.check_token_time()
 
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/customers/get_categories_by_guests?access_token={self.token}'
                 f'&organization={self.org}', json=categories_request)
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise PostException(self.__class__.__qualname__,
                                 self.get_categories_by_guests.__name__,
@@ -838,10 +886,10 @@ class Customers(Auth):
         self.check_token_time()
 
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/customers/get_counters_by_guests?access_token={self.token}'
                 f'&organization={self.org}', json=counters_request)
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise PostException(self.__class__.__qualname__,
                                 self.get_counters_by_guests.__name__,
@@ -873,10 +921,10 @@ class Customers(Auth):
         self.check_token_time()
 
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/customers/get_balances_by_guests_and_wallet?access_token={self.token}'
                 f'&organization={self.org}', params=params, json=guest_wallets_request)
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise PostException(self.__class__.__qualname__,
                                 self.get_balances_by_guests_and_wallet.__name__,
@@ -897,17 +945,14 @@ class Customers(Auth):
             raise ParamSetException(self.__class__.__qualname__,
                                     self.transactions_report.__name__,
                                     f"[ERROR] Не присвоен обязательный параметр: \"params\"")
-        if user_id is None:
-            raise ParamSetException(self.__class__.__qualname__,
-                                    self.transactions_report.__name__,
-                                    f"[ERROR] Не присвоен обязательный параметр: \"user_id\"")
-        params += {"access_token": self.token, "userId": user_id}
         self.check_token_time()
+        params = {**params, "access_token": self.token}
+        if user_id is not None:
+            params["userId"] = user_id
         try:
-            result = self.session_s.get(
-                f'{self.base_url}/api/0/customers/get_balances_by_guests_and_wallet?access_token={self.token}'
-                f'&organization={self.org}', params=params, )
-            return result.json()
+            result = self._request("GET",
+                f'{self.base_url}/api/0/organization/{self.org}/transactions_report', params=params, )
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise GetException(self.__class__.__qualname__,
                                self.transactions_report.__name__,
@@ -938,10 +983,10 @@ class Customers(Auth):
                                     f"\"wallet_balance_changed_subscription_request\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/customers/subscribe_on_customer_balance?access_token={self.token}'
                 f'&organization={self.org}', json=wallet_balance_changed_subscription_request)
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise PostException(self.__class__.__qualname__,
                                 self.subscribe_on_customer_balance.__name__,
@@ -963,7 +1008,7 @@ class Customers(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"subscription_id\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/customers/unsubscribe_on_customer_balance?access_token={self.token}'
                 f'&subscription={subscription_id}')
             return result
@@ -983,9 +1028,9 @@ class Customers(Auth):
         # /api/0/customers/get_subscriptions_on_customer_balance?access_token={accessToken}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/customers/get_subscriptions_on_customer_balance?access_token={self.token}')
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise GetException(self.__class__.__qualname__,
                                self.get_subscriptions_on_customer_balance.__name__,
@@ -1007,10 +1052,10 @@ class Customers(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"guest_category_info\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/organization/{self.org}/create_or_update_guest_category?'
                 f'access_token={self.token}', json=guest_category_info)
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise PostException(self.__class__.__qualname__,
                                 self.create_or_update_guest_category.__name__,
@@ -1027,10 +1072,10 @@ class Customers(Auth):
         # /api/0/organization/programs?access_token={accessToken}&organization={organizationId}&network={networkId}
         self.check_token_time()
         try:
-            result = self.session_s.get(
+            result = self._request("GET",
                 f'{self.base_url}/api/0/organization/programs?access_token={self.token}&organization={self.org}',
                 params=params)
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise GetException(self.__class__.__qualname__,
                                self.programs.__name__,
@@ -1058,10 +1103,10 @@ class Customers(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"params\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/create_marketing_campaign?access_token={self.token}&organization={self.org}',
                 params=params, json=marketing_campaign_info)
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise PostException(self.__class__.__qualname__,
                                 self.create_marketing_campaign.__name__,
@@ -1089,10 +1134,10 @@ class Customers(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"params\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/organization/update_marketing_campaign?access_token={self.token}&'
                 f'organization={self.org}', params=params, json=marketing_campaign_info)
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise PostException(self.__class__.__qualname__,
                                 self.update_marketing_campaign.__name__,
@@ -1120,10 +1165,10 @@ class Customers(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"params\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/organization/create_program?access_token={self.token}&organization={self.org}',
                 params=params, json=extended_corporate_nutrition_info)
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise PostException(self.__class__.__qualname__,
                                 self.create_program.__name__,
@@ -1151,10 +1196,10 @@ class Customers(Auth):
                                     f"[ERROR] Не присвоен обязательный параметр: \"params\"")
         self.check_token_time()
         try:
-            result = self.session_s.post(
+            result = self._request("POST",
                 f'{self.base_url}/api/0/organization/update_program?access_token={self.token}&organization={self.org}',
                 params=params, json=extended_corporate_nutrition_info)
-            return result.json()
+            return self._json(result)
         except requests.exceptions.RequestException as err:
             raise PostException(self.__class__.__qualname__,
                                 self.update_program.__name__,
@@ -0,0 +1,256 @@
+import threading
+import time
+from datetime import datetime as dt
+
+from ..core import response_status
+from ..metrics import count_event
+from .exception import CardException
+from .exception import GetException
+
+# priceModificationType комбо
+PRICE_FIXED_COMBO = 0
+PRICE_FIXED_POSITIONS = 1
+PRICE_PERCENT_DISCOUNT = 2
+
+
+def _get(value: dict, key: str, default=None):
+    """Поля CombosInfo приходят как в camelCase, так и в PascalCase"""
+    result = value.get(key)
+    if result is None:
+        result = value.get(key[:1].upper() + key[1:], default)
+    return result
+
+
+def _date(value):
+    if not value:
+        return None
+    try:
+        return dt.fromisoformat(str(value)[:19])
+    except ValueError:
+        return None
+
+
+class ComboCatalog:
+    """
+    Кэш комбо организации (Organization.get_combos_info) и локальный расчет комбо для корзины.
+
+    Комбо индексируются по входящим в них продуктам, поэтому при изменении корзины
+    проверяются только комбо, продукты которых в ней есть. Цена комбо считается локально
+    по priceModificationType; Organization.check_and_get_combo_price вызывается только
+    при оформлении заказа (checkout) для подтверждения.
+
+    Позиция корзины: {"productId", "sizeId", "amount", "price"}
+
+    Пример:
+        combos = ComboCatalog(api)
+        combos.price(basket)          # при каждом изменении корзины, без запросов к серверу
+        combos.suggest(basket)        # комбо, в которых не хватает одной-двух групп
+        combos.checkout(basket)       # подтверждение цен сервером
+    """
+
+    def __init__(self, api, ttl: float = 600.0, retry_s: float = 10.0):
+        """
+        :param api: CardService (или Organization)
+        :param ttl: время жизни кэша get_combos_info в секундах
+        :param retry_s: пауза перед повторным запросом после ошибки, секунды (удваивается до ttl);
+            в это время используются прежние комбо
+        """
+        self.api = api
+        self.ttl = ttl
+        self.retry_s = retry_s
+
+        self.__lock = threading.Lock()
+        self.__combos = None
+        self.__by_product = {}
+        self.__loaded = None
+        self.__failures = 0
+
+    def refresh(self, force: bool = False):
+        """Перечитать get_combos_info, если истек ttl (или force)"""
+        with self.__lock:
+            fresh = not force and self.__loaded is not None and time.monotonic() - self.__loaded < self.ttl
+        count_event(self.api, "orders/get_combos_info", "cache_hit" if fresh else "cache_miss")
+        if fresh:
+            return
+        try:
+            combos_info = self.api.get_combos_info()
+            status = response_status()
+            specifications = _get(combos_info, "comboSpecifications") if isinstance(combos_info, dict) else None
+            if not isinstance(combos_info, dict) or (status is not None and status >= 400) or \
+                    not isinstance(specifications, list):
+                raise GetException(self.__class__.__qualname__,
+                                   self.refresh.__name__,
+                                   f"[ERROR] Неожиданный ответ get_combos_info: {str(combos_info)[:300]}")
+        except CardException:
+            with self.__lock:
+                self.__failures += 1
+                retry = min(self.ttl, self.retry_s * 2 ** (self.__failures - 1))
+                self.__loaded = time.monotonic() - self.ttl + retry
+                if self.__combos is None:
+                    raise
+            return
+        combos = [combo for combo in specifications
+                  if _get(combo, "isActive", True) is not False]
+        by_product = {}
+        for number, combo in enumerate(combos):
+            for group in _get(combo, "groups") or ():
+                for product in _get(group, "products") or ():
+                    by_product.setdefault(_get(product, "productId"), set()).add(number)
+        with self.__lock:
+            self.__combos, self.__by_product, self.__loaded = combos, by_product, time.monotonic()
+            self.__failures = 0
+
+    def _state(self) -> tuple:
+        """Согласованная пара (комбо, индекс по продуктам) после refresh"""
+        self.refresh()
+        with self.__lock:
+            return self.__combos, self.__by_product
+
+    def combos(self) -> list:
+        """Активные комбо (ComboSpecification)"""
+        combos, _ = self._state()
+        return list(combos)
+
+    def _candidates(self, basket: list, now: dt) -> list:
+        combos, by_product = self._state()
+        numbers = set()
+        for item in basket:
+            numbers.update(by_product.get(item.get("productId"), ()))
+        result = []
+        for number in sorted(numbers):
+            combo = combos[number]
+            start, end = _date(_get(combo, "startDate")), _date(_get(combo, "expirationDate"))
+            if (start is None or start <= now) and (end is None or now <= end):
+                result.append(combo)
+        return result
+
+    @staticmethod
+    def _eligible(group: dict, item: dict) -> dict:
+        for product in _get(group, "products") or ():
+            if _get(product, "productId") == item.get("productId") and \
+                    (_get(product, "sizeId") is None or _get(product, "sizeId") == item.get("sizeId")):
+                return product
+        return None
+
+    @staticmethod
+    def _combo_price(combo: dict, positions: list) -> float:
+        regular = sum(item.get("price") or 0.0 for _, item, _ in positions)
+        kind = _get(combo, "priceModificationType")
+        modification = _get(combo, "priceModification") or 0.0
+        if kind == PRICE_FIXED_COMBO:
+            return float(modification)
+        if kind == PRICE_FIXED_POSITIONS:
+            return float(sum(_get(product, "priceModificationAmount", item.get("price") or 0.0)
+                             for _, item, product in positions))
+        if kind == PRICE_PERCENT_DISCOUNT:
+            return regular * (1 - float(modification) / 100)
+        return regular
+
+    def _fill(self, combo: dict, remaining: dict, basket: list):
+        """Собрать комбо из оставшихся позиций: в каждую группу - самый дорогой подходящий продукт"""
+        positions = []
+        missing = []
+        used = {}
+        for group in _get(combo, "groups") or ():
+            best = None
+            for number, item in enumerate(basket):
+                if remaining[number] - used.get(number, 0) < 1:
+                    continue
+                product = self._eligible(group, item)
+                if product is not None and (best is None or (item.get("price") or 0) > (best[1].get("price") or 0)):
+                    best = (number, item, product)
+            if best is None:
+                missing.append(group)
+                continue
+            used[best[0]] = used.get(best[0], 0) + 1
+            positions.append((group, best[1], best[2]))
+        return positions, missing, used
+
+    def match(self, basket: list, now: dt = None) -> list:
+        """
+        Комбо, которые можно собрать из корзины (каждая позиция входит не более чем в одно комбо)
+
+        :param basket: позиции корзины
+        :return: [{"combo", "positions": [{"groupId", "productId", "sizeId", "price"}],
+            "price", "regular", "saving"}, ...] по убыванию выгоды
+        """
+        now = now or dt.now()
+        remaining = [item.get("amount", 1) for item in basket]
+        candidates = []
+        for combo in self._candidates(basket, now):
+            positions, missing, _ = self._fill(combo, remaining, basket)
+            if not missing:
+                regular = sum(item.get("price") or 0.0 for _, item, _ in positions)
+                candidates.append((regular - self._combo_price(combo, positions), combo))
+        candidates.sort(key=lambda candidate: -candidate[0])
+
+        result = []
+        for saving, combo in candidates:
+            while True:
+                positions, missing, used = self._fill(combo, remaining, basket)
+                if missing:
+                    break
+                price = self._combo_price(combo, positions)
+                regular = sum(item.get("price") or 0.0 for _, item, _ in positions)
+                if price >= regular:
+                    break
+                for number, count in used.items():
+                    remaining[number] -= count
+                result.append({
+                    "combo": combo,
+                    "positions": [{"groupId": _get(group, "id"), "productId": item.get("productId"),
+                                   "sizeId": item.get("sizeId"), "price": item.get("price")}
+                                  for group, item, _ in positions],
+                    "price": price,
+                    "regular": regular,
+                    "saving": regular - price,
+                })
+        return result
+
+    def price(self, basket: list, now: dt = None) -> dict:
+        """
+        Локальный расчет корзины с комбо
+
+        :return: {"total", "regular", "saving", "combos": match(basket)}
+        """
+        combos = self.match(basket, now)
+        regular = sum((item.get("price") or 0.0) * item.get("amount", 1) for item in basket)
+        saving = sum(combo["saving"] for combo in combos)
+        return {"total": regular - saving, "regular": regular, "saving": saving, "combos": combos}
+
+    def suggest(self, basket: list, now: dt = None) -> list:
+        """
+        Комбо, в которых не хватает не больше lackingGroupsToSuggest групп
+
+        :return: [{"combo", "missing": [ComboGroup, ...]}, ...]
+        """
+        now = now or dt.now()
+        remaining = [item.get("amount", 1) for item in basket]
+        result = []
+        for combo in self._candidates(basket, now):
+            positions, missing, _ = self._fill(combo, remaining, basket)
+            if missing and positions and len(missing) <= (_get(combo, "lackingGroupsToSuggest") or 0):
+                result.append({"combo": combo, "missing": missing})
+        return result
+
+    @staticmethod
+    def combo_price_request(combo_match: dict) -> dict:
+        """GetComboPriceRequest для комбо, найденного match()"""
+        combo = combo_match["combo"]
+        return {
+            "sourceActionId": _get(combo, "sourceActionId"),
+            "items": [{"groupId": position["groupId"], "productId": position["productId"],
+                       "sizeId": position["sizeId"]} for position in combo_match["positions"]],
+        }
+
+    def checkout(self, basket: list, now: dt = None, request_builder=None) -> list:
+        """
+        Подтвердить комбо корзины через Organization.check_and_get_combo_price
+
+        :param request_builder: request_builder(combo_match) -> GetComboPriceRequest,
+            по умолчанию combo_price_request
+        :return: [(combo_match, CalculateComboPriceResult), ...]
+        """
+        request_builder = request_builder or self.combo_price_request
+        return [(combo_match, self.api.check_and_get_combo_price(request_builder(combo_match)))
+                for combo_match in self.match(basket, now)]
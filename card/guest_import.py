@@ -0,0 +1,260 @@
+import csv
+import json
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime as dt
+
+from ..core import response_status
+from ..metrics import count_event
+from .exception import CardException
+
+DONE = "done"
+FAILED = "failed"
+INVALID = "invalid"
+
+CUSTOMER_FIELDS = ("id", "name", "surName", "middleName", "phone", "email", "birthday", "sex", "comment",
+                   "magnetCardTrack", "magnetCardNumber", "consentStatus", "shouldReceivePromoActionsInfo",
+                   "referrerId", "userData", "cultureName")
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+def normalize_phone(phone) -> str:
+    """8 (999) 123-45-67 -> +79991234567"""
+    digits = re.sub(r"\D", "", str(phone or ""))
+    if len(digits) == 11 and digits[0] == "8":
+        digits = "7" + digits[1:]
+    elif len(digits) == 10:
+        digits = "7" + digits
+    if not 11 <= len(digits) <= 15:
+        raise ValueError(f"Неверный телефон: \"{phone}\"")
+    return "+" + digits
+
+
+def normalize_guest(record: dict) -> dict:
+    """
+    Строка CSV/JSONL -> CustomerForImport ({"customer": {...}})
+
+    Поля строки называются как поля customer (phone, name, surName, email, birthday, ...),
+    пустые значения отбрасываются. Телефон обязателен.
+    :raise ValueError: строка не может быть импортирована
+    """
+    record = record.get("customer", record)
+    customer = {}
+    for field in CUSTOMER_FIELDS:
+        value = record.get(field)
+        if isinstance(value, str):
+            value = value.strip()
+        if value not in (None, ""):
+            customer[field] = value
+    customer["phone"] = normalize_phone(customer.get("phone"))
+    if "email" in customer and not _EMAIL_RE.match(customer["email"]):
+        del customer["email"]
+    if "birthday" in customer:
+        for date_format in ("%Y-%m-%d", "%d.%m.%Y", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S"):
+            try:
+                customer["birthday"] = dt.strptime(customer["birthday"], date_format).strftime("%Y-%m-%d")
+                break
+            except (TypeError, ValueError):
+                continue
+        else:
+            del customer["birthday"]
+    if "sex" in customer:
+        customer["sex"] = int(customer["sex"])
+    return {"customer": customer}
+
+
+def read_guests(source, file_format: str = None):
+    """
+    Читать гостей из CSV или JSONL
+
+    :param source: путь к файлу или открытый текстовый файл
+    :param file_format: "csv" или "jsonl", по умолчанию по расширению файла
+    :return: генератор (номер строки, dict); для строки JSONL, которая не разбирается, вместо dict - ValueError
+    """
+    if isinstance(source, str):
+        file_format = file_format or ("csv" if source.lower().endswith(".csv") else "jsonl")
+        with open(source, encoding="utf-8-sig", newline="") as file:
+            yield from read_guests(file, file_format)
+        return
+    if file_format == "csv":
+        for number, row in enumerate(csv.DictReader(source), 1):
+            yield number, row
+        return
+    for number, line in enumerate(source, 1):
+        line = line.strip()
+        if line:
+            try:
+                yield number, json.loads(line)
+            except ValueError as err:
+                yield number, err
+
+
+class GuestImporter:
+    """
+    Возобновляемый массовый импорт гостей через Customers.create_or_update.
+
+    Гости читаются потоком из CSV/JSONL, нормализуются (normalize_guest) и отправляются
+    параллельно (workers). Частоту запросов ограничивает api.rate_limiter (pyiikoapi.ratelimit).
+    Результат каждой строки сохраняется в SQLite (checkpoint), после перезапуска импорт
+    продолжается с уже отправленных строк. create_or_update обновляет гостя по телефону,
+    поэтому повторная отправка строки, результат которой не успели сохранить, безопасна.
+
+    Пример:
+        api.rate_limiter = RateLimiter(rate=20)
+        importer = GuestImporter(api, "/var/lib/import/guests.sqlite", workers=16,
+                                 on_progress=lambda stats: print(stats))
+        importer.run("guests.csv")
+        importer.failures()
+    """
+
+    def __init__(self, api, checkpoint_path: str, workers: int = 8, max_attempts: int = 3,
+                 backoff: float = 1.0, timeout: float = 15, normalize=None, on_progress=None,
+                 report_every: float = 5.0, commit_every: int = 200):
+        """
+        :param api: CardService (или Customers)
+        :param checkpoint_path: файл SQLite с результатами строк
+        :param workers: число одновременных запросов
+        :param max_attempts: число попыток отправки строки при ошибках сервера
+        :param backoff: пауза перед повтором в секундах (удваивается)
+        :param timeout: timeout create_or_update
+        :param normalize: normalize(record) -> CustomerForImport, по умолчанию normalize_guest
+        :param on_progress: on_progress(stats) - вызывается раз в report_every секунд и в конце
+        :param commit_every: сохранять checkpoint каждые commit_every строк
+        """
+        self.api = api
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.timeout = timeout
+        self.normalize = normalize or normalize_guest
+        self.on_progress = on_progress
+        self.report_every = report_every
+        self.commit_every = commit_every
+
+        self.__lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__pending = []
+        self.__stats = {}
+        self.__conn = sqlite3.connect(checkpoint_path, check_same_thread=False, isolation_level=None)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("CREATE TABLE IF NOT EXISTS guests (line INTEGER PRIMARY KEY, status TEXT NOT NULL, "
+                            "guest_id TEXT, error TEXT, updated REAL NOT NULL)")
+
+    def _processed(self, retry_failed: bool) -> set:
+        statuses = (DONE, INVALID) if retry_failed else (DONE, INVALID, FAILED)
+        rows = self.__conn.execute(f"SELECT line FROM guests WHERE status IN ({','.join('?' * len(statuses))})",
+                                   statuses)
+        return {row[0] for row in rows}
+
+    def _record(self, line: int, status: str, guest_id=None, error: str = None):
+        with self.__lock:
+            self.__pending.append((line, status, json.dumps(guest_id) if guest_id is not None else None, error,
+                                   time.time()))
+            self.__stats[status] += 1
+            flush = len(self.__pending) >= self.commit_every
+        if flush:
+            self._commit()
+
+    def _commit(self):
+        with self.__lock:
+            rows, self.__pending = self.__pending, []
+            if not rows:
+                return
+            self.__conn.execute("BEGIN IMMEDIATE")
+            self.__conn.executemany("INSERT OR REPLACE INTO guests (line, status, guest_id, error, updated) "
+                                    "VALUES (?, ?, ?, ?, ?)", rows)
+            self.__conn.execute("COMMIT")
+
+    def _send(self, line: int, customer_for_import: dict, slots: threading.Semaphore):
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                if self.__stop.is_set():
+                    return
+                retry = True
+                try:
+                    guest_id = self.api.create_or_update(customer_for_import, timeout=self.timeout)
+                    status = response_status()
+                    if isinstance(guest_id, str) and (status is None or status < 400):
+                        self._record(line, DONE, guest_id)
+                        return
+                    # тело ошибки iiko: повторяются только 429 и 5xx, остальное (400 и т.п.) - ошибка данных
+                    retry = status is not None and (status == 429 or status >= 500)
+                    error = f"HTTP {status}: {json.dumps(guest_id, ensure_ascii=False, default=str)[:500]}"
+                except CardException as err:
+                    error = str(err)
+                if not retry or attempt == self.max_attempts:
+                    self._record(line, FAILED, error=error)
+                    return
+                count_event(self.api, "customers/create_or_update", "retry")
+                self.__stop.wait(self.backoff * 2 ** (attempt - 1))
+        finally:
+            slots.release()
+
+    def stats(self) -> dict:
+        """{"done", "failed", "invalid", "skipped", "elapsed", "rate"} текущего запуска"""
+        with self.__lock:
+            stats = dict(self.__stats)
+        elapsed = time.monotonic() - stats.pop("started", time.monotonic())
+        stats["elapsed"] = elapsed
+        stats["rate"] = (stats.get(DONE, 0) + stats.get(FAILED, 0)) / elapsed if elapsed > 0 else 0.0
+        return stats
+
+    def run(self, source, file_format: str = None, retry_failed: bool = True) -> dict:
+        """
+        Импортировать гостей; строки, обработанные в предыдущих запусках, пропускаются
+
+        :param source: путь к CSV/JSONL или открытый текстовый файл
+        :param file_format: "csv" или "jsonl", по умолчанию по расширению
+        :param retry_failed: повторить строки, не импортированные в прошлый раз из-за ошибок сервера
+        :return: stats()
+        """
+        processed = self._processed(retry_failed)
+        self.__stop.clear()
+        with self.__lock:
+            self.__stats = {DONE: 0, FAILED: 0, INVALID: 0, "skipped": 0, "started": time.monotonic()}
+        slots = threading.Semaphore(self.workers * 2)
+        reported = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pyiikoapi-import") as executor:
+            for line, record in read_guests(source, file_format):
+                if self.__stop.is_set():
+                    break
+                if line in processed:
+                    with self.__lock:
+                        self.__stats["skipped"] += 1
+                    continue
+                if isinstance(record, ValueError):
+                    self._record(line, INVALID, error=f"Неверный JSON: {record}")
+                    continue
+                try:
+                    customer_for_import = self.normalize(record)
+                except (KeyError, TypeError, ValueError) as err:
+                    self._record(line, INVALID, error=str(err))
+                    continue
+                slots.acquire()
+                executor.submit(self._send, line, customer_for_import, slots)
+                if self.on_progress is not None and time.monotonic() - reported >= self.report_every:
+                    reported = time.monotonic()
+                    self.on_progress(self.stats())
+        self._commit()
+        stats = self.stats()
+        if self.on_progress is not None:
+            self.on_progress(stats)
+        return stats
+
+    def stop(self):
+        """Прервать run(); отправленные строки сохраняются в checkpoint"""
+        self.__stop.set()
+
+    def failures(self, status: str = None) -> list:
+        """Строки, которые не удалось импортировать: [(line, status, error), ...]"""
+        statuses = (status,) if status else (FAILED, INVALID)
+        return self.__conn.execute(
+            f"SELECT line, status, error FROM guests WHERE status IN ({','.join('?' * len(statuses))}) "
+            f"ORDER BY line", statuses).fetchall()
+
+    def close(self):
+        self._commit()
+        self.__conn.close()
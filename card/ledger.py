@@ -0,0 +1,265 @@
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from ..core import RateLimitExceeded
+from ..core import is_data
+from ..metrics import count_event
+from .exception import CardException
+from .exception import GetException
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+# запрос мог дойти до сервера, а ответ не получен: повторять нельзя, решает reconcile()
+UNKNOWN = "unknown"
+
+BALANCES_CHUNK = 200
+
+
+def _operation(operation) -> tuple:
+    """(guest, wallet, amount[, key]) или {"customerId", "walletId", "sum"[, "key"]} -> (guest, wallet, amount, key)"""
+    if isinstance(operation, dict):
+        return operation["customerId"], operation["walletId"], float(operation["sum"]), operation.get("key")
+    guest, wallet, amount = operation[:3]
+    return guest, wallet, float(amount), operation[3] if len(operation) > 3 else None
+
+
+def _sent(err: Exception) -> bool:
+    """Мог ли запрос, завершившийся ошибкой, дойти до сервера"""
+    cause = err.__context__
+    return not isinstance(cause, (requests.exceptions.ConnectTimeout, RateLimitExceeded))
+
+
+class BalanceLedger:
+    """
+    Массовые начисления и списания (Customers.refill_balance, Customers.withdraw_balance) с журналом.
+
+    Каждая операция записывается в SQLite с ключом идемпотентности до отправки. Операции
+    выполняются параллельно, но операции одного гостя - строго последовательно. Повторный
+    run() того же пакета не отправляет уже выполненные операции, поэтому массовое начисление
+    можно безопасно перезапускать.
+
+    Если ответ на запрос не получен (таймаут, обрыв соединения, 5xx), операция получает статус
+    unknown и не повторяется автоматически: reconcile() сравнивает балансы гостей до и после
+    (get_balances_by_guests_and_wallet) и определяет, была ли она проведена.
+
+    Пример:
+        ledger = BalanceLedger(api, "/var/lib/promo/ledger.sqlite", workers=16)
+        ledger.run([(customer_id, wallet_id, 100), ...], batch="promo-2026-10")
+        ledger.reconcile("promo-2026-10")
+    """
+
+    def __init__(self, api, path: str, workers: int = 8, max_attempts: int = 3, backoff: float = 1.0):
+        """
+        :param api: CardService (или Customers)
+        :param path: путь к файлу журнала SQLite
+        :param workers: число гостей, обрабатываемых одновременно
+        :param max_attempts: число попыток для операций, которые точно не дошли до сервера
+        :param backoff: пауза перед повтором в секундах (удваивается)
+        """
+        self.api = api
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+
+        self.__lock = threading.Lock()
+        self.__conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("PRAGMA synchronous=FULL")
+        self.__conn.execute(
+            "CREATE TABLE IF NOT EXISTS operations ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, batch TEXT NOT NULL, key TEXT NOT NULL UNIQUE, "
+            "guest TEXT NOT NULL, wallet TEXT NOT NULL, amount REAL NOT NULL, status TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, error TEXT, created REAL NOT NULL, updated REAL NOT NULL)")
+        self.__conn.execute("CREATE INDEX IF NOT EXISTS operations_batch ON operations (batch, status)")
+        self.__conn.execute(
+            "CREATE TABLE IF NOT EXISTS balances (batch TEXT NOT NULL, guest TEXT NOT NULL, wallet TEXT NOT NULL, "
+            "balance REAL, PRIMARY KEY (batch, guest, wallet))")
+
+    def _execute(self, query: str, params=()) -> list:
+        with self.__lock:
+            return self.__conn.execute(query, params).fetchall()
+
+    def add(self, operations, batch: str) -> list:
+        """
+        Записать операции пакета в журнал (без отправки)
+
+        Ключ операции без явного key - batch:guest:wallet:amount:n, где n - номер повтора той же
+        операции в пакете, поэтому повторная запись того же списка не создает новых операций.
+        :return: ключи операций
+        """
+        seen = {}
+        rows = []
+        now = time.time()
+        for operation in operations:
+            guest, wallet, amount, key = _operation(operation)
+            if key is None:
+                base = f"{batch}:{guest}:{wallet}:{amount:g}"
+                seen[base] = seen.get(base, 0) + 1
+                key = f"{base}:{seen[base]}"
+            rows.append((batch, key, guest, wallet, amount, PENDING, now, now))
+        with self.__lock:
+            self.__conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.__conn.executemany(
+                    "INSERT OR IGNORE INTO operations (batch, key, guest, wallet, amount, status, created, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self.__conn.execute("COMMIT")
+            except BaseException:
+                self.__conn.execute("ROLLBACK")
+                raise
+        return [row[1] for row in rows]
+
+    def run(self, operations=None, batch: str = "default", snapshot: bool = True) -> dict:
+        """
+        Выполнить операции пакета
+
+        :param operations: операции (guest, wallet, amount[, key]); None - выполнить уже записанные в журнал
+        :param batch: имя пакета
+        :param snapshot: запомнить балансы гостей до первой отправки (нужно для reconcile)
+        :return: counts(batch)
+        """
+        if operations is not None:
+            self.add(operations, batch)
+        rows = self._execute("SELECT seq, guest, wallet, amount, attempts FROM operations "
+                             "WHERE batch = ? AND status = ? ORDER BY seq", (batch, PENDING))
+        if snapshot:
+            self._snapshot(batch)
+        by_guest = {}
+        for row in rows:
+            by_guest.setdefault(row[1], []).append(row)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pyiikoapi-ledger") as executor:
+            futures = [executor.submit(self._run_guest, guest_rows) for guest_rows in by_guest.values()]
+        for future in futures:
+            # ошибки потоков не теряются: операции, записанные до ошибки, уже в журнале
+            future.result()
+        return self.counts(batch)
+
+    def _run_guest(self, rows: list):
+        for seq, guest, wallet, amount, attempts in rows:
+            self._apply(seq, guest, wallet, amount, attempts)
+
+    def _apply(self, seq: int, guest: str, wallet: str, amount: float, attempts: int):
+        request = {"customerId": guest, "organizationId": self.api.org, "walletId": wallet, "sum": abs(amount)}
+        method = self.api.refill_balance if amount >= 0 else self.api.withdraw_balance
+        while True:
+            attempts += 1
+            status, error = DONE, None
+            try:
+                result = method(request)
+                if result.status_code == 429 or result.status_code >= 500:
+                    status, error = (PENDING if result.status_code == 429 else UNKNOWN), \
+                        f"HTTP {result.status_code}: {result.text[:500]}"
+                elif result.status_code >= 400:
+                    status, error = FAILED, f"HTTP {result.status_code}: {result.text[:500]}"
+            except CardException as err:
+                status, error = (UNKNOWN if _sent(err) else PENDING), str(err)
+            if status == PENDING and attempts >= self.max_attempts:
+                status = FAILED
+            self._execute("UPDATE operations SET status = ?, attempts = ?, error = ?, updated = ? WHERE seq = ?",
+                          (status, attempts, error, time.time(), seq))
+            if status != PENDING:
+                return
+            count_event(self.api, "customers/refill_balance" if amount >= 0 else "customers/withdraw_balance", "retry")
+            time.sleep(self.backoff * 2 ** (attempts - 1))
+
+    def _balances(self, wallet: str, guests: list) -> dict:
+        """
+        Балансы гостей в кошельке {guest: balance}
+        :raise GetException: iiko вернул ошибку вместо списка балансов
+        """
+        result = {}
+        for start in range(0, len(guests), BALANCES_CHUNK):
+            response = self.api.get_balances_by_guests_and_wallet(
+                {"guestIds": guests[start:start + BALANCES_CHUNK]}, params={"wallet": wallet})
+            if not is_data(response):
+                raise GetException(self.__class__.__qualname__,
+                                   self._balances.__name__,
+                                   f"[ERROR] Не удалось получить балансы гостей: {str(response)[:300]}")
+            for balance in response:
+                guest = balance.get("guestId") or balance.get("customerId") or balance.get("id")
+                result[guest] = float(balance.get("balance") or 0.0)
+        return result
+
+    def _snapshot(self, batch: str):
+        rows = self._execute("SELECT DISTINCT o.wallet, o.guest FROM operations o LEFT JOIN balances b "
+                             "ON b.batch = o.batch AND b.guest = o.guest AND b.wallet = o.wallet "
+                             "WHERE o.batch = ? AND o.status = ? AND b.guest IS NULL", (batch, PENDING))
+        by_wallet = {}
+        for wallet, guest in rows:
+            by_wallet.setdefault(wallet, []).append(guest)
+        for wallet, guests in by_wallet.items():
+            balances = self._balances(wallet, guests)
+            with self.__lock:
+                self.__conn.executemany("INSERT OR IGNORE INTO balances (batch, guest, wallet, balance) "
+                                        "VALUES (?, ?, ?, ?)",
+                                        [(batch, guest, wallet, balances.get(guest)) for guest in guests])
+
+    def counts(self, batch: str) -> dict:
+        """Количество операций пакета по статусам"""
+        return dict(self._execute("SELECT status, COUNT(*) FROM operations WHERE batch = ? GROUP BY status",
+                                  (batch,)))
+
+    def operations(self, batch: str, status: str = None) -> list:
+        """Операции пакета: [{"key", "guest", "wallet", "amount", "status", "attempts", "error"}, ...]"""
+        query = "SELECT key, guest, wallet, amount, status, attempts, error FROM operations WHERE batch = ?"
+        params = (batch,)
+        if status is not None:
+            query += " AND status = ?"
+            params += (status,)
+        keys = ("key", "guest", "wallet", "amount", "status", "attempts", "error")
+        return [dict(zip(keys, row)) for row in self._execute(query + " ORDER BY seq", params)]
+
+    def reconcile(self, batch: str, apply: bool = True, tolerance: float = 0.005) -> list:
+        """
+        Сверить журнал пакета с балансами гостей (get_balances_by_guests_and_wallet)
+
+        Для каждого гостя: ожидаемый баланс = баланс до пакета + проведенные операции.
+        Если расхождение равно сумме операций unknown - они были проведены (done),
+        если расхождения нет - не были (pending, их выполнит следующий run()).
+        Результат верен, если балансы гостей не менялись в это время другими операциями.
+
+        :param apply: обновить статусы unknown операций по результату сверки
+        :return: [{"guest", "wallet", "before", "applied", "unknown", "after", "difference", "resolved"}, ...]
+            difference - расхождение, не объясненное журналом
+        """
+        before = {(guest, wallet): balance for guest, wallet, balance in self._execute(
+            "SELECT guest, wallet, balance FROM balances WHERE batch = ?", (batch,))}
+        totals = {}
+        for guest, wallet, status, amount in self._execute(
+                "SELECT guest, wallet, status, SUM(amount) FROM operations WHERE batch = ? AND status IN (?, ?) "
+                "GROUP BY guest, wallet, status", (batch, DONE, UNKNOWN)):
+            totals.setdefault((guest, wallet), {DONE: 0.0, UNKNOWN: 0.0})[status] = amount
+        by_wallet = {}
+        for guest, wallet in totals:
+            by_wallet.setdefault(wallet, []).append(guest)
+        after = {}
+        for wallet, guests in by_wallet.items():
+            for guest, balance in self._balances(wallet, guests).items():
+                after[(guest, wallet)] = balance
+
+        report = []
+        for (guest, wallet), amounts in totals.items():
+            start, end = before.get((guest, wallet)), after.get((guest, wallet))
+            row = {"guest": guest, "wallet": wallet, "before": start, "applied": amounts[DONE],
+                   "unknown": amounts[UNKNOWN], "after": end, "difference": None, "resolved": None}
+            if start is not None and end is not None:
+                difference = end - start - amounts[DONE]
+                if amounts[UNKNOWN] and abs(difference - amounts[UNKNOWN]) <= tolerance:
+                    row["resolved"], difference = DONE, 0.0
+                elif amounts[UNKNOWN] and abs(difference) <= tolerance:
+                    row["resolved"] = PENDING
+                row["difference"] = difference
+                if apply and row["resolved"] is not None:
+                    self._execute("UPDATE operations SET status = ?, updated = ? "
+                                  "WHERE batch = ? AND guest = ? AND wallet = ? AND status = ?",
+                                  (row["resolved"], time.time(), batch, guest, wallet, UNKNOWN))
+            report.append(row)
+        return report
+
+    def close(self):
+        self.__conn.close()
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+
+from ..core import response_status
+from ..metrics import count_event
+
+
+def _guest(order_request: dict) -> str:
+    customer = (order_request or {}).get("customer") or {}
+    return customer.get("id") or customer.get("phone")
+
+
+def _guest_ids(order_request: dict) -> tuple:
+    """Все идентификаторы гостя заказа (id и телефон), по любому из них сбрасываются результаты"""
+    customer = (order_request or {}).get("customer") or {}
+    return tuple(value for value in (customer.get("id"), customer.get("phone")) if value)
+
+
+def _item(item: dict) -> dict:
+    modifiers = sorted(({"id": modifier.get("id"), "groupId": modifier.get("groupId"),
+                         "amount": modifier.get("amount")} for modifier in item.get("modifiers") or ()),
+                       key=lambda modifier: json.dumps(modifier, sort_keys=True))
+    return {"id": item.get("id"), "code": item.get("code"), "size": item.get("size"), "amount": item.get("amount"),
+            "sum": item.get("sum"), "modifiers": modifiers}
+
+
+def checkin_key(order_request: dict) -> str:
+    """
+    Канонический хэш запроса calculate_checkin_result: гость, позиции и их количество, купон,
+    ручные условия, маркетинговые кампании оплаты, тип заказа, самовывоз и дата заказа (с точностью
+    до минуты). Порядок позиций и модификаторов не важен.
+    """
+    order_request = order_request or {}
+    order = order_request.get("order") or {}
+    items = sorted((_item(item) for item in order.get("items") or ()),
+                   key=lambda item: json.dumps(item, sort_keys=True))
+    canonical = {
+        "organization": order_request.get("organization"),
+        "guest": _guest(order_request),
+        "items": items,
+        "payments": sorted(json.dumps(payment, sort_keys=True) for payment in order.get("paymentItems") or ()),
+        "coupon": order_request.get("coupon"),
+        "conditions": sorted(order_request.get("applicableManualConditions") or ()),
+        "campaigns": sorted(order_request.get("availablePaymentMarketingCampaignIds") or ()),
+        "order_type": order.get("orderTypeId"),
+        "self_service": order.get("isSelfService"),
+        "date": str(order.get("date"))[:16] if order.get("date") is not None else None,
+    }
+    return hashlib.sha1(json.dumps(canonical, sort_keys=True, ensure_ascii=False, default=str)
+                        .encode("utf-8")).hexdigest()
+
+
+class LoyaltyCalculator:
+    """
+    Кэш Organization.calculate_checkin_result.
+
+    Результат запоминается по каноническому хэшу заказа (checkin_key) на ttl секунд,
+    одинаковые одновременные запросы выполняются один раз; ответ с ошибкой (4xx/5xx) возвращается,
+    но не кэшируется. При изменении баланса гостя его результаты сбрасываются (invalidate_guest). speculate() считает результат для
+    текущей корзины в фоне, пока гость редактирует заказ, и предпросмотр лояльности
+    при оформлении возвращается без ожидания.
+
+    Пример:
+        loyalty = LoyaltyCalculator(api, ttl=30)
+        loyalty.speculate(order_request)           # после каждого изменения корзины
+        checkin_result = loyalty.calculate(order_request)
+        loyalty.invalidate_guest(customer_id)      # баланс гостя изменился
+    """
+
+    def __init__(self, api, ttl: float = 30.0, max_entries: int = 1024, workers: int = 2):
+        """
+        :param api: CardService (или Organization)
+        :param ttl: время жизни результата в секундах
+        :param max_entries: сколько результатов хранить (старые вытесняются)
+        :param workers: число фоновых потоков speculate
+        """
+        self.api = api
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.workers = workers
+
+        self.__lock = threading.Lock()
+        # key -> [Future, expires_at (None пока не посчитан), (id и телефон гостя)]
+        self.__entries = OrderedDict()
+        self.__guests = {}
+        self.__executor = None
+        self.__stats = {"hits": 0, "misses": 0, "speculative": 0}
+
+    def _entry(self, key: str, order_request: dict):
+        """Найти действующую запись или создать новую; True - запись создана и ее надо посчитать"""
+        now = time.monotonic()
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > now):
+                self.__entries.move_to_end(key)
+                return entry, False
+            guests = _guest_ids(order_request)
+            entry = [Future(), None, guests]
+            self.__entries[key] = entry
+            self.__entries.move_to_end(key)
+            for guest in guests:
+                self.__guests.setdefault(guest, set()).add(key)
+            while len(self.__entries) > self.max_entries:
+                old_key, old_entry = self.__entries.popitem(last=False)
+                self._forget(old_key, old_entry)
+            return entry, True
+
+    def _forget(self, key: str, entry: list):
+        for guest in entry[2]:
+            keys = self.__guests.get(guest)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.__guests[guest]
+
+    def _evict(self, key: str, entry: list):
+        with self.__lock:
+            if self.__entries.get(key) is entry:
+                del self.__entries[key]
+                self._forget(key, entry)
+
+    def _compute(self, key: str, entry: list, order_request: dict):
+        try:
+            result = self.api.calculate_checkin_result(order_request)
+        except BaseException as err:
+            self._evict(key, entry)
+            entry[0].set_exception(err)
+            return
+        status = response_status()
+        if status is not None and status >= 400:
+            # тело ошибки получат только ожидающие этот расчет, следующий calculate обратится к iiko
+            self._evict(key, entry)
+        else:
+            with self.__lock:
+                entry[1] = time.monotonic() + self.ttl
+        entry[0].set_result(result)
+
+    def calculate(self, order_request: dict, timeout: float = None) -> dict:
+        """
+        Рассчитать программу лояльности для заказа (из кэша, если корзина не изменилась)
+
+        :param order_request: OrderRequest
+        :param timeout: сколько ждать расчета, запущенного другим потоком или speculate
+        :return: CheckinResult
+        """
+        key = checkin_key(order_request)
+        entry, created = self._entry(key, order_request)
+        with self.__lock:
+            self.__stats["misses" if created else "hits"] += 1
+        count_event(self.api, "orders/calculate_checkin_result", "cache_miss" if created else "cache_hit")
+        if created:
+            self._compute(key, entry, order_request)
+        return entry[0].result(timeout)
+
+    def speculate(self, order_request: dict) -> Future:
+        """Начать расчет корзины в фоне; результат заберет следующий calculate с той же корзиной"""
+        key = checkin_key(order_request)
+        entry, created = self._entry(key, order_request)
+        if created:
+            with self.__lock:
+                self.__stats["speculative"] += 1
+                if self.__executor is None:
+                    self.__executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                         thread_name_prefix="pyiikoapi-loyalty")
+                executor = self.__executor
+            executor.submit(self._compute, key, entry, order_request)
+        return entry[0]
+
+    def invalidate_guest(self, guest: str):
+        """Сбросить результаты гостя (id или телефон), например после изменения баланса"""
+        with self.__lock:
+            for key in list(self.__guests.get(guest, ())):
+                entry = self.__entries.pop(key, None)
+                if entry is not None:
+                    self._forget(key, entry)
+            self.__guests.pop(guest, None)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__guests.clear()
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return dict(self.__stats, entries=len(self.__entries))
+
+    def close(self):
+        with self.__lock:
+            executor, self.__executor = self.__executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
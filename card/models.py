@@ -0,0 +1,60 @@
+"""
+Типизированные модели ответов iiko Card API.
+Методы сервиса по-прежнему возвращают чистый json, модели создаются явно:
+
+    from pyiikoapi.card.models import OrganizationGuestInfo
+
+    guest = OrganizationGuestInfo.from_dict(api.get_customer_by_phone({"phone": phone}))
+    guest.wallet_balances[0].balance
+"""
+from ..model import Field
+from ..model import Model
+from ..model import Nested
+
+
+class GuestCard(Model):
+    id = Field("Id")
+    track = Field("Track")
+    number = Field("Number")
+    valid_to_date = Field("ValidToDate")
+
+
+class GuestCategory(Model):
+    id = Field("id")
+    name = Field("name")
+    is_active = Field("isActive")
+    is_default_for_new_guests = Field("isDefaultForNewGuests")
+
+
+class Wallet(Model):
+    id = Field("id")
+    name = Field("name")
+    program_type = Field("programType")
+    type = Field("type")
+
+
+class WalletBalance(Model):
+    balance = Field("balance")
+    wallet = Nested("wallet", Wallet)
+
+
+class OrganizationGuestInfo(Model):
+    """OrganizationGuestInfo Данные гостя (включая баланс)"""
+    id = Field("id")
+    referrer_id = Field("referrerId")
+    name = Field("name")
+    surname = Field("surname")
+    middle_name = Field("middleName")
+    phone = Field("phone")
+    email = Field("email")
+    birthday = Field("birthday")
+    sex = Field("sex")
+    comment = Field("comment")
+    culture_name = Field("cultureName")
+    consent_status = Field("consentStatus")
+    is_deleted = Field("isDeleted")
+    should_receive_promo_actions_info = Field("shouldReceivePromoActionsInfo")
+    user_data = Field("userData")
+    cards = Nested("cards", GuestCard, many=True)
+    categories = Nested("categories", GuestCategory, many=True)
+    wallet_balances = Nested("walletBalances", WalletBalance, many=True)
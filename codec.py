@@ -0,0 +1,161 @@
+import json
+import time
+
+
+class JsonCodec:
+    """Стандартный модуль json. Кодирует сразу в bytes и разбирает bytes без промежуточной str"""
+
+    name = "json"
+
+    @staticmethod
+    def encode(value) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    @staticmethod
+    def decode(data: bytes):
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self.encode = orjson.dumps
+        self.decode = orjson.loads
+
+
+class UjsonCodec:
+    name = "ujson"
+
+    def __init__(self):
+        import ujson
+        self._dumps = ujson.dumps
+        self.decode = ujson.loads
+
+    def encode(self, value) -> bytes:
+        return self._dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+class MsgspecCodec:
+    name = "msgspec"
+
+    def __init__(self):
+        import msgspec
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+        self._errors = (msgspec.EncodeError, msgspec.DecodeError)
+
+    def encode(self, value) -> bytes:
+        try:
+            return self._encoder.encode(value)
+        except self._errors[0] as err:
+            raise TypeError(str(err)) from err
+
+    def decode(self, data: bytes):
+        try:
+            return self._decoder.decode(data)
+        except self._errors[1] as err:
+            raise ValueError(str(err)) from err
+
+
+CODECS = {
+    "orjson": OrjsonCodec,
+    "msgspec": MsgspecCodec,
+    "ujson": UjsonCodec,
+    "json": JsonCodec,
+}
+
+
+def get_codec(name: str = "auto"):
+    """
+    Получить кодек по имени: "json", "orjson", "ujson", "msgspec"
+    или "auto" - самый быстрый из установленных (orjson, msgspec, ujson, json).
+    Ошибки кодирования всех кодеков - TypeError/ValueError, ошибки разбора - ValueError
+    """
+    if name != "auto":
+        return CODECS[name]()
+    for codec in CODECS.values():
+        try:
+            return codec()
+        except ImportError:
+            continue
+    return JsonCodec()
+
+
+def available_codecs() -> list:
+    """Кодеки, библиотеки которых установлены"""
+    result = []
+    for name, codec in CODECS.items():
+        try:
+            codec()
+        except ImportError:
+            continue
+        result.append(name)
+    return result
+
+
+def sample_payloads(size: int = 2000) -> dict:
+    """Синтетические ответы тяжелых методов для benchmark"""
+    products = [{"id": f"{i:08d}-0000-0000-0000-000000000000", "code": str(i), "name": f"Товар {i}",
+                 "description": "Описание товара " * 4, "price": 100.0 + i, "parentGroup": None,
+                 "groupId": "00000000-0000-0000-0000-000000000001", "type": "dish", "weight": 0.3,
+                 "isIncludedInMenu": True, "order": i, "tags": ["tag"],
+                 "modifiers": [{"modifierId": "m", "minAmount": 0, "maxAmount": 1, "defaultAmount": 0,
+                                "required": False}],
+                 "groupModifiers": [], "images": [{"imageId": "i", "imageUrl": "https://example.com/i.png",
+                                                   "uploadDate": "2020-01-01 00:00:00"}]} for i in range(size)]
+    olap = {"data": [{"OpenDate.Typed": "2020-01-01", "Department": "Ресторан", "DishName": f"Товар {i % 300}",
+                      "DishAmountInt": i % 7, "DishDiscountSumInt": 123.45 * (i % 11)} for i in range(size * 5)]}
+    customers = [{"id": f"{i:08d}-0000-0000-0000-000000000000", "name": "Иван", "phone": f"+7999{i:07d}",
+                  "birthday": None, "email": None, "lastVisitDate": "2020-01-01 00:00:00",
+                  "createdDate": "2019-01-01 00:00:00"} for i in range(size * 5)]
+    return {
+        "nomenclature/{id}": {"groups": [], "products": products, "productCategories": [],
+                              "revision": 1, "uploadDate": "2020-01-01 00:00:00"},
+        "olaps/olap": olap,
+        "customers/get_customers_by_organization_and_by_period": customers,
+    }
+
+
+def benchmark(samples: dict = None, codecs: list = None, rounds: int = 5) -> list:
+    """
+    Сравнить кодеки на ответах методов API
+
+    :param samples: {имя метода: ответ}, по умолчанию sample_payloads()
+    :param codecs: имена кодеков, по умолчанию все установленные
+    :param rounds: число повторов, берется лучшее время
+    :return: [{"endpoint", "codec", "bytes", "encode_ms", "decode_ms", "speedup"}, ...]
+        speedup - во сколько раз encode + decode быстрее стандартного json
+    """
+    samples = sample_payloads() if samples is None else samples
+    codecs = available_codecs() if codecs is None else codecs
+    if "json" not in codecs:
+        codecs = list(codecs) + ["json"]
+    rows = []
+    for endpoint, payload in samples.items():
+        results = {}
+        for name in codecs:
+            codec = get_codec(name)
+            data = codec.encode(payload)
+            encode_time = decode_time = float("inf")
+            for _ in range(rounds):
+                started = time.perf_counter()
+                codec.encode(payload)
+                encode_time = min(encode_time, time.perf_counter() - started)
+                started = time.perf_counter()
+                codec.decode(data)
+                decode_time = min(decode_time, time.perf_counter() - started)
+            results[name] = (len(data), encode_time, decode_time)
+        baseline = results["json"][1] + results["json"][2]
+        for name, (size, encode_time, decode_time) in results.items():
+            rows.append({"endpoint": endpoint, "codec": name, "bytes": size,
+                         "encode_ms": encode_time * 1000, "decode_ms": decode_time * 1000,
+                         "speedup": baseline / (encode_time + decode_time)})
+    return rows
+
+
+if __name__ == "__main__":
+    for row in benchmark():
+        print("{endpoint:<60} {codec:<8} {bytes:>10} B  encode {encode_ms:8.2f} ms  "
+              "decode {decode_ms:8.2f} ms  x{speedup:.2f}".format(**row))
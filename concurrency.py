@@ -0,0 +1,190 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+AIMD = "aimd"
+GRADIENT = "gradient"
+
+# ответы, означающие перегрузку сервера
+OVERLOAD_STATUSES = (429, 502, 503, 504)
+
+
+class ConcurrencyLimitExceeded(requests.exceptions.RequestException):
+    """Слот адаптивного ограничителя не был получен за AdaptiveConcurrency.max_wait секунд"""
+
+
+class _Sample:
+    """Результат одного запроса; status_code заполняет RequestCore после получения ответа"""
+    __slots__ = ("status_code",)
+
+    def __init__(self):
+        self.status_code = None
+
+
+class _Limit:
+    """Состояние лимита одного семейства методов API"""
+    __slots__ = ("limit", "in_flight", "rtt_short", "rtt_base", "rtt_min", "samples", "drops", "last_drop",
+                 "max_in_flight", "cond")
+
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.in_flight = 0
+        self.rtt_short = None
+        self.rtt_base = None
+        self.rtt_min = None
+        self.samples = 0
+        self.drops = 0
+        self.last_drop = 0.0
+        self.max_in_flight = 0
+        self.cond = threading.Condition()
+
+
+class AdaptiveConcurrency:
+    """
+    Адаптивное ограничение числа одновременных запросов по семействам методов API.
+
+    Лимит каждого семейства (orders, olaps, customers, ...) подбирается по задержкам и ошибкам:
+    - aimd: при успешных ответах лимит растет на 1 за каждые limit ответов, при перегрузке
+      (таймаут, обрыв, 429, 5xx шлюза) умножается на backoff;
+    - gradient: лимит следует отношению базовой задержки (без очереди) к текущей (как TCP Vegas):
+      рост задержки означает очередь на сервере и уменьшает лимит, перегрузка - как в aimd.
+    Рост лимита происходит только когда лимит действительно используется (занято больше половины),
+    поэтому ночью в простое он не раздувается.
+
+    Пример:
+        api.concurrency = AdaptiveConcurrency(algorithm="gradient", initial=8, max_limit=64)
+        api.concurrency.limits()      # {"orders": {"limit": 12.4, "in_flight": 3, ...}, ...}
+    """
+
+    def __init__(self, algorithm: str = GRADIENT, initial: int = 8, min_limit: int = 1, max_limit: int = 64,
+                 backoff: float = 0.9, smoothing: float = 0.2, tolerance: float = 1.5, max_wait: float = None):
+        """
+        :param algorithm: AIMD или GRADIENT
+        :param initial: начальный лимит семейства
+        :param min_limit: минимальный лимит
+        :param max_limit: максимальный лимит
+        :param backoff: множитель лимита при перегрузке (не чаще раза за время ответа)
+        :param smoothing: доля нового значения при сглаживании лимита в gradient
+        :param tolerance: во сколько раз текущая задержка может превышать базовую без уменьшения лимита
+        :param max_wait: максимальное ожидание слота в секундах (None - без ограничения)
+        """
+        if algorithm not in (AIMD, GRADIENT):
+            raise ValueError(f"Неизвестный алгоритм: {algorithm}")
+        self.algorithm = algorithm
+        self.initial = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.smoothing = smoothing
+        self.tolerance = tolerance
+        self.max_wait = max_wait
+
+        self.__lock = threading.Lock()
+        self.__limits = {}
+
+    def _state(self, family: str) -> _Limit:
+        state = self.__limits.get(family)
+        if state is None:
+            with self.__lock:
+                state = self.__limits.setdefault(family, _Limit(float(self.initial)))
+        return state
+
+    def acquire(self, family: str) -> _Limit:
+        """Дождаться свободного слота семейства"""
+        state = self._state(family)
+        deadline = None if self.max_wait is None else time.monotonic() + self.max_wait
+        with state.cond:
+            while state.in_flight >= max(self.min_limit, int(state.limit)):
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    raise ConcurrencyLimitExceeded(f"Превышено время ожидания слота для \"{family}\"")
+                state.cond.wait(timeout)
+            state.in_flight += 1
+            state.max_in_flight = max(state.max_in_flight, state.in_flight)
+        return state
+
+    def release(self, state: _Limit, rtt: float = None, dropped: bool = False):
+        """
+        Освободить слот и учесть результат запроса
+
+        :param rtt: время ответа в секундах; None - не учитывать (запрос прерван не из-за сервера)
+        :param dropped: признак перегрузки (таймаут, обрыв, 429, 5xx шлюза)
+        """
+        with state.cond:
+            in_flight = state.in_flight
+            state.in_flight -= 1
+            if dropped:
+                self._on_drop(state, rtt)
+            elif rtt is not None:
+                self._on_success(state, rtt, in_flight)
+            state.cond.notify_all()
+
+    def _on_drop(self, state: _Limit, rtt: float):
+        state.drops += 1
+        now = time.monotonic()
+        # одна волна ошибок (все запросы, отправленные до уменьшения) уменьшает лимит один раз
+        if now - state.last_drop < (state.rtt_short or rtt or 0.0):
+            return
+        state.last_drop = now
+        state.limit = max(float(self.min_limit), state.limit * self.backoff)
+
+    def _on_success(self, state: _Limit, rtt: float, in_flight: int):
+        state.samples += 1
+        state.rtt_min = rtt if state.rtt_min is None else min(state.rtt_min, rtt)
+        state.rtt_short = rtt if state.rtt_short is None else state.rtt_short * 0.9 + rtt * 0.1
+        # базовая задержка без очереди: минимум, медленно "забывающий" старые значения
+        state.rtt_base = rtt if state.rtt_base is None else min(rtt, state.rtt_base * 1.0001)
+        used = in_flight * 2 >= state.limit
+        if self.algorithm == AIMD:
+            if used:
+                state.limit = min(float(self.max_limit), state.limit + 1.0 / state.limit)
+            return
+        gradient = max(0.5, min(1.0, self.tolerance * state.rtt_base / state.rtt_short))
+        # запас на очередь sqrt(limit) добавляется за каждые limit ответов (примерно за время ответа)
+        target = state.limit * gradient + math.sqrt(state.limit) / state.limit
+        if not used:
+            target = min(target, state.limit)
+        target = state.limit * (1 - self.smoothing) + target * self.smoothing
+        state.limit = max(float(self.min_limit), min(float(self.max_limit), target))
+
+    @contextmanager
+    def slot(self, family: str):
+        """
+        Занять слот на время запроса; время ответа измеряется, перегрузка определяется по исключению
+        requests или по sample.status_code
+
+            with concurrency.slot("orders") as sample:
+                result = session.request(...)
+                sample.status_code = result.status_code
+        """
+        state = self.acquire(family)
+        sample = _Sample()
+        started = time.monotonic()
+        try:
+            yield sample
+        except requests.exceptions.RequestException:
+            self.release(state, time.monotonic() - started, dropped=True)
+            raise
+        except BaseException:
+            self.release(state)
+            raise
+        self.release(state, time.monotonic() - started, dropped=sample.status_code in OVERLOAD_STATUSES)
+
+    def limit(self, family: str) -> int:
+        """Текущий лимит семейства"""
+        return max(self.min_limit, int(self._state(family).limit))
+
+    def limits(self) -> dict:
+        """Состояние лимитов: {семейство: {"limit", "in_flight", "max_in_flight", "rtt", "rtt_min", "samples", "drops"}}"""
+        with self.__lock:
+            states = dict(self.__limits)
+        result = {}
+        for family, state in states.items():
+            with state.cond:
+                result[family] = {"limit": round(state.limit, 2), "in_flight": state.in_flight,
+                                  "max_in_flight": state.max_in_flight, "rtt": state.rtt_short,
+                                  "rtt_min": state.rtt_min, "samples": state.samples, "drops": state.drops}
+        return result
@@ -0,0 +1,292 @@
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+from .codec import JsonCodec
+from .codec import get_codec
+from .warmup import warmup as warmup_connections
+
+_local = threading.local()
+_ID_RE = re.compile(r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$")
+
+
+class RateLimitExceeded(requests.exceptions.RequestException):
+    """Маркер ограничителя частоты не был получен за RateLimiter.max_wait секунд"""
+
+
+def endpoint_name(url: str) -> str:
+    """
+    Имя метода API по url запроса
+        https://iiko.biz:9900/api/0/orders/add?access_token=... -> "orders/add"
+        .../api/0/organization/{organizationId}/send_sms -> "organization/{id}/send_sms"
+    """
+    parts = [part for part in urlsplit(url).path.split("/") if part]
+    if parts[:2] == ["api", "0"]:
+        parts = parts[2:]
+    return "/".join("{id}" if _ID_RE.match(part) else part for part in parts)
+
+
+def endpoint_family(name: str) -> str:
+    """Семейство метода API: "orders/add" -> "orders" """
+    return name.split("/", 1)[0]
+
+
+def response_status():
+    """
+    HTTP статус последнего ответа, полученного методом API в текущем потоке (None, если ответа не было).
+    Методы API возвращают разобранное тело ответа и при 4xx/5xx, статус позволяет отличить тело ошибки:
+
+        guest_id = api.create_or_update(customer_for_import)
+        if response_status() == 429:
+            ...
+    """
+    return getattr(_local, "status", None)
+
+
+def is_data(response, *lists: str, required: tuple = ()) -> bool:
+    """
+    Ответ метода API - данные, а не тело ошибки iiko ({"code", "message", ...}), которое методы
+    возвращают при 4xx/5xx вместо исключения
+
+    :param lists: ключи, значения которых должны быть списками; без lists ответ сам должен быть списком
+    :param required: ключи, значения которых не должны быть null
+        is_data(api.nomenclature(), "products", required=("revision",))
+        is_data(api.get_customers_by_organization_and_by_period(period))
+    """
+    if not lists and not required:
+        return isinstance(response, list)
+    return isinstance(response, dict) and all(isinstance(response.get(key), list) for key in lists) \
+        and all(response.get(key) is not None for key in required)
+
+
+class RequestCore:
+    """
+    Общая точка отправки HTTP запросов для классов Auth сервисов biz и card.
+    Все методы API отправляют запросы через _request, поэтому сквозная логика
+    (приоритеты, ограничение частоты, метрики и т.п.) подключается здесь один раз.
+    """
+
+    _rate_limiter = None
+    _scheduler = None
+    _metrics = None
+    _concurrency = None
+    _hedging = None
+    _degraded = None
+    _codec = JsonCodec()
+
+    @property
+    def rate_limiter(self):
+        """Ограничитель частоты запросов (pyiikoapi.ratelimit.RateLimiter) или None"""
+        return self._rate_limiter
+
+    @rate_limiter.setter
+    def rate_limiter(self, value):
+        self._rate_limiter = value
+
+    @property
+    def scheduler(self):
+        """Планировщик приоритетов запросов (pyiikoapi.scheduler.RequestScheduler) или None"""
+        return self._scheduler
+
+    @scheduler.setter
+    def scheduler(self, value):
+        self._scheduler = value
+
+    @property
+    def metrics(self):
+        """Метрики запросов (pyiikoapi.metrics.Metrics) или None"""
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, value):
+        self._metrics = value
+
+    @property
+    def concurrency(self):
+        """Адаптивный лимит одновременных запросов (pyiikoapi.concurrency.AdaptiveConcurrency) или None"""
+        return self._concurrency
+
+    @concurrency.setter
+    def concurrency(self, value):
+        self._concurrency = value
+
+    @property
+    def hedging(self):
+        """Дублирование медленных запросов чтения (pyiikoapi.hedging.HedgingPolicy) или None"""
+        return self._hedging
+
+    @hedging.setter
+    def hedging(self, value):
+        self._hedging = value
+
+    @property
+    def degraded(self):
+        """Отдача сохраненных ответов чтения при недоступности iiko (pyiikoapi.degraded.DegradedMode) или None"""
+        return self._degraded
+
+    @degraded.setter
+    def degraded(self, value):
+        self._degraded = value
+
+    @property
+    def codec(self):
+        """
+        Кодек JSON тела запросов и ответов (pyiikoapi.codec), по умолчанию стандартный json.
+        Можно присвоить объект с методами encode(value) -> bytes и decode(bytes)
+        или имя: "json", "orjson", "ujson", "msgspec", "auto"
+        """
+        return self._codec
+
+    @codec.setter
+    def codec(self, value):
+        self._codec = get_codec(value) if isinstance(value, str) else value
+
+    def warmup(self, connections: int = 4) -> dict:
+        """
+        Открыть connections keep-alive соединений заранее (pyiikoapi.warmup.warmup)
+
+        :return: {"connections", "ok", "errors", "elapsed"}
+        """
+        return warmup_connections(self, connections)
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Отправить запрос через session_s
+
+        :param method: HTTP метод ("GET", "POST")
+        :param url: полный url запроса
+        :param kwargs: аргументы requests.Session.request
+        """
+        if kwargs.get("json") is not None:
+            kwargs = self._encode(kwargs)
+        endpoint = endpoint_name(url)
+        _local.status = None
+        degraded = self._degraded
+        if degraded is not None and degraded.applies(method, endpoint):
+            result = degraded.send(endpoint, method, url, kwargs.get("params"),
+                                   lambda: self._schedule(endpoint, method, url, **kwargs), self._metrics)
+        else:
+            result = self._schedule(endpoint, method, url, **kwargs)
+        _local.status = result.status_code
+        return result
+
+    def _schedule(self, endpoint: str, method: str, url: str, **kwargs) -> requests.Response:
+        started = time.perf_counter() if self._metrics is not None else None
+        scheduler = self._scheduler
+        if scheduler is None:
+            return self._send(endpoint, started, method, url, **kwargs)
+        with scheduler.slot(scheduler.classify(endpoint)):
+            return self._send(endpoint, started, method, url, **kwargs)
+
+    def _send(self, endpoint: str, started: float, method: str, url: str, **kwargs) -> requests.Response:
+        limiter = self._rate_limiter
+        if limiter is not None:
+            family = endpoint_family(endpoint)
+            if not limiter.acquire(self.login, family):
+                if self._metrics is not None:
+                    self._metrics.inc(endpoint, "rate_limited")
+                raise RateLimitExceeded(f"Превышено время ожидания ограничителя частоты для \"{family}\"")
+
+        concurrency = self._concurrency
+        if concurrency is None:
+            result = self._transmit(endpoint, started, method, url, **kwargs)
+        else:
+            with concurrency.slot(endpoint_family(endpoint)) as sample:
+                result = self._transmit(endpoint, started, method, url, **kwargs)
+                sample.status_code = result.status_code
+
+        if limiter is not None and result.status_code == 429:
+            try:
+                delay = float(result.headers.get("Retry-After", 1))
+            except ValueError:
+                delay = 1.0
+            limiter.penalize(self.login, endpoint_family(endpoint), delay)
+        return result
+
+    def _transmit(self, endpoint: str, started: float, method: str, url: str, **kwargs) -> requests.Response:
+        hedging = self._hedging
+        if hedging is not None and hedging.applies(method, endpoint):
+            # попытки выполняются в потоках hedging: время обновления маркера относится к запросу здесь,
+            # пока _local - поток вызывающего
+            token = _local.__dict__.pop("token", None)
+            if token is not None and self._metrics is not None:
+                self._metrics.observe(endpoint, "token", token)
+            return hedging.send(endpoint, lambda: self._transmit_once(endpoint, started, method, url, **kwargs),
+                                self._hedge_admit(endpoint))
+        return self._transmit_once(endpoint, started, method, url, **kwargs)
+
+    def _hedge_admit(self, endpoint: str):
+        """Дубль запроса расходует маркер ограничителя частоты; нет маркера без ожидания - дубля нет"""
+        limiter = self._rate_limiter
+        if limiter is None:
+            return None
+        return lambda: limiter.reserve(self.login, endpoint_family(endpoint), max_wait=0.0) is not None
+
+    def _transmit_once(self, endpoint: str, started: float, method: str, url: str, **kwargs) -> requests.Response:
+        metrics = self._metrics
+        if metrics is None:
+            return self.session_s.request(method, url, **kwargs)
+        return self._observe(metrics, endpoint, started, method, url, **kwargs)
+
+    def _observe(self, metrics, endpoint: str, started: float, method: str, url: str,
+                 **kwargs) -> requests.Response:
+        """Отправить запрос с записью фаз в metrics"""
+        sent = time.perf_counter()
+        if started is not None:
+            metrics.observe(endpoint, "queue", sent - started)
+        token = _local.__dict__.pop("token", None)
+        if token is not None:
+            metrics.observe(endpoint, "token", token)
+
+        span = metrics.start_span(endpoint, method)
+        try:
+            result = self.session_s.request(method, url, **kwargs)
+        except requests.exceptions.RequestException as err:
+            metrics.inc(endpoint, "errors")
+            metrics.end_span(span, error=err)
+            raise
+        total = time.perf_counter() - sent
+        ttfb = result.elapsed.total_seconds()
+
+        metrics.inc(endpoint, "requests")
+        if result.status_code >= 400:
+            metrics.inc(endpoint, f"http_{result.status_code}")
+        metrics.observe(endpoint, "ttfb", ttfb)
+        metrics.observe(endpoint, "download", max(0.0, total - ttfb))
+        metrics.observe(endpoint, "total", total)
+        metrics.observe(endpoint, "response_bytes", len(result.content))
+        metrics.end_span(span, status_code=result.status_code)
+        if endpoint == "auth/access_token":
+            # обновление маркера произошло внутри check_token_time - отнесем его к следующему запросу потока
+            _local.token = total
+        return result
+
+    def _encode(self, kwargs: dict) -> dict:
+        """Заменить json= на готовое тело запроса в bytes, закодированное self.codec"""
+        value = kwargs.pop("json")
+        try:
+            kwargs["data"] = self._codec.encode(value)
+        except (TypeError, ValueError) as err:
+            raise requests.exceptions.InvalidJSONError(err)
+        kwargs["headers"] = {**(kwargs.get("headers") or {}), "Content-Type": "application/json"}
+        return kwargs
+
+    def _decode(self, result: requests.Response):
+        content = result.content
+        try:
+            return self._codec.decode(content)
+        except ValueError as err:
+            raise requests.exceptions.JSONDecodeError(str(err), content.decode("utf-8", "replace"), 0)
+
+    def _json(self, result: requests.Response):
+        """Разобрать JSON ответа из bytes (с замером фазы decode, если включены метрики)"""
+        metrics = self._metrics
+        if metrics is None:
+            return self._decode(result)
+        started = time.perf_counter()
+        data = self._decode(result)
+        metrics.observe(endpoint_name(result.url), "decode", time.perf_counter() - started)
+        return data
@@ -0,0 +1,212 @@
+import contextvars
+import datetime
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl
+from urllib.parse import urlencode
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from .concurrency import ConcurrencyLimitExceeded
+from .core import RateLimitExceeded
+
+# методы и семейства методов чтения справочников, для которых по умолчанию разрешен устаревший ответ
+DEFAULT_ENDPOINTS = (
+    "nomenclature",
+    "stopLists/getDeliveryStopList",
+    "deliverySettings/getDeliveryTerminals",
+    "deliverySettings/getDeliveryRestrictions",
+    "deliverySettings/deliveryDiscounts",
+    "cities",
+    "streets",
+    "regions",
+    "rmsSettings",
+    "organization/list",
+)
+# ответы сервера, при которых вместо них отдается сохраненный ответ
+FAILURE_STATUSES = (500, 502, 503, 504)
+STALE_HEADER = "X-Pyiikoapi-Stale-Age"
+
+_stale_age = contextvars.ContextVar("pyiikoapi_stale_age", default=None)
+
+
+def stale_age():
+    """
+    Возраст в секундах ответа, отданного из кэша последним запросом в текущем потоке
+    (или asyncio задаче); None, если ответ получен от iiko
+
+        menu = api.nomenclature()
+        if stale_age() is not None:
+            show_banner("Меню может быть неактуально")
+    """
+    return _stale_age.get()
+
+
+def _key(method: str, url: str, params) -> str:
+    """Ключ ответа: url и параметры без access_token (маркер меняется каждые 15 минут)"""
+    parts = urlsplit(url)
+    query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+             if name != "access_token"]
+    if isinstance(params, dict):
+        query += [(str(name), str(value)) for name, value in params.items()]
+    return f"{method} {parts.netloc}{parts.path}?{urlencode(sorted(query))}"
+
+
+class _Entry:
+    __slots__ = ("content", "status_code", "headers", "encoding", "stored")
+
+    def __init__(self, result: requests.Response):
+        self.content = result.content
+        self.status_code = result.status_code
+        self.headers = dict(result.headers or {})
+        self.encoding = getattr(result, "encoding", None)
+        self.stored = time.time()
+
+
+class DegradedMode:
+    """
+    Деградированный режим чтения: при недоступности iiko отдается последний успешный ответ.
+
+    Успешные ответы методов чтения (endpoints) запоминаются. Если запрос завершился ошибкой
+    транспорта (таймаут, обрыв соединения) или ответом 5xx, и сохраненному ответу не больше
+    max_staleness секунд, возвращается он с заголовком X-Pyiikoapi-Stale-Age; возраст также
+    доступен через stale_age(). После ошибки хост считается недоступным hold секунд: в это время
+    методы чтения сразу отдают сохраненные ответы, не ожидая таймаута, затем iiko снова проверяется.
+
+    Маркер доступа: если во время недоступности истекло время маркера и его не удалось обновить,
+    сервис продолжает работу со старым маркером, чтобы запросы чтения могли получить ответ из кэша;
+    пока хост недоступен, повторно обновить маркер не пытается.
+
+    Метрики (api.metrics): счетчики stale_served, stale_expired (ответ есть, но старше max_staleness),
+    stale_miss (ответа нет) и гистограмма stale_age.
+
+    Пример:
+        api.degraded = DegradedMode(max_staleness=3600, hold=10)
+        menu = api.nomenclature()      # при недоступности iiko - меню, полученное ранее
+        stale_age()                    # возраст отданного ответа или None
+    """
+
+    def __init__(self, max_staleness: float = 3600.0, endpoints: tuple = DEFAULT_ENDPOINTS, hold: float = 5.0,
+                 max_entries: int = 1000, statuses: tuple = FAILURE_STATUSES):
+        """
+        :param max_staleness: максимальный возраст ответа, который можно отдать, в секундах
+        :param endpoints: имена или семейства методов (pyiikoapi.core.endpoint_name); None - все GET запросы
+        :param hold: сколько секунд после ошибки отдавать сохраненные ответы без обращения к iiko
+        :param max_entries: максимальное число сохраненных ответов
+        :param statuses: коды ответа, которые считаются недоступностью iiko
+        """
+        self.max_staleness = max_staleness
+        self.endpoints = None if endpoints is None else set(endpoints)
+        self.hold = hold
+        self.max_entries = max_entries
+        self.statuses = statuses
+
+        self.__lock = threading.Lock()
+        self.__entries = OrderedDict()
+        self.__down = {}
+
+    def applies(self, method: str, endpoint: str) -> bool:
+        if endpoint.startswith("auth/"):
+            return False
+        if self.endpoints is None:
+            return method.upper() == "GET"
+        return endpoint in self.endpoints or endpoint.split("/", 1)[0] in self.endpoints
+
+    def down(self, url: str) -> bool:
+        """Считается ли хост url недоступным (идет период hold после ошибки)"""
+        with self.__lock:
+            return self.__down.get(urlsplit(url).netloc, 0.0) > time.monotonic()
+
+    def report(self, url: str, error: Exception):
+        """
+        Учесть ошибку запроса к хосту url, отправленного в обход send (например обновления маркера):
+        ошибка транспорта начинает период hold, локальные ограничения (RateLimitExceeded,
+        ConcurrencyLimitExceeded) недоступностью iiko не считаются
+        """
+        if isinstance(error, requests.exceptions.RequestException) and \
+                not isinstance(error, (RateLimitExceeded, ConcurrencyLimitExceeded)):
+            self._mark(url, True)
+
+    def _mark(self, url: str, failed: bool):
+        host = urlsplit(url).netloc
+        with self.__lock:
+            if failed:
+                self.__down[host] = time.monotonic() + self.hold
+            else:
+                self.__down.pop(host, None)
+
+    def _store(self, key: str, result: requests.Response):
+        entry = _Entry(result)
+        with self.__lock:
+            self.__entries[key] = entry
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_entries:
+                self.__entries.popitem(last=False)
+
+    def _stale(self, key: str, url: str, endpoint: str, metrics, miss: bool = True) -> requests.Response:
+        """Сохраненный ответ как requests.Response или None, если его нет или он слишком старый"""
+        with self.__lock:
+            entry = self.__entries.get(key)
+        if entry is None:
+            if metrics is not None and miss:
+                metrics.inc(endpoint, "stale_miss")
+            return None
+        age = time.time() - entry.stored
+        if age > self.max_staleness:
+            if metrics is not None:
+                metrics.inc(endpoint, "stale_expired")
+            return None
+        if metrics is not None:
+            metrics.inc(endpoint, "stale_served")
+            metrics.observe(endpoint, "stale_age", age)
+        result = requests.Response()
+        result.status_code = entry.status_code
+        result._content = entry.content
+        result.headers = CaseInsensitiveDict({**entry.headers, STALE_HEADER: f"{age:.0f}"})
+        result.encoding = entry.encoding
+        result.url = url
+        result.elapsed = datetime.timedelta(0)
+        result.reason = "Stale"
+        _stale_age.set(age)
+        return result
+
+    def send(self, endpoint: str, method: str, url: str, params, send, metrics=None) -> requests.Response:
+        """
+        Выполнить запрос чтения с подстановкой сохраненного ответа при недоступности iiko
+
+        :param send: функция без аргументов, отправляющая запрос
+        :param metrics: pyiikoapi.metrics.Metrics или None
+        """
+        _stale_age.set(None)
+        key = _key(method, url, params)
+        if self.down(url):
+            result = self._stale(key, url, endpoint, metrics, miss=False)
+            if result is not None:
+                return result
+        try:
+            result = send()
+        except (RateLimitExceeded, ConcurrencyLimitExceeded):
+            # запрос не дошел до iiko - ограничение на нашей стороне, хост доступен
+            raise
+        except requests.exceptions.RequestException:
+            self._mark(url, True)
+            result = self._stale(key, url, endpoint, metrics)
+            if result is None:
+                raise
+            return result
+        if result.status_code in self.statuses:
+            self._mark(url, True)
+            stale = self._stale(key, url, endpoint, metrics)
+            return result if stale is None else stale
+        self._mark(url, False)
+        if result.status_code < 400:
+            self._store(key, result)
+        return result
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__down.clear()
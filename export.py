@@ -0,0 +1,264 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from datetime import datetime as dt
+from datetime import timedelta as td
+
+from .core import is_data
+
+
+class _AtomicFile:
+    """Файл пишется во временный рядом с целевым и появляется под своим именем только после close()"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        descriptor, self.tmp = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+        os.close(descriptor)
+
+    def commit(self):
+        os.replace(self.tmp, self.path)
+
+    def abort(self):
+        try:
+            os.unlink(self.tmp)
+        except OSError:
+            pass
+
+
+class Sink:
+    """
+    Приемник записей. Записи пишутся сразу в файл, в памяти хранится не больше одной группы строк.
+    Используется как контекстный менеджер: при исключении файл не создается.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._file = _AtomicFile(path)
+
+    def write(self, record: dict):
+        raise NotImplementedError
+
+    def write_many(self, records) -> int:
+        for record in records:
+            self.write(record)
+        return self.count
+
+    def _finish(self):
+        pass
+
+    def close(self):
+        """Дописать файл и атомарно переименовать в path"""
+        self._finish()
+        self._file.commit()
+
+    def abort(self):
+        """Прервать экспорт, временный файл удаляется"""
+        try:
+            self._finish()
+        finally:
+            self._file.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def _text(path: str, compression: str):
+    if compression == "gzip":
+        return io.TextIOWrapper(gzip.open(path, "wb"), encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+class JsonlSink(Sink):
+    def __init__(self, path: str, compression: str = None):
+        """
+        :param compression: None или "gzip"
+        """
+        super().__init__(path)
+        self._stream = _text(self._file.tmp, compression)
+
+    def write(self, record: dict):
+        self._stream.write(json.dumps(record, ensure_ascii=False, default=str))
+        self._stream.write("\n")
+        self.count += 1
+
+    def _finish(self):
+        if not self._stream.closed:
+            self._stream.close()
+
+
+class CsvSink(Sink):
+    def __init__(self, path: str, fieldnames: list = None, compression: str = None, delimiter: str = ","):
+        """
+        :param fieldnames: колонки; по умолчанию ключи первой записи, лишние ключи следующих записей отбрасываются
+        :param compression: None или "gzip"
+        """
+        super().__init__(path)
+        self.fieldnames = fieldnames
+        self.delimiter = delimiter
+        self._stream = _text(self._file.tmp, compression)
+        self._writer = None
+
+    def write(self, record: dict):
+        if self._writer is None:
+            self.fieldnames = self.fieldnames or list(record)
+            self._writer = csv.DictWriter(self._stream, self.fieldnames, restval="", extrasaction="ignore",
+                                          delimiter=self.delimiter)
+            self._writer.writeheader()
+        self._writer.writerow({key: json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list))
+                               else value for key, value in record.items()})
+        self.count += 1
+
+    def _finish(self):
+        if not self._stream.closed:
+            self._stream.close()
+
+
+class ParquetSink(Sink):
+    """Parquet через pyarrow (pip install pyarrow); записи буферизуются группами по row_group_size строк"""
+
+    def __init__(self, path: str, row_group_size: int = 50000, compression: str = "snappy", schema=None):
+        """
+        :param row_group_size: строк в группе (и максимум строк в памяти)
+        :param compression: "snappy", "zstd", "gzip" или None
+        :param schema: pyarrow.Schema; по умолчанию выводится из первой группы строк
+        """
+        import pyarrow
+        import pyarrow.parquet
+        self._pyarrow = pyarrow
+        self._parquet = pyarrow.parquet
+        super().__init__(path)
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.schema = schema
+        self._rows = []
+        self._writer = None
+
+    def write(self, record: dict):
+        self._rows.append(record)
+        self.count += 1
+        if len(self._rows) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+        table = self._pyarrow.Table.from_pylist(self._rows, schema=self.schema)
+        if self._writer is None:
+            self.schema = table.schema
+            self._writer = self._parquet.ParquetWriter(self._file.tmp, self.schema, compression=self.compression)
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self._rows = []
+
+    def _finish(self):
+        self._flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        else:
+            # пустой экспорт - файл без строк
+            self._parquet.write_table(self._pyarrow.table({}) if self.schema is None
+                                      else self.schema.empty_table(), self._file.tmp)
+
+
+SINKS = {"csv": CsvSink, "jsonl": JsonlSink, "parquet": ParquetSink}
+
+
+def open_sink(path: str, file_format: str = None, **options) -> Sink:
+    """
+    Открыть приемник по формату или расширению файла (.csv, .jsonl, .parquet, .csv.gz, .jsonl.gz)
+
+    :param options: параметры CsvSink, JsonlSink или ParquetSink
+    """
+    name = path.lower()
+    if name.endswith(".gz"):
+        options.setdefault("compression", "gzip")
+        name = name[:-3]
+    if file_format is None:
+        file_format = os.path.splitext(name)[1].lstrip(".") or "jsonl"
+        file_format = "jsonl" if file_format == "json" else file_format
+    return SINKS[file_format](path, **options)
+
+
+def export(records, path: str, file_format: str = None, **options) -> int:
+    """
+    Записать записи в файл потоком
+
+    :param records: итерируемый объект записей (генераторы ниже или любой другой)
+    :return: количество записанных строк
+    """
+    with open_sink(path, file_format, **options) as sink:
+        sink.write_many(records)
+    return sink.count
+
+
+def _windows(date_from: str, date_to: str, days: int, date_format: str):
+    start = dt.strptime(date_from, date_format)
+    end = dt.strptime(date_to, date_format) + td(days=1)
+    while start < end:
+        stop = min(start + td(days=days), end)
+        yield start.strftime(date_format), (stop - td(days=1)).strftime(date_format)
+        start = stop
+
+
+def _checked(response, method: str, window, *lists: str):
+    """
+    Ответ окна выгрузки; тело ошибки iiko прерывает экспорт до того, как sink закроет файл,
+    иначе неполная выгрузка была бы записана как полная
+    """
+    if not is_data(response, *lists):
+        raise ValueError(f"Неожиданный ответ {method} за {window}: {str(response)[:300]}")
+    return response
+
+
+def olap_records(api, olap_report_request: dict, days: int = 1, cache=None, preset: bool = False):
+    """
+    Строки олап-отчета (Olaps.olap) по частям окна; в памяти - ответ за days дней
+
+    :param api: BizService
+    :param cache: pyiikoapi.biz.olap_cache.OlapCache - брать закрытые дни из кэша
+    :param preset: True - olap_by_preset
+    """
+    from .biz.olap_cache import shard_requests
+    source = cache if cache is not None else api
+    for request in shard_requests(olap_report_request, days):
+        method = "olap_by_preset" if preset else "olap"
+        response = getattr(source, method)(request)
+        window = (request.get("dateFrom", request.get("from")), request.get("dateTo", request.get("to")))
+        yield from _checked(response, method, window, "data")["data"]
+
+
+def customers_records(api, date_from: str, date_to: str, days: int = 100, unique: bool = True,
+                      date_format: str = "%Y-%m-%d"):
+    """
+    Гости (Customers.get_customers_by_organization_and_by_period) по окнам не больше 100 дней
+
+    :param unique: пропускать гостей, уже выгруженных из предыдущих окон (хранится множество id)
+    """
+    seen = set()
+    for window_from, window_to in _windows(date_from, date_to, days, date_format):
+        response = api.get_customers_by_organization_and_by_period({"dateFrom": window_from, "dateTo": window_to})
+        for guest in _checked(response, "get_customers_by_organization_and_by_period", (window_from, window_to)):
+            if unique:
+                if guest.get("id") in seen:
+                    continue
+                seen.add(guest.get("id"))
+            yield guest
+
+
+def transactions_records(api, date_from: str, date_to: str, days: int = 1, user_id: str = None,
+                         date_format: str = "%Y-%m-%d"):
+    """Транзакции гостей (Customers.transactions_report) по окнам в days дней"""
+    for window_from, window_to in _windows(date_from, date_to, days, date_format):
+        response = api.transactions_report({"date_from": window_from, "date_to": window_to}, user_id=user_id)
+        yield from _checked(response, "transactions_report", (window_from, window_to))
@@ -0,0 +1,170 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+# идемпотентные методы чтения, которые дублируются по умолчанию
+DEFAULT_ENDPOINTS = (
+    "orders/info",
+    "customers/get_customer_by_phone",
+    "customers/get_customer_by_id",
+    "customers/get_customer_by_card",
+)
+
+
+class _Latency:
+    """Окно последних времен ответа метода; квантиль пересчитывается раз в refresh замеров"""
+    __slots__ = ("values", "quantile", "pending")
+
+    def __init__(self, window: int):
+        self.values = deque(maxlen=window)
+        self.quantile = None
+        self.pending = 0
+
+
+def _close(future):
+    """Закрыть ответ проигравшей попытки, соединение возвращается в пул"""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class HedgingPolicy:
+    """
+    Дублирование медленных идемпотентных GET запросов (hedged requests).
+
+    Если ответ на запрос не пришел за percentile недавних времен ответа этого метода,
+    отправляется вторая такая же попытка; возвращается ответ, пришедший первым. Ответ
+    второй попытки закрывается (запрос requests нельзя прервать на лету, поэтому
+    проигравшая попытка дочитывается в фоне и ее соединение возвращается в пул).
+
+    Дополнительная нагрузка ограничена бюджетом: каждый запрос добавляет budget попыток,
+    дубль тратит одну, накопить можно не больше burst. При budget=0.05 дублей не больше 5%
+    запросов даже если iiko тормозит целиком. Дубль расходует и маркер ограничителя частоты
+    (api.rate_limiter): если маркера нет сразу, дубль не отправляется.
+
+    Пример:
+        api.hedging = HedgingPolicy(percentile=0.95, budget=0.05)
+        api.hedging.stats()
+    """
+
+    def __init__(self, endpoints: tuple = DEFAULT_ENDPOINTS, percentile: float = 0.95, min_delay: float = 0.05,
+                 initial_delay: float = 1.0, budget: float = 0.05, burst: float = 10.0, window: int = 1000,
+                 min_samples: int = 20, refresh: int = 50, workers: int = 32):
+        """
+        :param endpoints: имена методов (pyiikoapi.core.endpoint_name), запросы которых можно дублировать
+        :param percentile: квантиль времени ответа, после которого отправляется вторая попытка
+        :param min_delay: минимальная задержка второй попытки в секундах
+        :param initial_delay: задержка, пока замеров метода меньше min_samples
+        :param budget: доля дополнительных запросов
+        :param burst: максимальный накопленный запас дублей
+        :param window: число последних замеров метода для расчета квантиля
+        :param refresh: через сколько замеров пересчитывать квантиль
+        :param workers: число потоков, выполняющих попытки
+        """
+        self.endpoints = set(endpoints)
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.initial_delay = initial_delay
+        self.budget = budget
+        self.burst = burst
+        self.window = window
+        self.min_samples = min_samples
+        self.refresh = refresh
+
+        self.__lock = threading.Lock()
+        self.__latency = {}
+        self.__tokens = burst
+        self.__stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "budget_exhausted": 0, "rate_limited": 0}
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pyiikoapi-hedge")
+
+    def applies(self, method: str, endpoint: str) -> bool:
+        return method.upper() == "GET" and endpoint in self.endpoints
+
+    def delay(self, endpoint: str) -> float:
+        """Задержка второй попытки для метода"""
+        with self.__lock:
+            latency = self.__latency.get(endpoint)
+            quantile = None if latency is None else latency.quantile
+        return self.initial_delay if quantile is None else max(self.min_delay, quantile)
+
+    def _record(self, endpoint: str, started: float):
+        elapsed = time.perf_counter() - started
+        with self.__lock:
+            latency = self.__latency.get(endpoint)
+            if latency is None:
+                latency = self.__latency[endpoint] = _Latency(self.window)
+            latency.values.append(elapsed)
+            latency.pending += 1
+            if len(latency.values) >= self.min_samples and (latency.quantile is None
+                                                             or latency.pending >= self.refresh):
+                values = sorted(latency.values)
+                latency.quantile = values[min(len(values) - 1, int(len(values) * self.percentile))]
+                latency.pending = 0
+
+    def _attempt(self, endpoint: str, send):
+        started = time.perf_counter()
+        result = send()
+        self._record(endpoint, started)
+        return result
+
+    def _take(self, admit=None) -> bool:
+        with self.__lock:
+            if self.__tokens < 1.0:
+                self.__stats["budget_exhausted"] += 1
+                return False
+            self.__tokens -= 1.0
+        if admit is not None and not admit():
+            with self.__lock:
+                self.__tokens = min(self.burst, self.__tokens + 1.0)
+                self.__stats["rate_limited"] += 1
+            return False
+        with self.__lock:
+            self.__stats["hedged"] += 1
+        return True
+
+    def send(self, endpoint: str, send, admit=None):
+        """
+        Выполнить запрос с возможным дублем
+
+        :param send: функция без аргументов, отправляющая запрос и возвращающая requests.Response
+        :param admit: функция без аргументов, разрешающая дубль (например списывает маркер ограничителя
+            частоты без ожидания); False - дубль не отправляется
+        """
+        with self.__lock:
+            self.__stats["requests"] += 1
+            self.__tokens = min(self.burst, self.__tokens + self.budget)
+        first = self.__executor.submit(self._attempt, endpoint, send)
+        done, _ = wait((first,), timeout=self.delay(endpoint))
+        if done or not self._take(admit):
+            return first.result()
+        second = self.__executor.submit(self._attempt, endpoint, send)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                for loser in pending:
+                    loser.add_done_callback(_close)
+                if future is second:
+                    with self.__lock:
+                        self.__stats["hedge_wins"] += 1
+                return future.result()
+        raise error
+
+    def stats(self) -> dict:
+        """
+        Счетчики: requests, hedged (отправлено дублей), hedge_wins, budget_exhausted,
+        rate_limited (дубль не отправлен - нет маркера ограничителя частоты) и задержки методов
+        """
+        with self.__lock:
+            result = dict(self.__stats)
+            result["delays"] = {endpoint: latency.quantile for endpoint, latency in self.__latency.items()}
+        return result
+
+    def close(self):
+        self.__executor.shutdown(wait=False)
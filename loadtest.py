@@ -0,0 +1,407 @@
+"""
+Нагрузочный тест интеграции с iiko на локальном сервере-заглушке
+
+    python -m pyiikoapi.loadtest --mix orders/add=1,customers/get_customer_by_phone=4 --mode threaded \\
+        --concurrency 32 --duration 30 --latency 0.05 --tail 0.01:1.0 --error-rate 0.005
+    python -m pyiikoapi.loadtest --mode async --rps 200 --duration 60 --json
+    python -m pyiikoapi.loadtest --serve --port 9900        # только сервер-заглушка
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+import requests
+
+from .biz.api import BizService
+from .biz.exception import BizException
+from .card.api import CardService
+from .card.exception import CardException
+from .codec import sample_payloads
+from .core import endpoint_name
+
+MODES = ("sync", "threaded", "async")
+ORGANIZATION = "00000000-0000-0000-0000-000000000001"
+ORDER_ID = "00000000-0000-0000-0000-0000000000aa"
+
+
+def _order_request(number: int) -> dict:
+    return {"organization": ORGANIZATION,
+            "customer": {"name": "Нагрузка", "phone": f"+7999{number % 10000000:07d}"},
+            "order": {"phone": f"+7999{number % 10000000:07d}", "isSelfService": True,
+                      "items": [{"id": "00000000-0000-0000-0000-000000000010", "amount": 1}]}}
+
+
+# операция -> (сервис, вызов(api, номер запроса))
+OPERATIONS = {
+    "orders/add": ("biz", lambda api, number: api.add(_order_request(number))),
+    "orders/info": ("biz", lambda api, number: api.info(ORDER_ID)),
+    "nomenclature": ("biz", lambda api, number: api.nomenclature()),
+    "stopLists/getDeliveryStopList": ("biz", lambda api, number: api.get_delivery_stop_list()),
+    "customers/get_customer_by_phone": ("card", lambda api, number: api.get_customer_by_phone(
+        {"phone": f"+7999{number % 10000000:07d}"})),
+    "orders/calculate_checkin_result": ("card", lambda api, number: api.calculate_checkin_result(
+        _order_request(number))),
+}
+
+
+class FakeIikoServer:
+    """
+    HTTP сервер, отвечающий как iiko biz/card на методы из OPERATIONS, с заданной задержкой и ошибками
+
+    Задержка ответа: latency * (1 +- jitter) и с вероятностью tail[0] - tail[1] секунд.
+    С вероятностью error_rate возвращается error_status.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.02, jitter: float = 0.5,
+                 tail: tuple = (0.0, 0.0), error_rate: float = 0.0, error_status: int = 503,
+                 menu_size: int = 200):
+        self.latency = latency
+        self.jitter = jitter
+        self.tail = tail
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.__lock = threading.Lock()
+        self.__random = random.Random()
+        self.bodies = self._bodies(menu_size)
+        self.__server = ThreadingHTTPServer((host, port), self._handler())
+        self.__server.daemon_threads = True
+        self.__thread = None
+
+    @staticmethod
+    def _bodies(menu_size: int) -> dict:
+        guest = {"id": "00000000-0000-0000-0000-0000000000bb", "name": "Нагрузка", "phone": "+79990000000",
+                 "walletBalances": [{"wallet": {"id": "w", "name": "Бонусы"}, "balance": 100.0}]}
+        order = {"orderId": ORDER_ID, "number": "1", "status": "Новая", "sum": 100.0}
+        return {
+            "auth/access_token": b'"TOKEN"',
+            "auth/echo": b'"warmup"',
+            "nomenclature/{id}": json.dumps(sample_payloads(menu_size)["nomenclature/{id}"]).encode("utf-8"),
+            "orders/add": json.dumps(order).encode("utf-8"),
+            "orders/info": json.dumps(order).encode("utf-8"),
+            "stopLists/getDeliveryStopList": b'{"stopList": []}',
+            "customers/get_customer_by_phone": json.dumps(guest).encode("utf-8"),
+            "orders/calculate_checkin_result": b'{"loyaltyProgramResults": [], "availablePayments": []}',
+        }
+
+    def _delay(self) -> tuple:
+        with self.__lock:
+            self.requests += 1
+            error = self.__random.random() < self.error_rate
+            if self.tail[0] and self.__random.random() < self.tail[0]:
+                return self.tail[1], error
+            return max(0.0, self.latency * (1 + self.__random.uniform(-self.jitter, self.jitter))), error
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # заголовки и тело уходят отдельными пакетами: без TCP_NODELAY задержанный ACK добавит ~40 мс
+            disable_nagle_algorithm = True
+
+            def _reply(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                endpoint = endpoint_name(self.path)
+                delay, error = server._delay()
+                if delay:
+                    time.sleep(delay)
+                if endpoint == "auth/access_token":
+                    status, body = 200, server.bodies[endpoint]
+                elif error:
+                    status, body = server.error_status, b'{"message": "fake error"}'
+                else:
+                    status, body = 200, server.bodies.get(endpoint, b"{}")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = _reply
+            do_POST = _reply
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    @property
+    def url(self) -> str:
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name="pyiikoapi-fake-iiko",
+                                         daemon=True)
+        self.__thread.start()
+        return self
+
+    def serve_forever(self):
+        self.__server.serve_forever()
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def parse_mix(mix: str) -> dict:
+    """"orders/add=1,customers/get_customer_by_phone=4" -> {операция: вес}"""
+    result = {}
+    for part in mix.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in OPERATIONS:
+            raise ValueError(f"Неизвестная операция: {name}; доступны: {', '.join(OPERATIONS)}")
+        result[name] = float(weight or 1)
+    return result
+
+
+def _rss() -> int:
+    """Текущий RSS процесса в байтах (максимальный, если /proc недоступен)"""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _percentile(values: list, q: float) -> float:
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class LoadTest:
+    """
+    Прогон смеси операций с заданной интенсивностью (rps, открытая модель) или конкурентностью
+    (закрытая модель). При заданном rps задержка считается от запланированного времени запроса,
+    поэтому очередь на стороне клиента тоже попадает в перцентили.
+
+    Режимы: sync - один поток, threaded - concurrency потоков с общими сервисами,
+    async - concurrency задач asyncio, вызывающих сервисы через asyncio.to_thread.
+    """
+
+    def __init__(self, url: str, mix: dict, mode: str = "threaded", concurrency: int = 16, rps: float = None,
+                 duration: float = 10.0, seed: int = None):
+        if mode not in MODES:
+            raise ValueError(f"Неизвестный режим: {mode}")
+        self.url = url
+        self.mix = mix
+        self.mode = mode
+        self.concurrency = 1 if mode == "sync" else concurrency
+        self.rps = rps
+        self.duration = duration
+        self.seed = seed
+        self.__lock = threading.Lock()
+        self.__next = 0
+        self.__latencies = {name: [] for name in mix}
+        self.__errors = {name: 0 for name in mix}
+        self.__local = threading.local()
+        self.__services = self._services()
+
+    def _services(self) -> dict:
+        services = {}
+        kinds = {OPERATIONS[name][0] for name in self.mix}
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(10, self.concurrency))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        # методы API возвращают тело ответа и при 4xx/5xx, поэтому статус запоминается хуком сессии
+        session.hooks["response"].append(self._on_response)
+        for kind, service in (("biz", BizService), ("card", CardService)):
+            if kind in kinds:
+                api = service("loadtest", "secret", ORGANIZATION, session=session, lazy_token=True)
+                api.base_url = self.url
+                services[kind] = api
+        return services
+
+    def _ticket(self, started: float):
+        """Номер следующего запроса и его запланированное время; None - время теста вышло"""
+        with self.__lock:
+            number = self.__next
+            self.__next += 1
+        scheduled = started + number / self.rps if self.rps else None
+        if (scheduled or time.perf_counter()) >= started + self.duration:
+            return None
+        return number, scheduled
+
+    def _on_response(self, response, *args, **kwargs):
+        if response.status_code >= 400:
+            self.__local.failed = True
+
+    def _call(self, name: str, number: int, scheduled: float):
+        kind, call = OPERATIONS[name]
+        begin = scheduled or time.perf_counter()
+        self.__local.failed = False
+        try:
+            call(self.__services[kind], number)
+            error = self.__local.failed
+        except (BizException, CardException):
+            error = True
+        elapsed = time.perf_counter() - begin
+        with self.__lock:
+            if error:
+                self.__errors[name] += 1
+            else:
+                self.__latencies[name].append(elapsed)
+
+    def _worker(self, started: float, chooser: random.Random):
+        names, weights = list(self.mix), list(self.mix.values())
+        while True:
+            ticket = self._ticket(started)
+            if ticket is None:
+                return
+            number, scheduled = ticket
+            if scheduled is not None:
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            self._call(chooser.choices(names, weights)[0], number, scheduled)
+
+    async def _task(self, started: float, chooser: random.Random):
+        names, weights = list(self.mix), list(self.mix.values())
+        while True:
+            ticket = self._ticket(started)
+            if ticket is None:
+                return
+            number, scheduled = ticket
+            if scheduled is not None:
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await asyncio.to_thread(self._call, chooser.choices(names, weights)[0], number, scheduled)
+
+    async def _run_async(self, started: float):
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=self.concurrency,
+                                                     thread_name_prefix="pyiikoapi-loadtest"))
+        await asyncio.gather(*(self._task(started, random.Random(None if self.seed is None else self.seed + index))
+                               for index in range(self.concurrency)))
+
+    def run(self) -> dict:
+        """
+        :return: {"mode", "concurrency", "rps_target", "duration", "requests", "errors", "throughput",
+            "cpu_seconds", "cpu_percent", "rss_bytes", "operations": {операция: {"requests", "errors",
+            "p50", "p90", "p99", "max"}}}
+        """
+        for api in self.__services.values():
+            api.check_token_time()
+        rss_before = _rss()
+        cpu = time.process_time()
+        started = time.perf_counter()
+        if self.mode == "async":
+            asyncio.run(self._run_async(started))
+        else:
+            threads = [threading.Thread(target=self._worker, name=f"pyiikoapi-loadtest-{index}",
+                                        args=(started, random.Random(None if self.seed is None
+                                                                     else self.seed + index)))
+                       for index in range(self.concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        wall = time.perf_counter() - started
+        cpu = time.process_time() - cpu
+
+        operations = {}
+        for name, latencies in self.__latencies.items():
+            latencies.sort()
+            operations[name] = {"requests": len(latencies) + self.__errors[name], "errors": self.__errors[name],
+                                "p50": _percentile(latencies, 0.5), "p90": _percentile(latencies, 0.9),
+                                "p99": _percentile(latencies, 0.99), "max": latencies[-1] if latencies else None}
+        total = sum(operation["requests"] for operation in operations.values())
+        return {"mode": self.mode, "concurrency": self.concurrency, "rps_target": self.rps, "duration": wall,
+                "requests": total, "errors": sum(self.__errors.values()), "throughput": total / wall,
+                "cpu_seconds": cpu, "cpu_percent": 100.0 * cpu / wall, "rss_bytes": _rss(),
+                "rss_growth_bytes": _rss() - rss_before, "operations": operations}
+
+
+def _ms(value) -> str:
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+
+def format_report(report: dict) -> str:
+    lines = [f"mode={report['mode']} concurrency={report['concurrency']} rps_target={report['rps_target']} "
+             f"duration={report['duration']:.1f}s",
+             f"requests={report['requests']} errors={report['errors']} throughput={report['throughput']:.1f} rps",
+             f"cpu={report['cpu_seconds']:.2f}s ({report['cpu_percent']:.0f}%) "
+             f"rss={report['rss_bytes'] / 1048576:.1f} MiB (+{report['rss_growth_bytes'] / 1048576:.1f})",
+             f"{'operation':<36} {'requests':>9} {'errors':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} "
+             f"{'max ms':>8}"]
+    for name, row in report["operations"].items():
+        lines.append(f"{name:<36} {row['requests']:>9} {row['errors']:>7} {_ms(row['p50']):>8} "
+                     f"{_ms(row['p90']):>8} {_ms(row['p99']):>8} {_ms(row['max']):>8}")
+    return "\n".join(lines)
+
+
+def _tail(value: str) -> tuple:
+    probability, _, delay = value.partition(":")
+    return float(probability), float(delay or 0)
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(prog="python -m pyiikoapi.loadtest",
+                                     description="Нагрузочный тест pyiikoapi на локальном сервере-заглушке iiko")
+    parser.add_argument("--mix", default="orders/add=1,customers/get_customer_by_phone=4",
+                        help=f"операции и веса через запятую; доступны: {', '.join(OPERATIONS)}")
+    parser.add_argument("--mode", choices=MODES, nargs="+", default=["threaded"],
+                        help="режимы клиента (можно несколько)")
+    parser.add_argument("--concurrency", type=int, default=16, help="потоков или задач asyncio")
+    parser.add_argument("--rps", type=float, default=None, help="целевая интенсивность; без нее - закрытая модель")
+    parser.add_argument("--duration", type=float, default=10.0, help="длительность прогона в секундах")
+    parser.add_argument("--url", default=None, help="адрес уже запущенного сервера (по умолчанию встроенный)")
+    parser.add_argument("--latency", type=float, default=0.02, help="средняя задержка ответа сервера в секундах")
+    parser.add_argument("--jitter", type=float, default=0.5, help="разброс задержки, доля от latency")
+    parser.add_argument("--tail", type=_tail, default=(0.0, 0.0), help="медленные ответы: вероятность:секунды")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов с ошибкой")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--serve", action="store_true", help="только запустить сервер-заглушку")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="отчет в JSON")
+    args = parser.parse_args(argv)
+
+    server = None
+    url = args.url
+    if url is None or args.serve:
+        server = FakeIikoServer(port=args.port, latency=args.latency, jitter=args.jitter, tail=args.tail,
+                                error_rate=args.error_rate, error_status=args.error_status)
+        if args.serve:
+            print(f"fake iiko: {server.url}")
+            server.serve_forever()
+            return
+        server.start()
+        url = server.url
+    try:
+        mix = parse_mix(args.mix)
+        reports = [LoadTest(url, mix, mode, args.concurrency, args.rps, args.duration, args.seed).run()
+                   for mode in args.mode]
+    finally:
+        if server is not None:
+            server.stop()
+    if args.json:
+        print(json.dumps(reports, ensure_ascii=False, indent=2))
+    else:
+        print("\n\n".join(format_report(report) for report in reports))
+        if server is not None:
+            print("\nСервер-заглушка работает в том же процессе: cpu и rss включают его.")
+
+
+if __name__ == "__main__":
+    main()
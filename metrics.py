@@ -0,0 +1,214 @@
+import bisect
+import threading
+
+# Границы корзин гистограмм: время в секундах и размер в байтах
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 120.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+# Возраст ответов, отданных из кэша в деградированном режиме (pyiikoapi.degraded), в секундах
+AGE_BUCKETS = (1.0, 10.0, 30.0, 60.0, 300.0, 900.0, 1800.0, 3600.0, 7200.0, 21600.0, 86400.0)
+
+# Фазы запроса, которые записывает RequestCore
+PHASES = ("token", "queue", "ttfb", "download", "total", "decode")
+SIZES = ("response_bytes",)
+AGES = ("stale_age",)
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин (кумулятивные значения считаются при выгрузке)"""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля q (0..1) по верхней границе корзины"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[index] if index < len(self.bounds) else float("inf")
+        return float("inf")
+
+
+def count_event(api, endpoint: str, event: str, value: int = 1):
+    """
+    Увеличить счетчик события в api.metrics, если метрики сервису присвоены
+    (попадания в кэши cache_hit/cache_miss, повторные отправки retry)
+    """
+    metrics = getattr(api, "metrics", None)
+    if metrics is not None:
+        metrics.inc(endpoint, event, value)
+
+
+def _labels(**labels) -> str:
+    return ",".join('{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                    for key, value in labels.items())
+
+
+class Metrics:
+    """
+    Метрики запросов в памяти процесса по имени метода API (pyiikoapi.core.endpoint_name).
+
+    Фазы (секунды):
+        token - обновление маркера доступа, которое пришлось сделать перед запросом
+        queue - ожидание в планировщике и ограничителе частоты
+        ttfb - от отправки до получения заголовков ответа (включает установку соединения,
+               requests не отдает время connect отдельно)
+        download - чтение тела ответа
+        total - отправка запроса целиком
+        decode - разбор JSON ответа
+    Размеры: response_bytes.
+    Счетчики: requests, errors, http_<код>, rate_limited и любые другие через inc().
+    Кэши (OlapCache, OrderValidator, DeliveryZones, ReferenceMirror, LoyaltyCalculator, ComboCatalog)
+    считают cache_hit/cache_miss, очереди с повторами (OrderOutbox, CourierSyncBuffer, GuestImporter,
+    BalanceLedger) - retry; счетчики записываются по методу API, запрос к которому сэкономлен или повторен.
+
+    Пример:
+        metrics = Metrics()
+        api.metrics = metrics
+        metrics.serve_prometheus(9464)
+        metrics.enable_opentelemetry()
+
+    Если метрики не присвоены сервису (api.metrics = None по умолчанию), _request не делает
+    лишних замеров времени.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__histograms = {}
+        self.__counters = {}
+        self.__tracer = None
+
+    def observe(self, endpoint: str, phase: str, value: float):
+        """Записать значение фазы или размера"""
+        key = (endpoint, phase)
+        with self.__lock:
+            histogram = self.__histograms.get(key)
+            if histogram is None:
+                histogram = Histogram(SIZE_BUCKETS if phase in SIZES else AGE_BUCKETS if phase in AGES
+                                      else TIME_BUCKETS)
+                self.__histograms[key] = histogram
+            histogram.observe(value)
+
+    def inc(self, endpoint: str, event: str, value: int = 1):
+        """Увеличить счетчик события"""
+        key = (endpoint, event)
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + value
+
+    def histogram(self, endpoint: str, phase: str) -> Histogram:
+        """Гистограмма фазы метода или None"""
+        with self.__lock:
+            return self.__histograms.get((endpoint, phase))
+
+    def counter(self, endpoint: str, event: str) -> int:
+        with self.__lock:
+            return self.__counters.get((endpoint, event), 0)
+
+    def snapshot(self) -> dict:
+        """
+        Снимок метрик
+        :return: {"histograms": {(endpoint, phase): {"count", "sum", "p50", "p99"}}, "counters": {(endpoint, event): n}}
+        """
+        with self.__lock:
+            histograms = {key: {"count": h.count, "sum": h.sum, "p50": h.quantile(0.5), "p99": h.quantile(0.99)}
+                          for key, h in self.__histograms.items()}
+            counters = dict(self.__counters)
+        return {"histograms": histograms, "counters": counters}
+
+    def reset(self):
+        with self.__lock:
+            self.__histograms.clear()
+            self.__counters.clear()
+
+    def prometheus_text(self) -> str:
+        """Метрики в текстовом формате Prometheus"""
+        with self.__lock:
+            histograms = [(key, h.bounds, list(h.counts), h.sum, h.count) for key, h in self.__histograms.items()]
+            counters = list(self.__counters.items())
+
+        lines = []
+        for name, sizes in (("pyiikoapi_phase_seconds", False), ("pyiikoapi_payload_bytes", True)):
+            lines.append(f"# TYPE {name} histogram")
+            for (endpoint, phase), bounds, counts, total, count in sorted(histograms):
+                if (phase in SIZES) != sizes:
+                    continue
+                cumulative = 0
+                for bound, bucket in zip(bounds + (float("inf"),), counts):
+                    cumulative += bucket
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{{{_labels(endpoint=endpoint, phase=phase, le=le)}}} {cumulative}")
+                lines.append(f"{name}_sum{{{_labels(endpoint=endpoint, phase=phase)}}} {total}")
+                lines.append(f"{name}_count{{{_labels(endpoint=endpoint, phase=phase)}}} {count}")
+        lines.append("# TYPE pyiikoapi_events_total counter")
+        for (endpoint, event), value in sorted(counters):
+            lines.append(f"pyiikoapi_events_total{{{_labels(endpoint=endpoint, event=event)}}} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve_prometheus(self, port: int = 9464, addr: str = "0.0.0.0"):
+        """
+        Запустить HTTP сервер метрик Prometheus в фоновом потоке
+
+        :return: http.server.ThreadingHTTPServer, остановить - server.shutdown()
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((addr, port), Handler)
+        threading.Thread(target=server.serve_forever, name="pyiikoapi-metrics", daemon=True).start()
+        return server
+
+    def enable_opentelemetry(self, tracer=None):
+        """
+        Создавать span OpenTelemetry на каждый запрос (нужен пакет opentelemetry-api)
+
+        :param tracer: opentelemetry.trace.Tracer, по умолчанию trace.get_tracer("pyiikoapi")
+        """
+        if tracer is None:
+            from opentelemetry import trace
+            tracer = trace.get_tracer("pyiikoapi")
+        self.__tracer = tracer
+
+    def start_span(self, endpoint: str, method: str):
+        tracer = self.__tracer
+        if tracer is None:
+            return None
+        span = tracer.start_span(f"iiko {endpoint}")
+        span.set_attribute("http.method", method)
+        span.set_attribute("iiko.endpoint", endpoint)
+        return span
+
+    @staticmethod
+    def end_span(span, status_code: int = None, error: Exception = None):
+        if span is None:
+            return
+        if status_code is not None:
+            span.set_attribute("http.status_code", status_code)
+        if error is not None:
+            span.record_exception(error)
+        span.end()
@@ -0,0 +1,256 @@
+import sys
+
+
+class Field:
+    """Скалярное поле модели: значение ключа key из JSON ответа"""
+
+    __slots__ = ("key",)
+
+    def __init__(self, key: str):
+        self.key = key
+
+
+class Nested:
+    """
+    Вложенная модель (many=True - список моделей).
+    Хранит исходные данные ответа и превращает их в модели только при первом обращении к полю.
+    """
+
+    def __init__(self, key: str, model, many: bool = False):
+        self.key = key
+        self.model = model
+        self.many = many
+        self.name = None
+        self.slot = None
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = self.slot.__get__(instance, owner)
+        if self.many:
+            if type(value) is list:
+                value = self.model.many(value)
+                self.slot.__set__(instance, value)
+            elif value is None:
+                return ()
+        elif type(value) is dict:
+            value = self.model.from_dict(value)
+            self.slot.__set__(instance, value)
+        return value
+
+    def __set__(self, instance, value):
+        self.slot.__set__(instance, value)
+
+
+class ModelMeta(type):
+    """Превращает объявления Field/Nested в __slots__, чтобы у экземпляров не было __dict__"""
+
+    def __new__(mcs, name, bases, namespace):
+        fields = []
+        nested = []
+        slots = list(namespace.get("__slots__", ()))
+        for attr, value in list(namespace.items()):
+            if isinstance(value, Field):
+                del namespace[attr]
+                fields.append((attr, value.key))
+                slots.append(attr)
+            elif isinstance(value, Nested):
+                value.name = attr
+                nested.append(value)
+                slots.append(f"_{attr}")
+        namespace["__slots__"] = tuple(slots)
+        cls = super().__new__(mcs, name, bases, namespace)
+
+        for item in nested:
+            item.slot = cls.__dict__[f"_{item.name}"]
+        inherited_fields = ()
+        inherited_nested = ()
+        for base in bases:
+            inherited_fields += getattr(base, "_fields", ())
+            inherited_nested += getattr(base, "_nested", ())
+        cls._fields = inherited_fields + tuple(fields)
+        cls._nested = inherited_nested + tuple(nested)
+        cls._field_setters = tuple(setter for base in bases for setter in getattr(base, "_field_setters", ())) + \
+            tuple((cls.__dict__[attr], key) for attr, key in fields)
+        cls._setters = cls._field_setters + tuple((item.slot, item.key) for item in cls._nested)
+        return cls
+
+
+class Model(metaclass=ModelMeta):
+    """
+    Базовый класс типизированных моделей ответа.
+
+    Экземпляры не имеют __dict__: значения полей лежат в слотах, ключи ответа, не объявленные
+    в модели, отбрасываются. Вложенные объекты по умолчанию разбираются лениво при первом обращении.
+    Для больших коллекций, которые долго живут в памяти, используйте lazy=False: вложенные объекты
+    разбираются сразу, исходные словари освобождаются, а повторяющиеся строки (названия категорий,
+    кошельков, статусы) хранятся в одном экземпляре.
+
+        order = OrderInfo.from_dict(api.info(order_id))
+        order.status, order.items[0].name
+
+        guests = OrganizationGuestInfo.many(guests_list, lazy=False)
+        deep_sizeof(guests), deep_sizeof(guests_list)
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_dict(cls, data: dict, lazy: bool = True):
+        """Создать модель из словаря ответа (None -> None)"""
+        return cls._build(data, None if lazy else {})
+
+    @classmethod
+    def many(cls, items: list, lazy: bool = True) -> tuple:
+        """Создать кортеж моделей из списка словарей ответа"""
+        if items is None:
+            return ()
+        build = cls._build
+        memo = None if lazy else {}
+        return tuple(build(item, memo) for item in items)
+
+    @classmethod
+    def _build(cls, data: dict, memo: dict):
+        if data is None:
+            return None
+        instance = cls.__new__(cls)
+        get = data.get
+        if memo is None:
+            for slot, key in cls._setters:
+                slot.__set__(instance, get(key))
+            return instance
+
+        for slot, key in cls._field_setters:
+            value = get(key)
+            if type(value) is str:
+                value = memo.setdefault(value, value)
+            slot.__set__(instance, value)
+        for item in cls._nested:
+            value = get(item.key)
+            if item.many:
+                value = tuple(item.model._build(entry, memo) for entry in value) if value is not None else None
+            elif type(value) is dict:
+                value = item.model._build(value, memo)
+            item.slot.__set__(instance, value)
+        return instance
+
+    def to_dict(self) -> dict:
+        """Обратное преобразование в словарь в формате ответа API"""
+        result = {}
+        for attr, key in self._fields:
+            result[key] = getattr(self, attr)
+        for item in self._nested:
+            # отсутствующее вложенное поле - None и в ленивом, и в полном режиме
+            value = None if item.slot.__get__(self, type(self)) is None else getattr(self, item.name)
+            if isinstance(value, Model):
+                value = value.to_dict()
+            elif type(value) is tuple:
+                value = [entry.to_dict() for entry in value]
+            result[item.key] = value
+        return result
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    __hash__ = None
+
+    def __repr__(self):
+        shown = ", ".join(f"{attr}={getattr(self, attr)!r}" for attr, _ in self._fields[:3])
+        return f"{self.__class__.__name__}({shown})"
+
+
+class Record:
+    """
+    Компактная запись с произвольным набором ключей (строка олап-отчета, событие журнала).
+    Записи с одинаковым набором ключей делят один кортеж ключей, каждая запись хранит
+    только кортеж значений.
+    """
+
+    __slots__ = ("_keys", "_values")
+
+    def __init__(self, keys: tuple, values: tuple):
+        self._keys = keys
+        self._values = values
+
+    def __getitem__(self, key):
+        try:
+            return self._values[self._keys.index(key)]
+        except ValueError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        try:
+            return self._values[self._keys.index(key)]
+        except ValueError:
+            return default
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def keys(self) -> tuple:
+        return self._keys
+
+    def values(self) -> tuple:
+        return self._values
+
+    def items(self):
+        return zip(self._keys, self._values)
+
+    def to_dict(self) -> dict:
+        return dict(zip(self._keys, self._values))
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Record({self.to_dict()!r})"
+
+
+def records(items: list) -> tuple:
+    """Упаковать список словарей в кортеж Record с общими кортежами ключей"""
+    schemas = {}
+    result = []
+    for item in items or ():
+        keys = tuple(item)
+        keys = schemas.setdefault(keys, keys)
+        result.append(Record(keys, tuple(item.values())))
+    return tuple(result)
+
+
+def deep_sizeof(value, _seen: set = None) -> int:
+    """
+    Оценка памяти, занимаемой объектом вместе со всем содержимым (в байтах).
+    Общие объекты (интернированные ключи, кортежи ключей Record) учитываются один раз.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_sizeof(key, _seen) + deep_sizeof(item, _seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, _seen) for item in value)
+    elif isinstance(value, (str, bytes, int, float, bool)) or value is None:
+        pass
+    else:
+        for cls in type(value).__mro__:
+            for slot in cls.__dict__.get("__slots__", ()):
+                if hasattr(value, slot):
+                    size += deep_sizeof(getattr(value, slot), _seen)
+    return size
@@ -0,0 +1,209 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+
+def _reserve(state: list, rate: float, capacity: float, tokens: float, now: float) -> float:
+    """
+    Пересчитать состояние ведра и вернуть время ожидания до выдачи tokens маркеров.
+    state = [доступные маркеры, время последнего пересчета], изменяется на месте.
+    Баланс может уходить в минус: запрос резервирует маркеры сразу, а ожидание
+    растягивает поток запросов ровно до rate в секунду без рывков "перегрузка/простой".
+    """
+    available, stamp = state
+    available = min(capacity, available + (now - stamp) * rate)
+    state[0] = available - tokens
+    state[1] = now
+    if available >= tokens:
+        return 0.0
+    return (tokens - available) / rate
+
+
+class MemoryBucketBackend:
+    """
+    Хранилище состояния ведер в памяти процесса.
+    Общее для всех потоков и asyncio задач, использующих один RateLimiter.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__states = {}
+
+    def reserve(self, buckets: list, tokens: float, max_wait: float = None):
+        """
+        Атомарно зарезервировать маркеры сразу в нескольких ведрах
+
+        :param buckets: [(ключ, rate, capacity), ...]
+        :param tokens: количество маркеров
+        :param max_wait: максимальное допустимое ожидание в секундах, None - без ограничения
+        :return: время ожидания в секундах или None, если ожидание превысило max_wait (маркеры не списываются)
+        """
+        with self.__lock:
+            now = time.monotonic()
+            probe = [list(self.__states.get(key, (float(capacity), now))) for key, _, capacity in buckets]
+            wait = max([_reserve(p, rate, capacity, tokens, now)
+                        for p, (key, rate, capacity) in zip(probe, buckets)] or [0.0])
+            if max_wait is not None and wait > max_wait:
+                return None
+            for (key, _, _), state in zip(buckets, probe):
+                self.__states[key] = state
+            return wait
+
+    def drain(self, key: str, rate: float, delay: float):
+        """Опустошить ведро так, чтобы следующий маркер появился не раньше чем через delay секунд"""
+        with self.__lock:
+            now = time.monotonic()
+            state = self.__states.get(key, [0.0, now])
+            state[0] = min(state[0], -delay * rate)
+            state[1] = now
+            self.__states[key] = state
+
+
+class SQLiteBucketBackend:
+    """
+    Хранилище состояния ведер в файле SQLite.
+    Позволяет нескольким процессам (воркерам gunicorn/uwsgi, cron задачам) на одном хосте
+    делить один лимит апи логина. Время берется из time.time(), так как monotonic
+    не согласован между процессами.
+    """
+
+    def __init__(self, path: str, timeout: float = 10.0):
+        self.__path = path
+        self.__timeout = timeout
+        self.__local = threading.local()
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets "
+                         "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, stamp REAL NOT NULL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self.__local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.__path, timeout=self.__timeout, isolation_level=None)
+            self.__local.conn = conn
+        return conn
+
+    def reserve(self, buckets: list, tokens: float, max_wait: float = None):
+        """См. MemoryBucketBackend.reserve"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            waits = []
+            states = []
+            for key, rate, capacity in buckets:
+                row = conn.execute("SELECT tokens, stamp FROM buckets WHERE key = ?", (key,)).fetchone()
+                state = list(row) if row is not None else [float(capacity), now]
+                waits.append(_reserve(state, rate, capacity, tokens, now))
+                states.append(state)
+            wait = max(waits or [0.0])
+            if max_wait is not None and wait > max_wait:
+                conn.execute("ROLLBACK")
+                return None
+            conn.executemany("INSERT OR REPLACE INTO buckets (key, tokens, stamp) VALUES (?, ?, ?)",
+                             [(key, state[0], state[1]) for (key, _, _), state in zip(buckets, states)])
+            conn.execute("COMMIT")
+            return wait
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def drain(self, key: str, rate: float, delay: float):
+        """См. MemoryBucketBackend.drain"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute("SELECT tokens FROM buckets WHERE key = ?", (key,)).fetchone()
+            available = min(row[0] if row is not None else 0.0, -delay * rate)
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, stamp) VALUES (?, ?, ?)",
+                         (key, available, now))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+
+class RateLimiter:
+    """
+    Ограничитель частоты запросов на основе token bucket.
+
+    Для каждого апи логина заводится общее ведро (login_rate/login_burst) и отдельное ведро
+    на каждое семейство методов ("orders", "customers", "olaps", ...). Запрос проходит, только
+    когда маркер есть в обоих ведрах.
+
+    Пример:
+        limiter = RateLimiter(rate=5, burst=10, login_rate=20, families={"olaps": (0.5, 1)})
+        api = BizService(login, password, org)
+        api.rate_limiter = limiter
+
+    Один и тот же limiter можно присвоить нескольким сервисам - лимит будет общим.
+    Для согласования лимита между процессами передайте backend=SQLiteBucketBackend("/tmp/iiko.limits").
+    """
+
+    def __init__(self, rate: float, burst: float = None, login_rate: float = None, login_burst: float = None,
+                 families: dict = None, max_wait: float = None, backend=None):
+        """
+        :param rate: маркеров в секунду на семейство методов по умолчанию
+        :param burst: емкость ведра семейства (по умолчанию равна rate, но не меньше 1)
+        :param login_rate: маркеров в секунду на весь апи логин, None - без общего лимита
+        :param login_burst: емкость общего ведра апи логина
+        :param families: {"olaps": (rate, burst), ...} лимиты для отдельных семейств
+        :param max_wait: максимальное время ожидания маркера в секундах, None - ждать сколько нужно
+        :param backend: MemoryBucketBackend (по умолчанию) или SQLiteBucketBackend
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.login_rate = login_rate
+        self.login_burst = login_burst if login_burst is not None else max(1.0, login_rate or 0.0)
+        self.families = families if families is not None else {}
+        self.max_wait = max_wait
+        self.backend = backend if backend is not None else MemoryBucketBackend()
+
+    def _buckets(self, login: str, family: str) -> list:
+        rate, burst = self.families.get(family, (self.rate, self.burst))
+        buckets = [(f"{login}:{family}", rate, burst)]
+        if self.login_rate is not None:
+            buckets.append((f"{login}:*", self.login_rate, self.login_burst))
+        return buckets
+
+    def reserve(self, login: str, family: str, tokens: float = 1, max_wait: float = None):
+        """
+        Зарезервировать маркер без ожидания
+
+        :return: сколько секунд нужно подождать перед отправкой запроса,
+            None - если ожидание больше max_wait
+        """
+        if max_wait is None:
+            max_wait = self.max_wait
+        return self.backend.reserve(self._buckets(login, family), tokens, max_wait)
+
+    def acquire(self, login: str, family: str, tokens: float = 1, max_wait: float = None) -> bool:
+        """
+        Дождаться маркера в текущем потоке
+
+        :return: True если маркер получен, False если ожидание превысило max_wait
+        """
+        wait = self.reserve(login, family, tokens, max_wait)
+        if wait is None:
+            return False
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    async def acquire_async(self, login: str, family: str, tokens: float = 1, max_wait: float = None) -> bool:
+        """То же что acquire, но ожидание не блокирует цикл событий asyncio"""
+        wait = self.reserve(login, family, tokens, max_wait)
+        if wait is None:
+            return False
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return True
+
+    def penalize(self, login: str, family: str, delay: float):
+        """
+        Сообщить об ответе 429 от iiko: ведро семейства опустошается на delay секунд,
+        и все потоки, делящие лимит, притормаживают вместе.
+        """
+        rate, _ = self.families.get(family, (self.rate, self.burst))
+        self.backend.drain(f"{login}:{family}", rate, delay)
@@ -0,0 +1,178 @@
+import contextvars
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+INTERACTIVE = "interactive"
+NORMAL = "normal"
+BULK = "bulk"
+
+# Классы приоритета методов API по умолчанию (по имени метода из pyiikoapi.core.endpoint_name)
+DEFAULT_CLASSES = {
+    "orders/add": INTERACTIVE,
+    "orders/checkCreate": INTERACTIVE,
+    "orders/checkAddress": INTERACTIVE,
+    "orders/info": INTERACTIVE,
+    "orders/calculate_checkin_result": INTERACTIVE,
+    "orders/check_and_get_combo_price": INTERACTIVE,
+    "customers/get_customer_by_phone": INTERACTIVE,
+    "customers/get_customer_by_id": INTERACTIVE,
+    "customers/get_customer_by_card": INTERACTIVE,
+    "olaps": BULK,
+    "events": BULK,
+    "customers/get_customers_by_organization_and_by_period": BULK,
+    "organization/{id}/transactions_report": BULK,
+    "organization/{id}/corporate_nutrition_report": BULK,
+}
+
+_priority = contextvars.ContextVar("pyiikoapi_priority", default=None)
+
+
+@contextmanager
+def request_priority(priority: str):
+    """
+    Задать класс приоритета для всех запросов внутри блока (в текущем потоке или asyncio задаче)
+
+        with request_priority(BULK):
+            api.olap(report_request)
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class _Ticket:
+    __slots__ = ("priority", "granted")
+
+    def __init__(self, priority: str):
+        self.priority = priority
+        self.granted = False
+
+
+class RequestScheduler:
+    """
+    Планировщик запросов с классами приоритета (interactive, normal, bulk).
+
+    Ограничивает число одновременных запросов max_concurrency. Свободный слот отдается
+    очередям классов по взвешенной справедливой очереди (WFQ): при весах 8/3/1 интерактивные
+    запросы получают 8 слотов из 12 освободившихся, но bulk не голодает. reserved - слоты,
+    которые может занять только указанный класс, так что выгрузка олапов не может занять
+    все соединения и живые заказы не ждут в очереди.
+
+    Пример:
+        api.scheduler = RequestScheduler(max_concurrency=8, reserved={INTERACTIVE: 2}, limits={BULK: 4})
+    """
+
+    def __init__(self, max_concurrency: int = 8, weights: dict = None, reserved: dict = None,
+                 limits: dict = None, classes: dict = None):
+        """
+        :param max_concurrency: максимальное число одновременных запросов
+        :param weights: веса классов {INTERACTIVE: 8, NORMAL: 3, BULK: 1}, больше 0
+        :param reserved: число слотов, зарезервированных за классом {INTERACTIVE: 2}
+        :param limits: максимальное число слотов класса {BULK: 4}
+        :param classes: дополнение к DEFAULT_CLASSES {"имя или семейство метода": класс}
+        """
+        self.max_concurrency = max_concurrency
+        self.weights = {INTERACTIVE: 8, NORMAL: 3, BULK: 1}
+        if weights is not None:
+            self.weights.update(weights)
+        self.reserved = reserved if reserved is not None else {}
+        self.limits = limits if limits is not None else {}
+        self.classes = dict(DEFAULT_CLASSES)
+        if classes is not None:
+            self.classes.update(classes)
+        if sum(self.reserved.values()) > max_concurrency:
+            raise ValueError("Сумма зарезервированных слотов больше max_concurrency")
+        for priority, weight in self.weights.items():
+            if not weight > 0:
+                raise ValueError(f"Вес класса {priority} должен быть больше 0: {weight}")
+
+        self.__cond = threading.Condition()
+        self.__queues = {priority: deque() for priority in self.weights}
+        self.__in_flight = {priority: 0 for priority in self.weights}
+        self.__finish = {priority: 0.0 for priority in self.weights}
+        self.__virtual_time = 0.0
+
+    def classify(self, endpoint: str) -> str:
+        """Класс приоритета запроса: из request_priority, затем по имени метода, затем по семейству"""
+        priority = _priority.get()
+        if priority is not None:
+            return priority
+        priority = self.classes.get(endpoint)
+        if priority is None:
+            priority = self.classes.get(endpoint.split("/", 1)[0], NORMAL)
+        return priority
+
+    def in_flight(self) -> dict:
+        """Текущее число запросов в работе по классам"""
+        with self.__cond:
+            return dict(self.__in_flight)
+
+    def _can_start(self, priority: str) -> bool:
+        in_flight = self.__in_flight[priority]
+        limit = self.limits.get(priority)
+        if limit is not None and in_flight >= limit:
+            return False
+        if in_flight < self.reserved.get(priority, 0):
+            return True
+        shared = self.max_concurrency - sum(self.reserved.values())
+        shared_used = sum(max(0, count - self.reserved.get(name, 0)) for name, count in self.__in_flight.items())
+        return shared_used < shared
+
+    def _dispatch(self):
+        """Раздать свободные слоты ожидающим (вызывается под блокировкой)"""
+        granted = False
+        while True:
+            candidates = [priority for priority, queue in self.__queues.items()
+                          if queue and self._can_start(priority)]
+            if not candidates:
+                break
+            priority = min(candidates, key=lambda name: self.__finish[name] + 1.0 / self.weights[name])
+            self.__finish[priority] += 1.0 / self.weights[priority]
+            self.__virtual_time = self.__finish[priority]
+            ticket = self.__queues[priority].popleft()
+            ticket.granted = True
+            self.__in_flight[priority] += 1
+            granted = True
+        if granted:
+            self.__cond.notify_all()
+
+    def acquire(self, priority: str) -> _Ticket:
+        """Встать в очередь класса priority и дождаться слота"""
+        if priority not in self.__queues:
+            priority = NORMAL
+        ticket = _Ticket(priority)
+        with self.__cond:
+            queue = self.__queues[priority]
+            if not queue:
+                # класс после простоя не должен получать слоты "в долг" за время простоя
+                self.__finish[priority] = max(self.__finish[priority], self.__virtual_time)
+            queue.append(ticket)
+            self._dispatch()
+            try:
+                while not ticket.granted:
+                    self.__cond.wait()
+            except BaseException:
+                if ticket.granted:
+                    self.__in_flight[priority] -= 1
+                    self._dispatch()
+                else:
+                    queue.remove(ticket)
+                raise
+        return ticket
+
+    def release(self, ticket: _Ticket):
+        with self.__cond:
+            self.__in_flight[ticket.priority] -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority: str):
+        """Занять слот на время выполнения запроса"""
+        ticket = self.acquire(priority)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
@@ -0,0 +1,68 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+class MemoryTokenCache:
+    """
+    Кэш маркеров доступа в памяти процесса.
+    Любой объект с методами get(key) -> (token, issued_at) | None и set(key, token, issued_at)
+    может использоваться как token_cache; issued_at - unix time получения маркера.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__tokens = {}
+
+    def get(self, key: str):
+        with self.__lock:
+            return self.__tokens.get(key)
+
+    def set(self, key: str, token: str, issued_at: float):
+        with self.__lock:
+            self.__tokens[key] = (token, issued_at)
+
+
+class FileTokenCache:
+    """
+    Кэш маркеров доступа в JSON файле.
+    Удобен для serverless обработчиков: файл в /tmp переживает "теплые" запуски,
+    и новый экземпляр сервиса не ходит за маркером в сеть.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path if path is not None else os.path.join(tempfile.gettempdir(), "pyiikoapi-tokens.json")
+        self.__lock = threading.Lock()
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key: str):
+        with self.__lock:
+            value = self._read().get(key)
+        return tuple(value) if value else None
+
+    def set(self, key: str, token: str, issued_at: float):
+        with self.__lock:
+            tokens = self._read()
+            now = time.time()
+            tokens = {name: value for name, value in tokens.items() if now - value[1] < 3600}
+            tokens[key] = [token, issued_at]
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".pyiikoapi-tokens")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as file:
+                    json.dump(tokens, file)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
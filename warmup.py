@@ -0,0 +1,177 @@
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+
+
+class DnsCache:
+    """
+    Кэш DNS с временем жизни для хостов iiko.
+
+    Подменяет socket.getaddrinfo процесса (install/uninstall): для хостов из hosts адреса
+    хранятся ttl секунд, остальные имена разрешаются как обычно. Если DNS недоступен,
+    используется последний известный ответ (до stale секунд).
+
+    Пример:
+        dns = DnsCache(["iiko.biz", "card.iiko.co.uk"], ttl=300).install()
+    """
+
+    def __init__(self, hosts=None, ttl: float = 60.0, stale: float = 3600.0):
+        """
+        :param hosts: имена хостов для кэширования; None - все хосты
+        :param ttl: время жизни записи в секундах
+        :param stale: сколько секунд можно использовать просроченную запись при ошибке DNS
+        """
+        self.hosts = None if hosts is None else {host.lower() for host in hosts}
+        self.ttl = ttl
+        self.stale = stale
+        self.__lock = threading.Lock()
+        self.__entries = {}
+        self.__original = None
+
+    def add_url(self, url: str):
+        """Кэшировать хост из url сервиса (например api.base_url)"""
+        if self.hosts is not None:
+            self.hosts.add(urlsplit(url).hostname.lower())
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        resolve = self.__original or socket.getaddrinfo
+        if not isinstance(host, str) or (self.hosts is not None and host.lower() not in self.hosts):
+            return resolve(host, port, family, type, proto, flags)
+        key = (host.lower(), port, family, type, proto, flags)
+        now = time.monotonic()
+        with self.__lock:
+            entry = self.__entries.get(key)
+        if entry is not None and now - entry[0] < self.ttl:
+            return entry[1]
+        try:
+            addresses = resolve(host, port, family, type, proto, flags)
+        except socket.gaierror:
+            if entry is not None and now - entry[0] < self.ttl + self.stale:
+                return entry[1]
+            raise
+        with self.__lock:
+            self.__entries[key] = (now, addresses)
+        return addresses
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def install(self):
+        """Подменить socket.getaddrinfo (на весь процесс)"""
+        if self.__original is None:
+            self.__original = socket.getaddrinfo
+            socket.getaddrinfo = self.getaddrinfo
+        return self
+
+    def uninstall(self):
+        if self.__original is not None:
+            socket.getaddrinfo = self.__original
+            self.__original = None
+
+
+def _pool_size(session: requests.Session, url: str, connections: int):
+    """
+    Увеличить пул соединений адаптера, если в нем меньше connections.
+    Адаптер заменяется новым, поэтому соединения, уже открытые в старом пуле, закрываются - вызывайте
+    warmup до начала работы (повторные вызовы с тем же connections пул не трогают)
+    """
+    if not isinstance(session, requests.Session):
+        return
+    adapter = session.get_adapter(url)
+    if type(adapter) is requests.adapters.HTTPAdapter and getattr(adapter, "_pool_maxsize", connections) < connections:
+        prefix = f"{urlsplit(url).scheme}://{urlsplit(url).netloc}"
+        session.mount(prefix, requests.adapters.HTTPAdapter(pool_connections=adapter._pool_connections,
+                                                            pool_maxsize=connections,
+                                                            max_retries=adapter.max_retries,
+                                                            pool_block=adapter._pool_block))
+
+
+def warmup(api, connections: int = 4) -> dict:
+    """
+    Прогреть соединения сервиса: получить маркер доступа и открыть connections keep-alive
+    соединений параллельными запросами Auth.echo (DNS, TCP и TLS выполняются до первого
+    настоящего запроса). Соединения остаются в пуле сессии и переиспользуются, поэтому
+    TLS рукопожатие не повторяется, пока сервер их не закроет (держите их KeepAlive).
+
+    :param api: BizService или CardService
+    :param connections: число соединений; пул адаптера сессии увеличивается при необходимости
+        (открытые соединения при этом закрываются, см. _pool_size)
+    :return: {"connections", "ok", "errors", "elapsed"}
+    """
+    started = time.perf_counter()
+    _pool_size(api.session_s, api.base_url, connections)
+    api.check_token_time()
+    errors = []
+
+    def ping(_):
+        try:
+            return api.echo("warmup")
+        except Exception as err:
+            errors.append(str(err))
+            return False
+
+    with ThreadPoolExecutor(max_workers=connections, thread_name_prefix="pyiikoapi-warmup") as executor:
+        ok = sum(1 for result in executor.map(ping, range(connections)) if result)
+    return {"connections": connections, "ok": ok, "errors": errors, "elapsed": time.perf_counter() - started}
+
+
+class KeepAlive:
+    """
+    Фоновый ping (Auth.echo) соединений сервисов, чтобы они не закрывались в периоды простоя.
+    Маркер доступа при этом тоже обновляется заранее.
+
+    Пример:
+        keepalive = KeepAlive([biz_api, card_api], interval=30, connections=4)
+        keepalive.start()
+    """
+
+    def __init__(self, apis, interval: float = 30.0, connections: int = 1):
+        """
+        :param apis: сервисы (BizService, CardService)
+        :param interval: период ping в секундах (меньше keep-alive таймаута сервера)
+        :param connections: число параллельных ping на сервис (сколько соединений держать)
+        """
+        self.apis = list(apis)
+        self.interval = interval
+        self.connections = connections
+        self.errors = 0
+        self.last_error = None
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def ping(self) -> int:
+        """Один цикл ping всех сервисов; возвращает число успешных"""
+        ok = 0
+        for api in self.apis:
+            try:
+                result = warmup(api, self.connections)
+            except Exception as err:
+                # iiko недоступен (например не удалось обновить маркер) - поток продолжает работу
+                self.errors += 1
+                self.last_error = err
+                continue
+            ok += result["ok"]
+            self.errors += len(result["errors"])
+        return ok
+
+    def run(self):
+        while not self.__stop.wait(self.interval):
+            self.ping()
+
+    def start(self):
+        if self.__thread is not None:
+            return
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.run, name="pyiikoapi-keepalive", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None